@@ -42,6 +42,8 @@ G-F-S completamente parametrizable**:
         'data/ir_cron.xml',
         'views/backup_config_view.xml',
         'views/backup_log_view.xml',
+        'views/backup_log_daily_view.xml',
+        'views/backup_artifact_view.xml',
     ],
     'installable': True,
     'application': True,
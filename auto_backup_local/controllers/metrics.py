@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py –  Endpoint de métricas en formato Prometheus
+• GET /auto_backup_local/metrics
+• Exige ``Authorization: Bearer <token>`` con el token del parámetro
+  «auto_backup_local.metrics_token»; sin token configurado responde 403.
+• Con «auto_backup_local.metrics_allow_loopback» = True, la propia máquina
+  (127.0.0.1 / ::1) puede consultar sin token. Detrás de un proxy local no
+  debe activarse: todas las peticiones llegan desde 127.0.0.1.
+"""
+
+from __future__ import annotations
+
+import hmac
+import ipaddress
+
+from odoo import http  # type: ignore
+from odoo.http import request  # type: ignore
+
+from ..tools import metrics
+
+_TOKEN_PARAM = "auto_backup_local.metrics_token"
+_LOOPBACK_PARAM = "auto_backup_local.metrics_allow_loopback"
+
+
+class BackupMetrics(http.Controller):
+
+    @http.route("/auto_backup_local/metrics", type="http", auth="none", methods=["GET"], csrf=False)
+    def metrics(self):
+        if not request.db:
+            return request.not_found()
+        env = request.env(su=True)
+        params = env["ir.config_parameter"]
+        allow_loopback = params.get_param(_LOOPBACK_PARAM, "False").lower() in ("1", "true")
+        if not _authorized(params.get_param(_TOKEN_PARAM), allow_loopback):
+            return request.make_response("Forbidden\n", status=403)
+        body = metrics.render(env["backup.log"]._metric_families())
+        return request.make_response(body, headers=[("Content-Type", metrics.CONTENT_TYPE)])
+
+
+def _authorized(token: str | None, allow_loopback: bool) -> bool:
+    if token:
+        header = request.httprequest.headers.get("Authorization", "")
+        # en bytes: con str, compare_digest rechaza lo que no sea ASCII (TypeError)
+        if hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+    if not allow_loopback:
+        return False
+    try:
+        return ipaddress.ip_address(request.httprequest.remote_addr or "").is_loopback
+    except ValueError:
+        return False
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+job_runner.py –  Proceso que ejecuta un trabajo de la cola de backups
+• Lo lanza el cron «Ejecutar backups en cola» (``jobs._spawn_job``) como un
+  proceso aparte: el volcado no vive dentro del worker de cron, así que no lo
+  cortan ``limit_time_real_cron`` ni el reciclado del worker por memoria o
+  cantidad de peticiones.
+• Recibe las mismas opciones de ``odoo-bin`` que el servidor (archivo de
+  configuración, rutas de addons y de datos, log); los datos de conexión a
+  PostgreSQL llegan por la variable de entorno ``AUTO_BACKUP_JOB_DB`` para no
+  exponer la contraseña en la línea de comandos.
+• Uso: ``python job_runner.py --job <id> -d <base> [opciones de odoo-bin]``
+"""
+
+import json
+import os
+import sys
+import threading
+
+import odoo  # type: ignore
+from odoo import SUPERUSER_ID, api  # type: ignore
+from odoo.tools import config  # type: ignore
+
+ENV_DB = "AUTO_BACKUP_JOB_DB"
+
+
+def main(argv) -> int:
+    try:
+        pos = argv.index("--job")
+        job_id = int(argv[pos + 1])
+    except (ValueError, IndexError):
+        sys.stderr.write(__doc__)
+        return 2
+    del argv[pos:pos + 2]
+    config.parse_config(argv)
+    for key, value in json.loads(os.environ.pop(ENV_DB, "{}")).items():
+        config[key] = value
+    dbname = config["db_name"]
+    threading.current_thread().dbname = dbname
+    registry = odoo.modules.registry.Registry(dbname)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        env["backup.config"]._run_job_process(job_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,2 +1,5 @@
 from . import backup_log
-from .backup_config import settings, executor, retention
+from . import backup_log_daily
+from . import backup_artifact
+from .backup_config import settings, engine, dedup, destinations, catalog, executor, retention
+from . import backup_destination
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+backup_artifact.py
+==================
+
+Catálogo persistente de los backups presentes en disco. La retención trabaja
+sobre este catálogo (consultas indexadas) en lugar de recorrer la ruta de
+destino; una reconciliación periódica detecta archivos agregados o eliminados
+por fuera de Odoo.
+"""
+
+from odoo import fields, models, tools  # type: ignore
+
+
+class BackupArtifact(models.Model):
+    _name = "backup.artifact"
+    _description = "Backup catalogado"
+    _order = "backup_date desc"
+
+    # ---------------------------------------------------------------
+    #  Relaciones
+    # ---------------------------------------------------------------
+    config_id = fields.Many2one(
+        "backup.config",
+        string="Configuración",
+        ondelete="cascade",
+        required=True,
+        index=True,
+    )
+    parent_id = fields.Many2one(
+        "backup.artifact",
+        string="Depende de",
+        ondelete="set null",
+        index=True,
+        help="Backup anterior de la cadena incremental del filestore.",
+    )
+    base_id = fields.Many2one(
+        "backup.artifact",
+        string="Volcado completo",
+        ondelete="set null",
+        index=True,
+        help="Backup completo de la base sobre el que se aplica este volcado diferencial.",
+    )
+
+    # ---------------------------------------------------------------
+    #  Datos del archivo
+    # ---------------------------------------------------------------
+    name = fields.Char(string="Backup", required=True, index=True)
+    database = fields.Char(string="Base de datos", index=True)
+    path = fields.Char(string="Ruta", required=True, index=True)
+    backup_date = fields.Datetime(string="Fecha", required=True, index=True)
+    kind = fields.Selection(
+        [
+            ("zip", "ZIP"),
+            ("directory", "Directorio"),
+            ("chunks", "Índice deduplicado"),
+            ("snapshot", "Instantánea"),
+            ("volumes", "Volúmenes"),
+        ],
+        string="Tipo",
+        required=True,
+    )
+    size_bytes = fields.Float(string="Tamaño (bytes)", digits=(20, 0))
+    checksum = fields.Char(string="SHA-256")
+    codec = fields.Char(string="Compresión")
+
+    # ---------------------------------------------------------------
+    #  Verificación de integridad
+    # ---------------------------------------------------------------
+    verified_at = fields.Datetime(string="Verificado", index=True)
+    verify_state = fields.Selection(
+        [
+            ("ok", "Íntegro"),
+            ("corrupt", "Dañado"),
+            ("missing", "Faltante"),
+        ],
+        string="Integridad",
+        index=True,
+    )
+    verify_message = fields.Char(string="Detalle de la verificación")
+
+    _sql_constraints = [
+        ("path_uniq", "unique(path)", "Cada archivo de backup se cataloga una sola vez."),
+    ]
+
+    def init(self):
+        # la retención consulta siempre por configuración y fecha
+        tools.create_index(
+            self._cr, "backup_artifact_config_date_idx",
+            self._table, ["config_id", "backup_date"],
+        )
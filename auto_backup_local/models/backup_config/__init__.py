@@ -1,4 +1,12 @@
 # -*- coding: utf-8 -*-
 from . import settings            # crea backup.config
+from . import engine              # amplía backup.config
+from . import dedup               # amplía backup.config
+from . import destinations        # amplía backup.config
+from . import catalog             # amplía backup.config
 from . import executor            # amplía backup.config
+from . import jobs                # amplía backup.config
 from . import retention           # amplía backup.config
+from . import capacity            # amplía backup.config
+from . import verification        # amplía backup.config
+from . import history             # amplía backup.config
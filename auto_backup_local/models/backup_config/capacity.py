@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+capacity.py –  Espacio en disco: verificación previa y proyección
+• Antes de volcar se estima el tamaño de cada backup (base + filestore por
+  la relación tamaño/origen de los últimos backups) y se compara con el
+  espacio libre de cada sistema de archivos de destino. Si no alcanza, se
+  limpia primero (opcional) y, si aún no alcanza, no se empieza.
+• El formulario muestra el espacio que ocupará la retención configurada en
+  régimen, con el tamaño medio de los backups catalogados.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import math
+import os
+import shutil
+from typing import Dict, List, Optional
+
+from odoo import api, fields, models, _  # type: ignore
+from odoo.sql_db import db_connect  # type: ignore
+from odoo.tools import config, escape_psql  # type: ignore
+
+from .engine import _tree_size
+from .retention import retained_count
+
+_logger = logging.getLogger(__name__)
+
+_MB = 1024 ** 2
+# backups recientes de los que se toma la relación tamaño/origen (la mayor)
+_RATIO_SAMPLE = 20
+# backups catalogados por base con los que se promedia el tamaño proyectado
+_SIZE_SAMPLE = 10
+# días sobre los que se promedian las ejecuciones programadas
+_SCHEDULE_DAYS = 62
+
+
+class BackupConfigCapacity(models.Model):
+    _inherit = "backup.config"
+
+    preflight_check = fields.Boolean(
+        string="Verificar espacio antes de empezar", default=True,
+        help="Estima el tamaño del backup (base de datos, filestore y relación de "
+             "compresión de los últimos backups) y no empieza si el espacio libre "
+             "de algún destino no alcanza. Desactivada, el historial no registra "
+             "el tamaño de origen.",
+    )
+    preflight_cleanup = fields.Boolean(
+        string="Limpiar primero si falta espacio", default=True,
+        help="Si el espacio no alcanza, aplica la retención antes de volver a verificar.",
+    )
+    min_free_mb = fields.Integer(
+        string="Reserva libre (MB)", default=1024,
+        help="Espacio que debe quedar libre en cada destino después del backup.",
+    )
+    projected_usage_bytes = fields.Float(
+        string="Uso proyectado (bytes)", digits=(20, 0),
+        compute="_compute_projected_usage",
+    )
+    projected_usage = fields.Char(
+        string="Uso proyectado", compute="_compute_projected_usage",
+        help="Espacio que ocuparán en cada destino los backups que conserva la "
+             "retención, con el tamaño medio de los últimos backups catalogados. "
+             "Las cadenas incrementales y diferenciales pueden retener algunos más.",
+    )
+
+    # ───────────────────────────────────────────────────────────────
+    #  PROYECCIÓN
+    # ───────────────────────────────────────────────────────────────
+    @api.depends(
+        "cleanup_enabled", "daily_keep_for_days", "weekly_keep_for_weeks", "monthly_keep_for_months",
+        "schedule_mode", "run_hours", "run_time", "run_weekday", "interval_minutes", "cron_expression",
+        "backup_path",
+    )
+    def _compute_projected_usage(self):
+        for rec in self:
+            rec.projected_usage_bytes = 0
+            rec.projected_usage = _("Sin límite (limpieza desactivada)")
+            if not rec.cleanup_enabled:
+                continue
+            sizes = rec._recent_backup_sizes() if rec.id else {}
+            if not sizes:
+                rec.projected_usage = _("Sin backups catalogados")
+                continue
+            runs, peak = rec._runs_per_day()
+            kept = retained_count(
+                rec.daily_keep_for_days, rec.weekly_keep_for_weeks, rec.monthly_keep_for_months, runs,
+            )
+            # entre dos limpiezas se acumulan los backups del día
+            total = sum(sizes.values()) * (kept + peak)
+            rec.projected_usage_bytes = total
+            rec.projected_usage = _(
+                "≈ %(size)s GB por destino (%(kept)s backups por base, %(dbs)s bases)"
+            ) % {"size": round(total / 1024 ** 3, 2), "kept": kept + peak, "dbs": len(sizes)}
+
+    def _recent_backup_sizes(self) -> Dict[str, float]:
+        """Tamaño medio en disco de los últimos backups de cada base en la ruta principal."""
+        self.env["backup.artifact"].flush_model()
+        self.env.cr.execute("""
+            SELECT database, AVG(size_bytes)
+              FROM (
+                SELECT database, size_bytes,
+                       row_number() OVER (PARTITION BY database ORDER BY backup_date DESC) AS n
+                  FROM backup_artifact
+                 WHERE config_id = %s AND path LIKE %s ESCAPE '\\'
+              ) t
+             WHERE n <= %s
+             GROUP BY database
+        """, (self.id, escape_psql(os.path.join(self.backup_path or "", "")) + "%", _SIZE_SAMPLE))
+        return {database or "": size or 0 for database, size in self.env.cr.fetchall()}
+
+    def _runs_per_day(self):
+        """``(promedio, máximo)`` de ejecuciones diarias según la programación."""
+        if self.schedule_mode == "interval":
+            runs = math.ceil(1440 / max(self.interval_minutes, 1))
+            return runs, runs
+        try:
+            expr = self._schedule_expression()
+        except ValueError:
+            return 1, 1
+        # por día (horas × minutos) y no ocurrencia por ocurrencia: «* * * * *»
+        # serían ~89.000 pasos en cada lectura del formulario
+        today = datetime.date.today()
+        per_day = [expr.runs_on(today + datetime.timedelta(days=n)) for n in range(_SCHEDULE_DAYS)]
+        if not any(per_day):
+            return 1, 1
+        return sum(per_day) / _SCHEDULE_DAYS, max(per_day)
+
+    # ───────────────────────────────────────────────────────────────
+    #  VERIFICACIÓN PREVIA
+    # ───────────────────────────────────────────────────────────────
+    def _preflight_check(self, databases: List[str]) -> Optional[Dict[str, int]]:
+        """
+        Tamaño de origen (base + filestore) de cada base, o None si no hay
+        espacio para respaldarlas (el motivo queda en el historial). Con la
+        verificación desactivada no se mide nada y retorna ``{}``.
+        """
+        if not self.preflight_check:
+            return {}       # medir el origen recorre todo el filestore
+        sources = {name: _source_bytes(name) for name in databases}
+        short = self._space_shortfall(sources)
+        if short and self.preflight_cleanup and self.cleanup_enabled:
+            _logger.info("Espacio insuficiente en %s: se limpia antes del backup", short[0])
+            self.cleanup_backups()
+            short = self._space_shortfall(sources)
+        if short:
+            path, need, free = short
+            self._log_run("error", _(
+                "Espacio insuficiente en %(path)s: se estiman %(need)s MB y hay %(free)s MB "
+                "disponibles. No se inició el backup."
+            ) % {"path": path, "need": round(need / _MB), "free": round(free / _MB)})
+            return None
+        return sources
+
+    def _space_shortfall(self, sources: Dict[str, int]):
+        """
+        ``(ruta, necesarios, disponibles)`` del primer sistema de archivos de
+        destino sin espacio suficiente, o None. Los destinos que comparten
+        sistema de archivos suman sus necesidades.
+        """
+        estimates = {name: self._estimate_backup(name, size) for name, size in sources.items()}
+        per_backup = sum(est for est, _spool in estimates.values())
+        needs = {}
+        for i, root in enumerate(self._backup_roots()):
+            if not os.path.isdir(root):
+                continue        # destino sin montar: su copia fallará sola
+            dev = os.stat(root).st_dev
+            path, need = needs.get(dev, (root, 0))
+            # el SQL temporal del ZIP en paralelo se escribe en la ruta principal
+            spool = sum(s for _est, s in estimates.values()) if i == 0 else 0
+            needs[dev] = (path, need + per_backup + spool)
+        reserve = max(self.min_free_mb, 0) * _MB
+        for path, need in needs.values():
+            free = shutil.disk_usage(path).free - reserve
+            if need > free:
+                return path, need, max(free, 0)
+        return None
+
+    def _estimate_backup(self, db_name: str, source: int):
+        """
+        ``(bytes_del_backup, bytes_temporales)`` de ``db_name``. Se usa la
+        mayor relación tamaño/origen de los últimos backups (sin historial,
+        el origen completo).
+        """
+        logs = self.env["backup.log"].sudo().search([
+            ("config_id", "=", self.id),
+            ("database", "=", db_name),
+            ("status", "=", "success"),
+            ("source_bytes", ">", 0),
+        ], order="create_date desc", limit=_RATIO_SAMPLE)
+        ratio = max((log.size_bytes / log.source_bytes for log in logs), default=1.0)
+        spool = 0
+        # cifrando, el SQL temporal va al directorio temporal del servidor
+        if self.backup_format == "zip" and self.parallel_filestore and not self.encrypt_backups:
+            spool = max(logs.mapped("dump_bytes"), default=0) or source
+        if self.backup_format == "zip" and self.volume_size_mb:
+            # los dos volúmenes que se alternan mientras se copian a los destinos
+            spool += 2 * self.volume_size_mb * _MB
+        return int(source * ratio), int(spool)
+
+
+def _source_bytes(db_name: str) -> int:
+    """Tamaño de la base en PostgreSQL más el de su filestore."""
+    with db_connect(db_name).cursor() as cr:
+        cr.execute("SELECT pg_database_size(current_database())")
+        size = cr.fetchone()[0]
+    return size + _tree_size(config.filestore(db_name))
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+catalog.py –  Alta de backups en «backup.artifact» y reconciliación con el disco
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Optional
+
+from odoo import api, fields, models  # type: ignore
+
+from ...tools import compression, encryption, table_diff, volumes
+
+_logger = logging.getLogger(__name__)
+
+# .zip = archivo único · .d = directorio (pg_dump -Fd + filestore.tar)
+# .idx = índice de un backup deduplicado (bloques en .chunks/)
+# .snap = instantánea (pg_dump -Fd + filestore/ enlazado a la anterior)
+# .vol = ZIP cortado en volúmenes (directorio con VOLUMES.json)
+# .gz / .zst / .lz4 = códec aplicado sobre el ZIP · .enc = ZIP cifrado
+_BACKUP_RGX = re.compile(
+    r"(db_backup_(.*?)_(\d{4})_(\d{2})_(\d{2})_(\d{2})(\d{2})(\d{2}))"
+    r"\.(zip|d|idx|snap|vol)(?:\.(?:gz|zst|lz4))?(?:\.enc)?$"
+)
+# archivos auxiliares que se eliminan junto con su backup
+_SIDECARS = (".increment.json", ".sha256.json")
+_KIND_BY_EXT = {"zip": "zip", "d": "directory", "idx": "chunks", "snap": "snapshot", "vol": "volumes"}
+# backups a medio escribir (.part) abandonados por un proceso que murió
+_STALE_PART_SECONDS = 86400
+
+
+def parse_backup_name(fname: str):
+    """
+    ``(stem, base, datetime, kind)`` de un nombre de backup, o None si no lo
+    es.
+    """
+    m = _BACKUP_RGX.match(fname)
+    if not m:
+        return None
+    stem, database, *parts, ext = m.groups()
+    try:
+        stamp = datetime.datetime(*map(int, parts))
+    except ValueError:
+        return None
+    return stem, database, stamp, _KIND_BY_EXT[ext]
+
+
+def remove_backup_files(path: str) -> None:
+    """Elimina un backup (archivo o directorio) y sus archivos auxiliares."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    for sidecar in _SIDECARS:
+        if os.path.isfile(path + sidecar):
+            os.remove(path + sidecar)
+
+
+class BackupConfigCatalog(models.Model):
+    _inherit = "backup.config"
+
+    artifact_ids = fields.One2many("backup.artifact", "config_id", string="Backups en disco")
+    last_reconcile_date = fields.Datetime(string="Última reconciliación", readonly=True)
+
+    # ───────────────────────────────────────────────────────────────
+    #  ALTA
+    # ───────────────────────────────────────────────────────────────
+    def _register_artifact(self, path: str, size: int, checksum: Optional[str] = None):
+        """Cataloga un backup recién escrito por ``execute_backup``."""
+        parsed = parse_backup_name(os.path.basename(path))
+        if not parsed:
+            return self.env["backup.artifact"]
+        stem, database, stamp, kind = parsed
+        return self.env["backup.artifact"].sudo().create({
+            "config_id": self.id,
+            "name": stem,
+            "database": database,
+            "path": path,
+            "backup_date": stamp,
+            "kind": kind,
+            "size_bytes": size,
+            "checksum": checksum,
+            "codec": self._effective_codec(),
+            "parent_id": self._artifact_parent(path).id,
+            "base_id": self._artifact_base(path).id,
+        })
+
+    def _artifact_parent(self, path: str):
+        """Backup del que depende ``path`` en la cadena incremental, si lo hay."""
+        meta = self._read_increment_meta(path)
+        if not meta or meta.get("full") or not meta.get("parent"):
+            return self.env["backup.artifact"]
+        return self._sibling_artifact(path, meta["parent"])
+
+    def _artifact_base(self, path: str):
+        """Volcado completo sobre el que se aplica el diferencial ``path``, si lo es."""
+        meta = table_diff.load_json(os.path.join(path, table_diff.DIFF_FILE)) if os.path.isdir(path) else None
+        if not meta or not meta.get("base"):
+            return self.env["backup.artifact"]
+        return self._sibling_artifact(path, meta["base"])
+
+    def _sibling_artifact(self, path: str, stem: str):
+        # cada destino tiene su propia copia de la cadena
+        directory = os.path.dirname(path)
+        candidates = self.env["backup.artifact"].sudo().search([
+            ("config_id", "=", self.id),
+            ("name", "=", stem),
+        ])
+        return candidates.filtered(lambda a: os.path.dirname(a.path) == directory)[:1]
+
+    # ───────────────────────────────────────────────────────────────
+    #  RECONCILIACIÓN CON EL DISCO
+    # ───────────────────────────────────────────────────────────────
+    def reconcile_artifacts(self):
+        """
+        Recorre ``backup_path`` y los destinos adicionales una vez y
+        sincroniza el catálogo: da de alta los backups copiados a mano y
+        borra los registros de archivos que ya no existen.
+        """
+        Artifact = self.env["backup.artifact"].sudo()
+        for rec in self:
+            known, found = {}, {}
+            for base_dir in rec._backup_roots():
+                if not os.path.isdir(base_dir):
+                    # destino sin montar: no dar de baja sus backups
+                    _logger.warning("Destino %s no disponible: se omite", base_dir)
+                    continue
+                known.update(_known_artifacts(Artifact, base_dir))
+                found.update(_scan_backups(base_dir))
+
+            missing = [a.id for path, a in known.items() if path not in found]
+            Artifact.browse(missing).unlink()
+
+            new_paths = sorted((p for p in found if p not in known), key=lambda p: found[p][2])
+            for path in new_paths:
+                stem, database, stamp, kind = found[path]
+                Artifact.create({
+                    "config_id": rec.id,
+                    "name": stem,
+                    "database": database,
+                    "path": path,
+                    "backup_date": stamp,
+                    "kind": kind,
+                    "size_bytes": _disk_size(path),
+                    "codec": rec._codec_from_path(path, kind),
+                    "parent_id": rec._artifact_parent(path).id,
+                    "base_id": rec._artifact_base(path).id,
+                })
+
+            rec.last_reconcile_date = fields.Datetime.now()
+            _logger.info(
+                "Catálogo %s: %s altas, %s bajas", rec.name, len(new_paths), len(missing),
+            )
+
+    @staticmethod
+    def _codec_from_path(path: str, kind: str) -> str:
+        if kind == "chunks":
+            return "zlib"
+        if kind == "volumes":
+            # el códec va en el nombre del archivo cortado, no en el del directorio
+            path = (volumes.load_manifest(path) or {}).get("name", "")
+            kind = "zip"
+        codec = compression.codec_from_path(encryption.strip_suffix(path))
+        return "deflate" if codec == "none" and kind == "zip" else codec
+
+    @api.model
+    def cron_reconcile_artifacts(self):
+        self.search([("backup_enabled", "=", True)]).reconcile_artifacts()
+
+
+def _known_artifacts(Artifact, base_dir: str) -> dict:
+    prefix = base_dir.rstrip(os.sep) + os.sep
+    return {
+        a.path: a
+        for a in Artifact.search([("path", "=like", prefix + "%")])
+        if a.path.startswith(prefix)     # «_» es comodín en LIKE
+    }
+
+
+def _scan_backups(base_dir: str) -> dict:
+    """Backups presentes bajo ``base_dir`` (ruta → ``parse_backup_name``)."""
+    found = {}
+    for root, dirs, files in os.walk(base_dir):
+        backup_dirs = [d for d in dirs if parse_backup_name(d)]
+        # no descender dentro de un backup en formato directorio
+        # ni en directorios ocultos (repositorio de bloques)
+        dirs[:] = [d for d in dirs if d not in backup_dirs and not d.startswith(".")]
+        for fname in files + backup_dirs:
+            parsed = parse_backup_name(fname)
+            if parsed:
+                found[os.path.join(root, fname)] = parsed
+        for fname in files + dirs:
+            if fname.endswith(".part") and parse_backup_name(fname[:-5]):
+                _remove_stale_part(os.path.join(root, fname))
+    return found
+
+
+def _remove_stale_part(path: str) -> None:
+    try:
+        if time.time() - os.path.getmtime(path) < _STALE_PART_SECONDS:
+            return
+        _logger.info("Eliminando backup incompleto abandonado: %s", path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except OSError as exc:
+        _logger.warning("No se pudo eliminar %s: %s", path, exc)
+
+
+def _disk_size(path: str) -> int:
+    """Bytes propios del backup: en una instantánea no cuentan los archivos compartidos."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for fname in files:
+            st = os.stat(os.path.join(root, fname))
+            if st.st_nlink == 1:
+                total += st.st_size
+    return total
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+dedup.py –  Destino deduplicado: repositorio de bloques + índices por backup
+• El ZIP se genera sin comprimir para que los bloques se repitan entre backups.
+• Cada backup queda como ``db_backup_*.idx`` y los bloques en ``.chunks/``.
+• La limpieza borra índices y luego recolecta los bloques sin referencia
+  (los índices vigentes salen del catálogo «backup.artifact»).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import zipfile
+
+from odoo import api, models, _  # type: ignore
+from odoo.exceptions import UserError  # type: ignore
+
+from ...tools import chunk_store, metrics
+
+_logger = logging.getLogger(__name__)
+
+_REPO_DIR = ".chunks"
+_IDX_SUFFIX = ".idx"
+
+
+class BackupConfigDedup(models.Model):
+    _inherit = "backup.config"
+
+    # ───────────────────────────────────────────────────────────────
+    #  ESCRITURA
+    # ───────────────────────────────────────────────────────────────
+    def _chunk_store(self, base_dir: str | None = None) -> chunk_store.ChunkStore:
+        return chunk_store.ChunkStore(
+            os.path.join(base_dir or self.backup_path, _REPO_DIR), throttle=self._throttle(),
+        )
+
+    def _dump_to_chunks(self, db_name: str, idx_path: str):
+        """
+        Genera el ZIP (sin comprimir) directamente sobre el repositorio de
+        bloques y escribe el índice en ``idx_path`` (escritura atómica).
+        Retorna ``(tamaño_lógico, sha256_del_flujo)``.
+        """
+        stem = os.path.basename(idx_path)[:-len(_IDX_SUFFIX)]
+        clock = metrics.current()
+        with clock.phase("write"):
+            # los bloques se comprimen con zlib al guardarse: cuenta como escritura
+            with self._chunk_store().writer() as writer:
+                sink = metrics.TimedWriter(writer, "write")
+                plan, archived = self._write_zip(db_name, sink, stem, zipfile.ZIP_STORED)
+
+            extra = {"increment": plan.meta(stem)} if plan else {}
+            index = writer.index(**extra)
+            chunk_store.save_index(idx_path, index)
+        if plan:
+            self._save_filestore_index(db_name, plan, stem, archived)
+
+        _logger.info(
+            "Backup %s deduplicado: %.1f MB lógicos, %.1f MB nuevos en %s bloques",
+            db_name, writer.bytes_written / 1024 ** 2,
+            writer.bytes_stored / 1024 ** 2, len(writer.chunks),
+        )
+        return writer.bytes_written, index["sha256"]
+
+    # ───────────────────────────────────────────────────────────────
+    #  LECTURA
+    # ───────────────────────────────────────────────────────────────
+    def _materialize_chunks(self, idx_path: str, out) -> int:
+        index = chunk_store.load_index(idx_path)
+        if index is None:
+            raise UserError(_("Índice de backup ilegible: %s") % idx_path)
+        store = self._chunk_store(os.path.dirname(idx_path))
+        return store.materialize(index, out)
+
+    @api.model
+    def materialize_chunk_backup(self, idx_path: str, zip_path: str) -> None:
+        """
+        Reconstruye el ZIP de un backup deduplicado, restaurable luego desde
+        el gestor de bases de Odoo. Ejemplo desde ``odoo shell``::
+
+            env["backup.config"].materialize_chunk_backup(
+                "/mnt/backups/db_backup_prod_2024_01_31_030000.idx", "/tmp/prod.zip")
+        """
+        with open(zip_path, "wb") as out:
+            self._materialize_chunks(idx_path, out)
+
+    # ───────────────────────────────────────────────────────────────
+    #  RECOLECCIÓN DE BLOQUES HUÉRFANOS
+    # ───────────────────────────────────────────────────────────────
+    def _gc_chunk_store(self, base_dir: str | None = None) -> None:
+        """
+        Elimina los bloques que ya no referencia ningún índice de la ruta
+        (``backup_path`` o un destino adicional). Los índices vigentes se
+        toman del catálogo, no de un recorrido del disco.
+        """
+        base_dir = base_dir or self.backup_path
+        if not self.last_reconcile_date:
+            # sin reconciliar, el catálogo podría no conocer índices copiados a mano
+            _logger.warning("GC de bloques omitido en %s: catálogo sin reconciliar", base_dir)
+            return
+        prefix = base_dir.rstrip(os.sep) + os.sep
+        indexes = [
+            art.path
+            for art in self.env["backup.artifact"].sudo().search([
+                ("kind", "=", "chunks"),
+                ("path", "=like", prefix + "%"),
+            ])
+            if art.path.startswith(prefix)
+        ]
+        try:
+            referenced = chunk_store.referenced_chunks(indexes)
+        except ValueError as exc:
+            _logger.warning("GC de bloques omitido en %s: %s", base_dir, exc)
+            return
+        removed, freed = self._chunk_store(base_dir).gc(referenced)
+        _logger.info(
+            "GC de bloques en %s: %s eliminados (%.1f MB liberados)",
+            base_dir, removed, freed / 1024 ** 2,
+        )
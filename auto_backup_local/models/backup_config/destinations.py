@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+destinations.py –  Un solo volcado, varias copias
+• ZIP: el flujo se reparte entre todos los destinos mientras se genera
+  (``streams.FanOutWriter``).
+• Directorio y deduplicado: se vuelca en la ruta principal y se copia en
+  paralelo a los demás destinos, verificando cada copia.
+• Cada destino tiene su resultado (bytes, SHA-256 o error) y no frena a los
+  demás.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import shutil
+from typing import List, Tuple
+
+from odoo import fields, models  # type: ignore
+
+from ...tools import chunk_store, snapshot, streams
+from .catalog import parse_backup_name
+from .engine import _FILESTORE_DIR, _SUMS_FILE, _previous_snapshot, _tree_size
+
+_logger = logging.getLogger(__name__)
+
+
+class BackupConfigDestinations(models.Model):
+    _inherit = "backup.config"
+
+    destination_ids = fields.One2many(
+        "backup.destination", "config_id",
+        string="Destinos adicionales",
+        help="Otras rutas (otro disco, un montaje de red) que reciben una copia de "
+             "cada backup. El volcado se hace una sola vez.",
+    )
+
+    def _backup_roots(self) -> List[str]:
+        """Ruta principal seguida de los destinos adicionales activos."""
+        return [self.backup_path] + self.destination_ids.filtered("enabled").mapped("path")
+
+    def _replicate_backup(self, source: str, targets: List[str]) -> List[dict]:
+        """
+        Copia en paralelo un backup ya escrito (directorio o índice
+        deduplicado) a ``targets``. Retorna un resultado por destino.
+        """
+        if not targets:
+            return []
+        # lo que depende del ORM se resuelve antes de lanzar los hilos
+        throttle = self._throttle()
+        if os.path.isdir(source):
+            # instantáneas: cada destino enlaza contra su propia instantánea anterior
+            db_name = parse_backup_name(os.path.basename(source))[1]
+            jobs = [
+                (_copy_directory, (source, target, throttle, _previous_snapshot(os.path.dirname(target), db_name)))
+                for target in targets
+            ]
+        else:
+            store = self._chunk_store(os.path.dirname(source))
+            jobs = [
+                (_copy_chunk_backup, (source, target, store, self._chunk_store(os.path.dirname(target))))
+                for target in targets
+            ]
+        with concurrent.futures.ThreadPoolExecutor(len(jobs), thread_name_prefix="backup-dest") as pool:
+            futures = [pool.submit(func, *args) for func, args in jobs]
+
+        results = []
+        for target, future in zip(targets, futures):
+            res = {"path": target, "written": 0, "checksum": None, "error": None}
+            try:
+                res["written"], res["checksum"] = future.result()
+            except Exception as exc:
+                _logger.warning("No se pudo copiar %s a %s: %s", source, target, exc)
+                res["error"] = str(exc)
+                self._discard_partial(target)
+            results.append(res)
+        return results
+
+
+def _copy_directory(source: str, target: str, throttle=None, previous=None) -> Tuple[int, str]:
+    """
+    Copia un backup en directorio hasheando cada archivo al escribirlo y lo
+    compara con su ``SHA256SUMS``. El ``filestore/`` de una instantánea se
+    enlaza contra ``previous``. Retorna ``(bytes_nuevos, sha256_de_SHA256SUMS)``.
+    """
+    sums = {}
+    linked = 0
+    with streams.atomic_directory(target) as work:
+        for root, dirs, files in os.walk(source):
+            if root == source and _FILESTORE_DIR in dirs:
+                dirs.remove(_FILESTORE_DIR)
+                linked = snapshot.link_tree(
+                    os.path.join(source, _FILESTORE_DIR), os.path.join(work, _FILESTORE_DIR),
+                    previous and os.path.join(previous, _FILESTORE_DIR), throttle,
+                )["linked_bytes"]
+            rel_root = os.path.relpath(root, source)
+            os.makedirs(os.path.join(work, rel_root), exist_ok=True)
+            for fname in files:
+                rel = os.path.normpath(os.path.join(rel_root, fname))
+                with open(os.path.join(root, fname), "rb") as src, \
+                        open(os.path.join(work, rel), "wb") as dst:
+                    hashed = streams.HashingWriter(dst)
+                    with streams.ChunkedWriter(hashed, throttle=throttle) as writer:
+                        shutil.copyfileobj(src, writer, streams.DEFAULT_CHUNK_SIZE)
+                sums[rel] = hashed.hexdigest()
+
+        with open(os.path.join(work, _SUMS_FILE), "rb") as fh:
+            listing = fh.read()
+        for line in listing.decode().splitlines():
+            digest, _sep, rel = line.partition("  ")
+            if sums.get(os.path.normpath(rel)) != digest:
+                raise ValueError(f"La copia de {rel} no coincide con {_SUMS_FILE}")
+    return _tree_size(target) - linked, hashlib.sha256(listing).hexdigest()
+
+
+def _copy_chunk_backup(idx_path: str, target: str, store: chunk_store.ChunkStore,
+                       target_store: chunk_store.ChunkStore) -> Tuple[int, str]:
+    """Copia los bloques que falten en el repositorio del destino y luego el índice."""
+    index = chunk_store.load_index(idx_path)
+    if index is None:
+        raise ValueError(f"Índice ilegible: {idx_path}")
+    copied = store.replicate(index, target_store)
+    chunk_store.save_index(target, index)
+    _logger.info("Índice %s copiado: %.1f MB de bloques nuevos", target, copied / 1024 ** 2)
+    return index["size"], index["sha256"]
@@ -0,0 +1,1060 @@
+# -*- coding: utf-8 -*-
+"""
+engine.py –  Motores de volcado y restauración
+• ZIP en proceso (dump_db en bloques, sin HTTP)
+• Directorio paralelo (pg_dump -Fd -j N + filestore.tar) y su restauración
+• Filestore incremental guiado por un índice persistente
+• Volcado diferencial por tabla (estadísticas de PostgreSQL) y su restauración
+• Instantáneas: directorio con el filestore enlazado a la anterior (--link-dest)
+• Compresión en flujo con códec configurable (gzip, zstd multihilo, lz4)
+• Cifrado en flujo (AES-256-GCM por bloques) y descifrado al restaurar
+• Escritura atómica (.part + fsync + rename) con SHA-256 calculado al vuelo
+• Un solo volcado repartido entre la ruta principal y los destinos adicionales
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import psycopg2  # type: ignore
+
+from odoo import api, models, _  # type: ignore
+from odoo.exceptions import UserError  # type: ignore
+from odoo.service import db  # type: ignore
+from odoo.sql_db import db_connect  # type: ignore
+from odoo.tools import config  # type: ignore
+from odoo.tools.misc import exec_pg_environ, find_pg_tool  # type: ignore
+
+from ...tools import (
+    chunk_store, compression, encryption, filestore_index, metrics, snapshot, streams, table_diff, volumes,
+)
+from .catalog import parse_backup_name
+
+_logger = logging.getLogger(__name__)
+
+_DIR_SUFFIX = ".d"
+_SNAP_SUFFIX = ".snap"
+_DUMP_DIR = "dump"
+_FILESTORE_TAR = "filestore.tar"
+_FILESTORE_DIR = "filestore"
+_MANIFEST = "manifest.json"
+_IDX_SUFFIX = ".idx"
+_VOL_SUFFIX = ".vol"
+_SUFFIXES = (".zip", _DIR_SUFFIX, _IDX_SUFFIX, _SNAP_SUFFIX, _VOL_SUFFIX)
+# copia de los metadatos de cadena junto a un backup de archivo único, para
+# leerlos sin abrir (ni descomprimir) el ZIP
+_META_SIDECAR = ".increment.json"
+# SHA-256 y tamaño del backup, para verificarlo sin abrirlo
+_CHECKSUM_SIDECAR = ".sha256.json"
+_SUMS_FILE = "SHA256SUMS"
+# clases de ionice: 2 = best-effort (nivel 7, el más bajo), 3 = idle
+_IONICE_ARGS = {"low": ["-c", "2", "-n", "7"], "idle": ["-c", "3"]}
+# un destino que no acepta datos en este plazo se descarta (los demás siguen)
+_STALL_SECONDS = 300
+# demora con la que PostgreSQL publica las estadísticas por tabla (los procesos
+# inactivos las vuelcan cada 10 s): antes de este plazo pueden faltar cambios
+# confirmados justo antes del snapshot
+_STATS_SETTLE = 15
+
+# límites de caudal compartidos por los hilos de una misma configuración
+_THROTTLES: dict = {}
+_THROTTLES_LOCK = threading.Lock()
+
+
+class BackupConfigEngine(models.Model):
+    _inherit = "backup.config"
+
+    # ───────────────────────────────────────────────────────────────
+    #  DESPACHO SEGÚN FORMATO
+    # ───────────────────────────────────────────────────────────────
+    def _backup_suffix(self) -> str:
+        if self.backup_format == "directory":
+            return _DIR_SUFFIX
+        if self.backup_format == "snapshot":
+            return _SNAP_SUFFIX
+        if self.storage_mode == "chunks":
+            return _IDX_SUFFIX
+        if self.volume_size_mb:
+            return _VOL_SUFFIX
+        return self._zip_suffix()
+
+    def _zip_suffix(self) -> str:
+        """Extensión de un ZIP: códec y cifrado (p. ej. ``.zip.zst.enc``)."""
+        return ".zip" + self._codec_suffix() + (encryption.SUFFIX if self.encrypt_backups else "")
+
+    def _codec_suffix(self) -> str:
+        """Extensión del códec: «deflate» es la compresión propia del ZIP."""
+        if self.compression_codec == "deflate":
+            return ""
+        return compression.SUFFIXES[self.compression_codec]
+
+    def _effective_codec(self) -> str:
+        """Códec que se registra en backup.log."""
+        if self.backup_format == "snapshot":
+            return "none"
+        return "zlib" if self.storage_mode == "chunks" else self.compression_codec
+
+    def _compressed(self, sink):
+        """
+        Envuelve ``sink`` con el compresor configurado. El resultado no admite
+        ``seek`` y su ``tell`` cuenta bytes sin comprimir, como espera zipfile.
+        """
+        codec = "none" if self.compression_codec == "deflate" else self.compression_codec
+        return streams.CountingWriter(metrics.TimedWriter(compression.open_writer(
+            codec, sink, self.compression_level, self.compression_threads,
+        ), "compress"))
+
+    @contextlib.contextmanager
+    def _encrypted(self, sink):
+        """
+        Con ``encrypt_backups``, etapa que cifra lo que llega a ``sink``; si
+        no, ``sink`` tal cual. Se cierra después del último bloque del ZIP.
+        """
+        if not self.encrypt_backups:
+            yield sink
+            return
+        enc = encryption.EncryptingWriter(sink, self._archive_secret())
+        try:
+            yield metrics.TimedWriter(enc, "encrypt")
+        except BaseException:
+            enc.abort()
+            raise
+        with metrics.current().phase("encrypt"):
+            enc.close()
+
+    # ───────────────────────────────────────────────────────────────
+    #  TIEMPO LÍMITE POR BASE (contexto «backup_deadline», time.monotonic)
+    # ───────────────────────────────────────────────────────────────
+    def _remaining_seconds(self) -> Optional[float]:
+        deadline = self.env.context.get("backup_deadline")
+        return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+    def _check_deadline(self) -> None:
+        remaining = self._remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            raise UserError(_("Se superó el tiempo límite del backup."))
+
+    def _progress(self, label: str):
+        """Callback de avance: registra en el log y corta al vencer el plazo."""
+        report = streams.progress_logger(label)
+
+        def _callback(total: int) -> None:
+            report(total)
+            self._check_deadline()
+            self._report_job(label, total)
+
+        return _callback
+
+    # ───────────────────────────────────────────────────────────────
+    #  CONSUMO DE RECURSOS (caudal de escritura y prioridades)
+    # ───────────────────────────────────────────────────────────────
+    def _throttle(self) -> Optional[streams.Throttle]:
+        """Límite de escritura de la configuración, común a todas sus bases."""
+        if not self.throttle_mbps:
+            return None
+        rate = self.throttle_mbps * 1024 ** 2
+        with _THROTTLES_LOCK:
+            throttle = _THROTTLES.get(self.id)
+            if throttle is None or throttle.rate != rate:
+                throttle = _THROTTLES[self.id] = streams.Throttle(rate)
+        return throttle
+
+    def _priority_prefix(self) -> List[str]:
+        """``nice`` / ``ionice`` a anteponer a pg_dump según la configuración."""
+        prefix = []
+        if self.cpu_nice:
+            nice = shutil.which("nice")
+            if nice:
+                prefix += [nice, "-n", str(self.cpu_nice)]
+        if self.io_priority in _IONICE_ARGS:
+            ionice = shutil.which("ionice")
+            if ionice:
+                prefix += [ionice, *_IONICE_ARGS[self.io_priority]]
+            else:
+                _logger.warning("ionice no está disponible: se ignora la prioridad de E/S")
+        return prefix
+
+    def _lower_thread_priority(self) -> None:
+        """
+        Baja la prioridad de CPU del hilo actual (compresión y archivado del
+        filestore). En Linux ``setpriority`` sobre el id nativo afecta sólo a
+        este hilo y a los que cree, como los hilos de zstd.
+        """
+        if not self.cpu_nice:
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.cpu_nice)
+        except (AttributeError, OSError) as exc:
+            _logger.warning("No se pudo bajar la prioridad del hilo de backup: %s", exc)
+
+    def _dump_to_paths(self, db_name: str, paths: List[str]) -> List[dict]:
+        """
+        Genera el backup una sola vez y lo deja en cada ruta de ``paths`` (la
+        primera, en ``backup_path``). Retorna un resultado por destino:
+        ``{path, written, checksum, error}``. El nombre final sólo aparece
+        cuando el backup está completo en disco.
+        """
+        self._report_job(f"Backup {db_name}", 0, force=True)
+        if self.backup_format in ("directory", "snapshot"):
+            written, digest = self._dump_directory(db_name, paths[0])
+        elif self.storage_mode == "chunks":
+            written, digest = self._dump_to_chunks(db_name, paths[0])
+        else:
+            return self._dump_to_files(db_name, paths)
+        primary = {"path": paths[0], "written": written, "checksum": digest, "error": None}
+        return [primary] + self._replicate_backup(paths[0], paths[1:])
+
+    @staticmethod
+    def _write_checksum_sidecar(path: str, digest: str, size: int) -> None:
+        with open(path + _CHECKSUM_SIDECAR, "w") as fh:
+            json.dump({
+                "algorithm": "sha256",
+                "digest": digest,
+                "size": size,
+                "file": os.path.basename(path),
+            }, fh)
+
+    @staticmethod
+    def _discard_partial(path: str) -> None:
+        """Elimina un backup a medio escribir para que la retención no lo cuente."""
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.isfile(path):
+                os.remove(path)
+        except OSError as exc:
+            _logger.warning("No se pudo eliminar el backup parcial %s: %s", path, exc)
+
+    # ───────────────────────────────────────────────────────────────
+    #  ZIP EN PROCESO (sin HTTP)
+    # ───────────────────────────────────────────────────────────────
+    def _dump_to_files(self, db_name: str, filepaths: List[str]) -> List[dict]:
+        """
+        Vuelca ``db_name`` (pg_dump + filestore, formato ZIP) una sola vez y
+        reparte el flujo entre ``filepaths`` en bloques de tamaño fijo: cada
+        destino se escribe en su propio hilo y un destino lento o caído no
+        frena a los demás (``streams.FanOutWriter``).
+
+        El ZIP se arma con ``_write_zip`` (mismo contenido que
+        ``odoo.service.db.dump_db``), lo que permite medir cada fase. Con otro
+        códec que no sea «deflate» se escribe sin comprimir y pasa por el
+        compresor elegido. Con ``encrypt_backups`` el resultado se cifra antes
+        de repartirlo (``_encrypted``).
+
+        Con ``volume_size_mb`` el flujo se corta en volúmenes de ese tamaño
+        (``_dump_to_volumes``).
+        """
+        if self.volume_size_mb:
+            return self._dump_to_volumes(db_name, filepaths)
+        stem = _backup_stem(filepaths[0])
+        progress = self._progress(f"Backup {db_name}")
+        # lo que no pertenece a otra fase (cabeceras del ZIP, fsync, rename) es escritura
+        with metrics.current().phase("write"), \
+                streams.FanOutWriter(filepaths, stall_seconds=_STALL_SECONDS) as fan:
+            with self._encrypted(metrics.TimedWriter(fan, "write")) as raw, \
+                    streams.ChunkedWriter(raw, progress=progress, throttle=self._throttle()) as writer:
+                if self.compression_codec != "deflate":
+                    with self._compressed(writer) as sink:
+                        plan, archived = self._write_zip(db_name, sink, stem, zipfile.ZIP_STORED)
+                else:
+                    plan, archived = self._write_zip(db_name, writer, stem)
+
+        results = fan.results()
+        for res in results:
+            if res["error"]:
+                continue
+            try:
+                self._write_checksum_sidecar(res["path"], res["checksum"], res["written"])
+                if plan:
+                    with open(res["path"] + _META_SIDECAR, "w") as fh:
+                        json.dump(plan.meta(stem), fh)
+            except OSError as exc:
+                res["error"] = str(exc)
+                self._discard_partial(res["path"])
+        if plan and any(not res["error"] for res in results):
+            self._save_filestore_index(db_name, plan, stem, archived)
+        return results
+
+    def _dump_to_volumes(self, db_name: str, dirpaths: List[str]) -> List[dict]:
+        """
+        Como ``_dump_to_files``, pero cada destino es un directorio ``.vol``
+        con el ZIP cortado en volúmenes de ``volume_size_mb`` y su
+        ``VOLUMES.json`` (``tools.volumes``). Un error de escritura reintenta
+        sólo el volumen afectado; un destino descartado se completa al final
+        desde la ruta principal, a partir del primer volumen que le falte.
+        """
+        stem = _backup_stem(dirpaths[0])
+        name = stem + self._zip_suffix()
+        progress = self._progress(f"Backup {db_name}")
+        with metrics.current().phase("write"), volumes.VolumeWriter(
+                dirpaths, name, self.volume_size_mb * 1024 ** 2,
+                stall_seconds=_STALL_SECONDS,
+                # junto a la ruta principal: la verificación previa cuenta ese espacio
+                spool_dir=os.path.dirname(dirpaths[0])) as vol:
+            with self._encrypted(metrics.TimedWriter(vol, "write")) as raw, \
+                    streams.ChunkedWriter(raw, progress=progress, throttle=self._throttle()) as writer:
+                if self.compression_codec != "deflate":
+                    with self._compressed(writer) as sink:
+                        plan, archived = self._write_zip(db_name, sink, stem, zipfile.ZIP_STORED)
+                else:
+                    plan, archived = self._write_zip(db_name, writer, stem)
+            if plan:
+                vol.add_file(filestore_index.INCREMENT_FILE, json.dumps(plan.meta(stem)).encode())
+
+        results = vol.results()
+        primary = results[0]
+        for res in results[1:]:
+            if not res["error"] or primary["error"]:
+                continue
+            try:
+                with metrics.current().phase("write"):
+                    volumes.resume(primary["path"], res["path"], self._throttle())
+            except (OSError, ValueError) as exc:
+                _logger.warning("No se pudo completar %s: %s", res["path"], exc)
+                continue
+            _logger.info("Destino %s completado desde %s", res["path"], primary["path"])
+            res.update(written=primary["written"], checksum=primary["checksum"], error=None)
+        for res in results:
+            if res["error"]:
+                self._discard_partial(res["path"] + ".part")
+        if plan and any(not res["error"] for res in results):
+            self._save_filestore_index(db_name, plan, stem, archived)
+        return results
+
+    def _write_zip(self, db_name: str, sink, stem: str, compression: int = zipfile.ZIP_DEFLATED):
+        """
+        Escribe en ``sink`` el mismo contenido que el ZIP de Odoo (dump.sql,
+        manifest.json, filestore/) sin pasar por un directorio temporal.
+
+        El SQL y el filestore corresponden al mismo instante
+        (``_consistent_point``). Con ``parallel_filestore`` pg_dump vuelca a
+        un archivo temporal en la ruta de destino mientras se archiva el
+        filestore, y el SQL se agrega al final (el orden de las entradas no
+        importa al restaurar). Si el backup se cifra, el temporal va al
+        directorio temporal del servidor: el SQL en claro no pasa por el
+        destino.
+
+        En modo incremental el filestore se reduce a lo que indica el plan y
+        se agrega ``filestore.increment.json`` con la referencia a la cadena.
+        Retorna ``(plan, entradas_archivadas)``; ``plan`` es None en modo
+        completo. El índice del filestore lo guarda quien llama, una vez que
+        el backup quedó escrito.
+        """
+        clock = metrics.current()
+        prefix = self._priority_prefix()
+        with self._consistent_point(db_name) as point, \
+                zipfile.ZipFile(sink, "w", compression, allowZip64=True) as zf:
+            plan, rels = self._filestore_selection(db_name, point.files)
+            if self.parallel_filestore:
+                spool_dir = None if self.encrypt_backups else self.backup_path
+                with tempfile.TemporaryFile(dir=spool_dir) as spool:
+                    with _in_background(lambda check: _pg_dump_plain(
+                            db_name, spool, _chain_checks(check, self._check_deadline),
+                            prefix, point.snapshot)) as dump:
+                        archived = self._zip_filestore(zf, db_name, rels)
+                        # lo que resta de pg_dump queda en el camino crítico
+                        with clock.phase("dump"):
+                            dumped = dump()
+                    spool.seek(0)
+                    with clock.phase("dump"), zf.open("dump.sql", "w", force_zip64=True) as entry:
+                        shutil.copyfileobj(spool, entry, streams.DEFAULT_CHUNK_SIZE)
+            else:
+                with clock.phase("dump"), zf.open("dump.sql", "w", force_zip64=True) as entry:
+                    dumped = _pg_dump_plain(db_name, entry, self._check_deadline, prefix, point.snapshot)
+                archived = self._zip_filestore(zf, db_name, rels)
+            clock.count("dump", dumped)
+            zf.writestr(_MANIFEST, json.dumps(db.dump_db_manifest(point.cr), indent=4))
+            if plan:
+                zf.writestr(filestore_index.INCREMENT_FILE, json.dumps(plan.meta(stem)))
+        return plan, archived
+
+    def _zip_filestore(self, zf: zipfile.ZipFile, db_name: str, rels: List[str]) -> dict:
+        clock = metrics.current()
+        with clock.phase("filestore"):
+            archived = filestore_index.archive_files(
+                zf, config.filestore(db_name), rels, check=self._check_deadline)
+        clock.count("filestore", sum(entry[0] for entry in archived.values()))
+        return archived
+
+    # ───────────────────────────────────────────────────────────────
+    #  INSTANTE CONSISTENTE (snapshot exportado + corte del filestore)
+    # ───────────────────────────────────────────────────────────────
+    @contextlib.contextmanager
+    def _consistent_point(self, db_name: str) -> Iterator["_ConsistentPoint"]:
+        """
+        Transacción abierta durante todo el volcado: exporta su snapshot para
+        pg_dump (``--snapshot``) y, en ese mismo snapshot, lee qué adjuntos
+        referencia ``ir_attachment``. El filestore se limita a esos archivos:
+        los escritos después no tienen registro en el SQL y no se archivan.
+        """
+        with db_connect(db_name).cursor() as cr:
+            snapshot_id = None
+            try:
+                cr.execute("SELECT pg_export_snapshot()")
+                snapshot_id = cr.fetchone()[0]
+            except psycopg2.Error as exc:
+                # p. ej. un servidor en recuperación: se vuelca sin sincronizar
+                _logger.warning("No se pudo exportar el snapshot de %s: %s", db_name, exc)
+                cr.rollback()
+            cr.execute("SELECT store_fname FROM ir_attachment WHERE store_fname IS NOT NULL")
+            files = {row[0] for row in cr.fetchall()}
+            yield _ConsistentPoint(cr, snapshot_id, files)
+
+    def _filestore_selection(self, db_name: str, files: Optional[set] = None):
+        """
+        ``(plan, rutas)`` del filestore a archivar, limitado a ``files``
+        (adjuntos referenciados en el instante del volcado). ``plan`` es None
+        en modo completo.
+        """
+        current = filestore_index.scan(config.filestore(db_name))
+        if files is not None:
+            current = {rel: entry for rel, entry in current.items() if rel in files}
+        if self.filestore_mode == "incremental":
+            plan = self._filestore_plan(db_name, current)
+            return plan, plan.changed
+        return None, sorted(current)
+
+    # ───────────────────────────────────────────────────────────────
+    #  DIRECTORIO PARALELO (pg_dump -Fd -j N)
+    # ───────────────────────────────────────────────────────────────
+    def _dump_directory(self, db_name: str, target: str) -> Tuple[int, str]:
+        """
+        Estructura generada::
+
+            <target>/dump/           pg_dump --format=d (un archivo por tabla)
+            <target>/filestore.tar   adjuntos de la base
+            <target>/manifest.json   versión y módulos (igual que el ZIP)
+            <target>/filestore.increment.json   (sólo en modo incremental)
+            <target>/SHA256SUMS      formato de ``sha256sum -c``
+
+        En formato instantánea el filestore es un árbol ``<target>/filestore/``
+        enlazado a la instantánea anterior (``_snapshot_filestore``) y queda
+        fuera de ``SHA256SUMS``: hashearlo obligaría a leerlo entero.
+
+        pg_dump corre en segundo plano, fijado al snapshot exportado por
+        ``_consistent_point``, mientras se archiva el filestore del mismo
+        instante: la ventana del backup es la de la fase más larga.
+
+        El SHA-256 del backup es el de ``SHA256SUMS``. El tar se hashea al
+        escribirlo; los archivos de pg_dump se leen una vez al terminar (los
+        escribe otro proceso), todavía en la caché de páginas. Retorna
+        ``(bytes_nuevos_en_disco, sha256)``.
+        """
+        plan = None
+        sums = {}
+        linked = 0
+        stem = _backup_stem(target)
+        clock = metrics.current()
+        # firmas de referencia leídas antes del snapshot: nunca cuentan un
+        # cambio que el volcado no contenga
+        baseline = self._read_table_stats(db_name) if self.db_dump_mode == "differential" else None
+        with clock.phase("write"), streams.atomic_directory(target) as work, \
+                self._consistent_point(db_name) as point:
+            diff = self._db_dump_plan(db_name, point, baseline) if baseline else None
+            cmd = self._pg_dump_dir_cmd(db_name, work, point.snapshot, diff and diff[2])
+            self._report_job(f"pg_dump {db_name}", 0, force=True)
+            with _in_background(lambda check: _run_pg_dump(
+                    cmd, _chain_checks(check, self._check_deadline))) as dump:
+                if not self.parallel_filestore:
+                    with clock.phase("dump"):
+                        dump()
+
+                tar_name = _FILESTORE_TAR + self._codec_suffix()
+                if self.backup_format == "snapshot":
+                    with clock.phase("filestore"):
+                        stats = self._snapshot_filestore(
+                            db_name, os.path.join(work, _FILESTORE_DIR), target, point.files)
+                    linked = stats["linked_bytes"]
+                else:
+                    plan, rels = self._filestore_selection(db_name, point.files)
+                    archived, sums[tar_name] = self._archive_filestore(
+                        db_name, os.path.join(work, tar_name), rels)
+                    if plan:
+                        with open(os.path.join(work, filestore_index.INCREMENT_FILE), "w") as fh:
+                            json.dump(plan.meta(stem), fh)
+
+                with clock.phase("dump"):
+                    dump()
+                if diff and not diff[2].full:
+                    with clock.phase("dump"):
+                        self._settle_differential(db_name, work, point, diff)
+                    with open(os.path.join(work, table_diff.DIFF_FILE), "w") as fh:
+                        json.dump(diff[2].meta(stem), fh)
+            clock.count("dump", _tree_size(os.path.join(work, _DUMP_DIR)))
+
+            with open(os.path.join(work, _MANIFEST), "w") as fh:
+                json.dump(db.dump_db_manifest(point.cr), fh, indent=4)
+
+            for root, dirs, files in os.walk(work):
+                if root == work:
+                    dirs[:] = [d for d in dirs if d != _FILESTORE_DIR]
+                for fname in files:
+                    rel = os.path.relpath(os.path.join(root, fname), work)
+                    if rel not in sums:
+                        sums[rel] = streams.file_sha256(os.path.join(root, fname))
+            listing = "".join(f"{sums[rel]}  {rel}\n" for rel in sorted(sums)).encode()
+            with open(os.path.join(work, _SUMS_FILE), "wb") as fh:
+                fh.write(listing)
+
+        if plan:
+            self._save_filestore_index(db_name, plan, stem, archived)
+        if diff:
+            index, stats, db_plan = diff
+            table_diff.save_json(
+                self._db_index_path(db_name), table_diff.next_index(index, db_plan, stem, stats))
+        return _tree_size(target) - linked, hashlib.sha256(listing).hexdigest()
+
+    def _pg_dump_dir_cmd(self, db_name: str, work: str, snapshot_id: Optional[str],
+                         db_plan: Optional[table_diff.DiffPlan] = None) -> List[str]:
+        cmd = self._priority_prefix() + [
+            find_pg_tool("pg_dump"), "--no-owner",
+            "--format=d", f"--jobs={max(self.dump_jobs, 1)}",
+            f"--file={os.path.join(work, _DUMP_DIR)}",
+        ]
+        if snapshot_id:
+            cmd.append(f"--snapshot={snapshot_id}")
+        if db_plan and not db_plan.full:
+            cmd += ["--data-only"] + table_diff.table_args(db_plan.tables + db_plan.sequences)
+        return cmd + [db_name]
+
+    # ───────────────────────────────────────────────────────────────
+    #  VOLCADO DIFERENCIAL POR TABLA
+    # ───────────────────────────────────────────────────────────────
+    def _db_index_path(self, db_name: str) -> str:
+        return os.path.join(self.backup_path, f".db_index_{self.id}_{db_name}.json")
+
+    def _read_table_stats(self, db_name: str) -> table_diff.TableStats:
+        with db_connect(db_name).cursor() as cr:
+            return table_diff.read_stats(cr)
+
+    def _db_dump_plan(self, db_name: str, point: "_ConsistentPoint", baseline: table_diff.TableStats):
+        """
+        ``(índice, firmas, plan)`` del volcado de ``db_name``: completo o sólo
+        las tablas que cambiaron desde el último completo. El plan usa las
+        estadísticas leídas después del snapshot (incluyen de más, nunca de
+        menos); un completo guarda las de ``baseline``, leídas antes.
+        """
+        index = table_diff.load_json(self._db_index_path(db_name))
+        if index and not _find_backup(self.backup_path, index.get("base")):
+            _logger.info("Volcado completo de referencia no encontrado: se hará uno completo.")
+            index = None
+        stats = table_diff.read_stats(point.cr)
+        db_plan = table_diff.make_plan(index, stats, self.db_full_every)
+        if db_plan.full:
+            _logger.info("Volcado completo de %s (%s)", db_name, db_plan.reason)
+        else:
+            _logger.info(
+                "Volcado diferencial de %s: %s de %s tablas (base %s)",
+                db_name, len(db_plan.tables), len(stats.signatures), db_plan.base,
+            )
+        return index, baseline, db_plan
+
+    def _settle_differential(self, db_name: str, work: str, point: "_ConsistentPoint", diff) -> None:
+        """
+        Las estadísticas se publican con demora: lo confirmado poco antes del
+        snapshot puede aparecer después de decidir qué tablas volcar. Pasado
+        ``_STATS_SETTLE`` desde el snapshot se releen y, si hay tablas nuevas,
+        se repite el volcado con ellas sobre el mismo snapshot (que sigue
+        exportado). Puede incluir de más, nunca de menos.
+        """
+        index, _stats, db_plan = diff
+        wait = _STATS_SETTLE - (time.monotonic() - point.started)
+        if wait > 0:
+            remaining = self._remaining_seconds()
+            time.sleep(wait if remaining is None else min(wait, remaining))
+            self._check_deadline()
+        extra = set(table_diff.changed_tables(index, table_diff.read_stats(point.cr))) - set(db_plan.tables)
+        if not extra:
+            return
+        _logger.info("Volcado diferencial de %s: %s tablas más tras releer estadísticas", db_name, len(extra))
+        db_plan.tables = sorted(set(db_plan.tables) | extra)
+        shutil.rmtree(os.path.join(work, _DUMP_DIR))
+        _run_pg_dump(self._pg_dump_dir_cmd(db_name, work, point.snapshot, db_plan), self._check_deadline)
+
+    def _snapshot_filestore(self, db_name: str, dest: str, target: str, files: Optional[set] = None) -> dict:
+        """
+        Filestore de una instantánea: lo que no cambió desde la instantánea
+        anterior de la base en el mismo directorio se enlaza en lugar de
+        copiarse. Con ``files`` sólo se incluyen esos adjuntos. Retorna las
+        estadísticas de ``snapshot.link_tree``.
+        """
+        previous = _previous_snapshot(os.path.dirname(target), db_name)
+        os.makedirs(dest, exist_ok=True)
+        stats = snapshot.link_tree(
+            config.filestore(db_name), dest,
+            previous and os.path.join(previous, _FILESTORE_DIR),
+            throttle=self._throttle(), check=self._check_deadline, only=files,
+        )
+        metrics.current().count("filestore", stats["copied_bytes"])
+        _logger.info(
+            "Filestore %s: %s archivos enlazados, %s copiados (%.1f MB)",
+            db_name, stats["linked"], stats["copied"], stats["copied_bytes"] / 1024 ** 2,
+        )
+        return stats
+
+    def _archive_filestore(self, db_name: str, tar_path: str, rels: Optional[List[str]] = None):
+        """
+        Empaqueta el filestore con el códec configurado («deflate» deja el
+        tar sin comprimir: los adjuntos ya suelen estarlo). Con ``rels`` sólo
+        se incluyen esas rutas. Retorna ``(entradas_de_índice, sha256_del_tar)``.
+        """
+        filestore = config.filestore(db_name)
+        archived = {}
+        with open(tar_path, "wb") as raw:
+            hashed = streams.HashingWriter(raw)
+            with streams.ChunkedWriter(
+                metrics.TimedWriter(hashed, "write"),
+                progress=self._progress(f"Filestore {db_name}"), throttle=self._throttle(),
+            ) as writer:
+                with self._compressed(writer) as sink:
+                    tar_sink = metrics.TimedWriter(sink, "filestore")
+                    with tarfile.open(fileobj=tar_sink, mode="w|") as tar:
+                        if rels is not None:
+                            archived = filestore_index.archive_files(
+                                tar, filestore, rels, check=self._check_deadline)
+                        elif os.path.isdir(filestore):
+                            tar.add(filestore, arcname="filestore")
+        return archived, hashed.hexdigest()
+
+    # ───────────────────────────────────────────────────────────────
+    #  FILESTORE INCREMENTAL
+    # ───────────────────────────────────────────────────────────────
+    def _filestore_index_path(self, db_name: str) -> str:
+        return os.path.join(self.backup_path, f".filestore_index_{self.id}_{db_name}.json")
+
+    def _filestore_plan(self, db_name: str, current: Optional[dict] = None) -> filestore_index.Plan:
+        """
+        Decide si esta ejecución archiva el filestore completo o sólo las
+        diferencias. Se fuerza un completo si no hay índice, si se alcanzó
+        ``filestore_full_every`` o si el backup anterior de la cadena ya no
+        existe en disco.
+        """
+        index = filestore_index.load_index(self._filestore_index_path(db_name))
+        if index and not _find_backup(self.backup_path, index.get("last")):
+            _logger.info("Backup anterior de la cadena no encontrado: se hará uno completo.")
+            index = None
+        if current is None:
+            current = filestore_index.scan(config.filestore(db_name))
+        return filestore_index.make_plan(index, current, self.filestore_full_every)
+
+    def _save_filestore_index(self, db_name: str, plan: filestore_index.Plan, stem: str, archived: dict) -> None:
+        filestore_index.save_index(
+            self._filestore_index_path(db_name),
+            filestore_index.next_index(plan, stem, archived),
+        )
+        _logger.info(
+            "Filestore %s: %s archivos archivados, %s eliminados",
+            "completo" if plan.full else "incremental", len(archived), len(plan.deleted),
+        )
+
+    @staticmethod
+    def _read_increment_meta(path: str) -> Optional[dict]:
+        """Metadatos de cadena de un backup, o None si no es incremental."""
+        try:
+            if os.path.isdir(path):
+                with open(os.path.join(path, filestore_index.INCREMENT_FILE)) as fh:
+                    return json.load(fh)
+            if path.endswith(_IDX_SUFFIX):
+                return (chunk_store.load_index(path) or {}).get("increment")
+            if os.path.isfile(path + _META_SIDECAR):
+                with open(path + _META_SIDECAR) as fh:
+                    return json.load(fh)
+            if encryption.is_encrypted(path) or compression.codec_from_path(path) != "none":
+                return None
+            with zipfile.ZipFile(path) as zf:
+                return json.loads(zf.read(filestore_index.INCREMENT_FILE))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def _filestore_chain(self, path: str) -> List[str]:
+        """
+        Backups necesarios para reconstruir el filestore de ``path``, del
+        completo al propio ``path``. Lista vacía si la cadena está rota.
+        """
+        chain = [path]
+        meta = self._read_increment_meta(path)
+        while meta and not meta.get("full"):
+            parent = _find_backup(os.path.dirname(path), meta.get("parent"))
+            if not parent or parent in chain:
+                return []
+            chain.append(parent)
+            meta = self._read_increment_meta(parent)
+        chain.reverse()
+        return chain
+
+    def _restore_filestore_chain(self, path: str, dest: str) -> None:
+        chain = self._filestore_chain(path)
+        if not chain:
+            raise UserError(_("La cadena de backups incrementales de '%s' está incompleta.") % path)
+        for member in chain:
+            meta = self._read_increment_meta(member)
+            if member.endswith(_IDX_SUFFIX):
+                with tempfile.NamedTemporaryFile(suffix=".zip") as tmp:
+                    self._materialize_chunks(member, tmp)
+                    tmp.flush()
+                    filestore_index.apply_archive(tmp.name, meta, dest)
+                continue
+            if member.endswith(_VOL_SUFFIX):
+                with tempfile.NamedTemporaryFile(suffix=".zip") as tmp:
+                    _join_volumes(member, tmp, self._archive_secret())
+                    tmp.flush()
+                    filestore_index.apply_archive(tmp.name, meta, dest)
+                continue
+            if os.path.isdir(member):
+                filestore_index.apply_archive(_filestore_tar(member), meta, dest)
+            elif encryption.is_encrypted(member) or compression.codec_from_path(member) != "none":
+                with tempfile.NamedTemporaryFile(suffix=".zip") as tmp:
+                    _decode_backup(member, tmp, self._archive_secret())
+                    tmp.flush()
+                    filestore_index.apply_archive(tmp.name, meta, dest)
+            else:
+                filestore_index.apply_archive(member, meta, dest)
+
+    @api.model
+    def restore_filestore(self, path: str, db_name: str) -> None:
+        """
+        Reconstruye el filestore de ``db_name`` al momento de ``path``
+        aplicando el completo y los incrementales en orden. La base se
+        restaura por separado (gestor de Odoo o ``restore_directory_backup``).
+        """
+        self._restore_filestore_chain(path, config.filestore(db_name))
+        _logger.info("Filestore de %s reconstruido desde %s", db_name, path)
+
+    @api.model
+    def materialize_volume_backup(self, path: str, zip_path: str, key: Optional[str] = None) -> None:
+        """
+        Reconstruye el ZIP de un backup en volúmenes verificando cada volumen,
+        restaurable luego desde el gestor de bases de Odoo. Ejemplo desde
+        ``odoo shell``::
+
+            env["backup.config"].materialize_volume_backup(
+                "/mnt/backups/db_backup_prod_2024_01_31_030000.vol", "/tmp/prod.zip")
+
+        ``key``: clave con la que se cifró (la de esta base si se omite).
+        """
+        try:
+            with open(zip_path, "wb") as out:
+                _join_volumes(path, out, self._archive_secret(key))
+        except (OSError, ValueError) as exc:
+            raise UserError(str(exc)) from exc
+
+    @api.model
+    def materialize_encrypted_backup(self, path: str, zip_path: str, key: Optional[str] = None) -> None:
+        """
+        Descifra (y descomprime) un backup ``.enc`` en el ZIP original, para
+        restaurarlo desde el gestor de bases de Odoo. En otro servidor se
+        indica la clave del módulo del servidor de origen::
+
+            env["backup.config"].materialize_encrypted_backup(
+                "/mnt/backups/db_backup_prod_2024_01_31_030000.zip.zst.enc", "/tmp/prod.zip",
+                key="<auto_backup_local.fernet_key del origen>")
+        """
+        try:
+            with open(zip_path, "wb") as out:
+                _decode_backup(path, out, self._archive_secret(key))
+        except (OSError, ValueError) as exc:
+            raise UserError(str(exc)) from exc
+
+    # ───────────────────────────────────────────────────────────────
+    #  RESTAURACIÓN PARALELA
+    # ───────────────────────────────────────────────────────────────
+    @api.model
+    def restore_directory_backup(self, path: str, db_name: str, jobs: int = 0) -> None:
+        """
+        Restaura un backup en formato directorio o instantánea sobre una base
+        nueva.
+
+        Ejemplo desde ``odoo shell``::
+
+            env["backup.config"].restore_directory_backup(
+                "/mnt/backups/db_backup_prod_2024_01_31_030000.d", "prod_restore", jobs=8)
+        """
+        dump_dir = os.path.join(path, _DUMP_DIR)
+        if not os.path.isdir(dump_dir):
+            raise UserError(_("'%s' no es un backup en formato directorio.") % path)
+        if db.exp_db_exist(db_name):
+            raise UserError(_("La base '%s' ya existe.") % db_name)
+
+        diff = table_diff.load_json(os.path.join(path, table_diff.DIFF_FILE))
+        base = diff and _find_backup(os.path.dirname(path), diff.get("base"))
+        if diff and not base:
+            raise UserError(_("No se encontró el volcado completo '%s' del que depende '%s'.")
+                            % (diff.get("base"), path))
+
+        jobs = max(jobs or (os.cpu_count() or 1), 1)
+        db._create_empty_database(db_name)
+
+        pg_restore = [find_pg_tool("pg_restore"), "--no-owner", f"--dbname={db_name}"]
+        if not diff:
+            _run_pg_tool(pg_restore + [f"--jobs={jobs}", dump_dir])
+        else:
+            # completo sin los datos que aporta el diferencial; restricciones e
+            # índices al final, como hace pg_restore con un único volcado
+            base_dump = os.path.join(base, _DUMP_DIR)
+            listing = _run_pg_tool([find_pg_tool("pg_restore"), "--list", base_dump])
+            with tempfile.NamedTemporaryFile("w", suffix=".list") as use_list:
+                use_list.write(table_diff.restore_list(listing, diff["tables"], diff["sequences"]))
+                use_list.flush()
+                _run_pg_tool(pg_restore + ["--section=pre-data", base_dump])
+                _run_pg_tool(pg_restore + [
+                    "--section=data", f"--jobs={jobs}", f"--use-list={use_list.name}", base_dump])
+                _run_pg_tool(pg_restore + ["--section=data", f"--jobs={jobs}", dump_dir])
+                _run_pg_tool(pg_restore + ["--section=post-data", f"--jobs={jobs}", base_dump])
+            _logger.info("Diferencial %s aplicado sobre %s", path, base)
+
+        tar_path = _filestore_tar(path)
+        tree = os.path.join(path, _FILESTORE_DIR)
+        if os.path.isdir(tree):
+            # instantánea: se copia (no se enlaza) para no alterar los archivos compartidos
+            shutil.copytree(tree, config.filestore(db_name), dirs_exist_ok=True)
+        elif self._read_increment_meta(path):
+            self.restore_filestore(path, db_name)
+        elif tar_path:
+            _extract_filestore(tar_path, config.filestore(db_name))
+        _logger.info("Base %s restaurada desde %s (%s procesos)", db_name, path, jobs)
+
+
+# ───────────────────────────────────────────────────────────────
+#  Utilidades
+# ───────────────────────────────────────────────────────────────
+def _backup_stem(path: str) -> str:
+    """``/x/db_backup_prod_2024_01_31_030000.zip.zst`` → ``db_backup_prod_2024_01_31_030000``"""
+    head, sep, tail = os.path.basename(path.rstrip(os.sep)).rpartition("_")
+    return head + sep + tail.split(".", 1)[0]
+
+
+def _join_volumes(path: str, out, secret: Optional[bytes] = None) -> None:
+    """ZIP original (descifrado y descomprimido) de un backup en volúmenes, verificando cada volumen."""
+    with volumes.VolumeReader(path) as reader:
+        shutil.copyfileobj(_open_backup(reader.name, reader, secret), out, streams.DEFAULT_CHUNK_SIZE)
+
+
+def _open_backup(name: str, raw, secret: Optional[bytes] = None):
+    """Flujo del ZIP original sobre ``raw``, según la extensión de ``name``."""
+    if encryption.is_encrypted(name):
+        if secret is None:
+            raise ValueError(f"{name} está cifrado y no se indicó la clave.")
+        raw = encryption.DecryptingReader(raw, secret)
+        name = encryption.strip_suffix(name)
+    return compression.open_reader(compression.codec_from_path(name), raw)
+
+
+def _decode_backup(path: str, out, secret: Optional[bytes] = None) -> None:
+    """Descifra y descomprime en ``out`` un backup de archivo único."""
+    with open(path, "rb") as raw:
+        shutil.copyfileobj(_open_backup(path, raw, secret), out, streams.DEFAULT_CHUNK_SIZE)
+
+
+def _filestore_tar(path: str) -> Optional[str]:
+    """``filestore.tar`` de un backup en directorio, con la extensión de su códec."""
+    for suffix in compression.SUFFIXES.values():
+        tar_path = os.path.join(path, _FILESTORE_TAR + suffix)
+        if os.path.isfile(tar_path):
+            return tar_path
+    return None
+
+
+def _previous_snapshot(directory: str, db_name: str) -> Optional[str]:
+    """Instantánea más reciente de ``db_name`` en ``directory`` (las ``.part`` no cuentan)."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return None
+    best = None
+    for fname in names:
+        parsed = parse_backup_name(fname)
+        if not parsed or parsed[3] != "snapshot" or parsed[1] != db_name:
+            continue
+        if best is None or parsed[2] > best[0]:
+            best = (parsed[2], fname)
+    return os.path.join(directory, best[1]) if best else None
+
+
+def _find_backup(directory: str, stem: Optional[str]) -> Optional[str]:
+    """Busca en ``directory`` el backup (ZIP o directorio) con ese stem."""
+    if not stem:
+        return None
+    for suffix in _SUFFIXES:
+        for codec_suffix in compression.SUFFIXES.values():
+            for enc_suffix in ("", encryption.SUFFIX):
+                path = os.path.join(directory, stem + suffix + codec_suffix + enc_suffix)
+                if os.path.exists(path):
+                    return path
+    return None
+
+
+def _pg_dump_plain(db_name: str, out, check: Optional[Callable[[], None]] = None,
+                   prefix: Optional[List[str]] = None, snapshot_id: Optional[str] = None) -> int:
+    """
+    pg_dump en texto plano volcado en ``out`` en bloques. ``check`` se invoca
+    entre bloques; si lanza una excepción el proceso pg_dump se termina.
+    ``prefix`` se antepone al comando (``nice`` / ``ionice``) y
+    ``snapshot_id`` fija el snapshot exportado. Retorna los bytes volcados.
+    """
+    total = 0
+    cmd = (prefix or []) + [find_pg_tool("pg_dump"), "--no-owner"]
+    if snapshot_id:
+        cmd.append(f"--snapshot={snapshot_id}")
+    cmd.append(db_name)
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            cmd, env=exec_pg_environ(), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=err,
+        )
+        try:
+            with proc.stdout:
+                while True:
+                    buf = proc.stdout.read(streams.DEFAULT_CHUNK_SIZE)
+                    if not buf:
+                        break
+                    out.write(buf)
+                    total += len(buf)
+                    if check:
+                        check()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if proc.wait() != 0:
+            err.seek(0)
+            raise UserError(_("Fallo pg_dump: %s") % err.read().decode(errors="replace").strip())
+    return total
+
+
+def _run_pg_tool(cmd: List[str]) -> str:
+    """Ejecuta pg_restore / pg_dump y retorna su salida; error → UserError."""
+    res = subprocess.run(
+        cmd, env=exec_pg_environ(), stdin=subprocess.DEVNULL,
+        capture_output=True, text=True,
+    )
+    if res.returncode != 0:
+        raise UserError(_("Fallo %s: %s") % (os.path.basename(cmd[0]), res.stderr.strip()))
+    return res.stdout
+
+
+def _run_pg_dump(cmd: List[str], check: Callable[[], None]) -> None:
+    """
+    pg_dump que escribe por su cuenta (formato directorio). ``check`` se
+    invoca cada segundo mientras corre; si lanza una excepción el proceso se
+    termina.
+    """
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            cmd, env=exec_pg_environ(), stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=err,
+        )
+        try:
+            while True:
+                try:
+                    returncode = proc.wait(timeout=1.0)
+                    break
+                except subprocess.TimeoutExpired:
+                    check()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if returncode != 0:
+            err.seek(0)
+            raise UserError(_("Fallo pg_dump: %s") % err.read().decode(errors="replace").strip())
+
+
+class _ConsistentPoint:
+    """Instante común al volcado SQL y al filestore."""
+
+    def __init__(self, cr, snapshot_id: Optional[str], files: set):
+        self.cr = cr
+        self.snapshot = snapshot_id
+        self.files = files
+        self.started = time.monotonic()
+
+
+@contextlib.contextmanager
+def _in_background(func: Callable[[Callable[[], None]], object]) -> Iterator[Callable[[], object]]:
+    """
+    Ejecuta ``func(check)`` en otro hilo mientras corre el bloque ``with`` y
+    produce una función que espera su resultado (o relanza su excepción).
+    Si el bloque falla, ``check`` empieza a lanzar para que ``func`` se
+    interrumpa, y se la espera antes de propagar el error.
+    """
+    abort = threading.Event()
+    outcome = {}
+
+    def _check() -> None:
+        if abort.is_set():
+            raise UserError(_("Volcado interrumpido."))
+
+    def _run() -> None:
+        try:
+            outcome["value"] = func(_check)
+        except BaseException as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=_run, name="backup-pg_dump", daemon=True)
+    thread.start()
+
+    def _wait():
+        thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["value"]
+
+    try:
+        yield _wait
+    except BaseException:
+        abort.set()
+        thread.join()
+        raise
+
+
+def _chain_checks(*checks: Callable[[], None]) -> Callable[[], None]:
+    def _check() -> None:
+        for check in checks:
+            check()
+    return _check
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for fname in files:
+            total += os.path.getsize(os.path.join(root, fname))
+    return total
+
+
+def _extract_filestore(tar_path: str, dest: str) -> None:
+    """Extrae ``filestore/`` del tar directamente en ``dest``."""
+    os.makedirs(dest, exist_ok=True)
+    with open(tar_path, "rb") as raw, \
+            tarfile.open(fileobj=compression.open_reader(compression.codec_from_path(tar_path), raw),
+                         mode="r|") as tar:
+        for member in tar:
+            if not member.name.startswith("filestore"):
+                continue
+            member.name = os.path.relpath(member.name, "filestore")
+            if member.name == ".":
+                continue
+            _safe_extract(tar, member, dest)
+
+
+def _safe_extract(tar: tarfile.TarFile, member: tarfile.TarInfo, dest: str) -> None:
+    """Extrae ``member`` rechazando rutas que escapen de ``dest``."""
+    if hasattr(tarfile, "data_filter"):
+        tar.extract(member, dest, filter="data")
+        return
+    target = os.path.realpath(os.path.join(dest, member.name))
+    if not target.startswith(os.path.realpath(dest) + os.sep) or member.issym() or member.islnk():
+        raise UserError(_("Entrada no permitida en el archivo: %s") % member.name)
+    tar.extract(member, dest)
@@ -5,14 +5,23 @@ executor.py –  Métodos de generación de backups y cron_hourly
 
 from __future__ import annotations
 
+import concurrent.futures
 import datetime
+import fnmatch
 import logging
 import os
-import subprocess
-from typing import Set
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import List, Set
 
-from dateutil.relativedelta import relativedelta  # type: ignore
+import pytz  # type: ignore
 from odoo import api, fields, models, _  # type: ignore
+from odoo.service import db  # type: ignore
+from odoo.sql_db import connection_info_for  # type: ignore
+
+from ...tools import metrics, schedule
 
 _logger = logging.getLogger(__name__)
 
@@ -26,49 +35,208 @@ class BackupConfigExecutor(models.Model):
     def execute_backup(self):
         for rec in self.filtered("backup_enabled"):
             if not rec.master_password_token:
-                rec._create_log("error", _("Sin contraseña maestra configurada."))
+                rec._log_run("error", _("Sin contraseña maestra configurada."))
                 continue
+            clock = metrics.PhaseClock()
             try:
-                master_pwd = rec._decrypt_pwd(rec.master_password_token)
-                self._validate_master(master_pwd)
+                with clock.phase("password"):
+                    master_pwd = rec._decrypt_pwd(rec.master_password_token)
+                    self._validate_master(master_pwd)
             except Exception as exc:
-                rec._create_log("error", _("Contraseña inválida: %s") % exc)
+                rec._log_run("error", _("Contraseña inválida: %s") % exc, **clock.fields())
                 continue
 
-            db_name = self.env.cr.dbname
-            now = datetime.datetime.now()
-            filename = f"db_backup_{db_name}_{now.strftime('%Y_%m_%d_%H%M%S')}.zip"
-            filepath = os.path.join(rec.backup_path, filename)
-
-            cmd = [
-                "curl", "--silent", "--fail", "--show-error",
-                "-X", "POST",
-                "-F", f"master_pwd={master_pwd}",
-                "-F", f"name={db_name}",
-                "-F", "backup_format=zip",
-                "-o", filepath,
-                "http://localhost:8069/web/database/backup",
-            ]
+            databases = rec._target_databases()
+            if not databases:
+                rec._log_run("warning", _("Ninguna base coincide con el filtro."))
+                continue
 
-            try:
-                res = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-                if res.returncode != 0:
-                    rec._create_log("error", _("Fallo CURL: %s") % res.stderr.strip())
-                    continue
+            sources = rec._preflight_check(databases)
+            if sources is None:
+                continue
 
-                if not os.path.isfile(filepath):
-                    rec._create_log("error", _("Archivo no generado."))
-                    continue
+            started = time.monotonic()
+            if rec.database_scope == "current" and not rec.cpu_nice:
+                results = [rec._with_deadline()._backup_database(databases[0])]
+            else:
+                results = rec._run_pool(databases)
+            for res in results:
+                res["source_bytes"] = sources.get(res["database"], 0)
 
-                size_mb = f"{round(os.path.getsize(filepath)/1024**2,2)} MB"
-                rec._create_log("success", _("Backup OK"), filepath, size_mb)
+            if rec.database_scope == "current":
+                results[0]["phases"].update(clock.fields())
+                rec._record_result(results[0], summary=True)
+            else:
+                for res in results:
+                    rec._record_result(res)
+                rec._create_run_report(results, time.monotonic() - started, clock.fields())
+            if not self.env.context.get("backup_job_id"):
+                # en segundo plano se fijó al encolar: no bloquear la fila durante el volcado
                 rec.last_execution_date = fields.Datetime.now()
 
+    def _target_databases(self) -> List[str]:
+        """Bases que respalda esta configuración, según «database_scope»."""
+        if self.database_scope == "current":
+            return [self.env.cr.dbname]
+        names = db.list_dbs(force=True)
+        if self.database_scope == "list":
+            patterns = [p.strip() for p in (self.database_filter or "").split(",") if p.strip()]
+            names = [n for n in names if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+        return sorted(names)
+
+    def _with_deadline(self):
+        """Recordset con el tiempo límite por base (si hay) en el contexto."""
+        if not self.db_timeout_minutes:
+            return self
+        return self.with_context(backup_deadline=time.monotonic() + self.db_timeout_minutes * 60)
+
+    def _backup_database(self, db_name: str) -> dict:
+        """
+        Respalda ``db_name`` en la ruta de destino y en los destinos
+        adicionales (un solo volcado). No escribe en la base: el resultado se
+        retorna para que lo registre el hilo principal.
+        """
+        now = datetime.datetime.now()
+        filename = f"db_backup_{db_name}_{now.strftime('%Y_%m_%d_%H%M%S')}{self._backup_suffix()}"
+        paths = [os.path.join(root, filename) for root in self._backup_roots()]
+        result = {"database": db_name, "path": paths[0], "error": None, "targets": []}
+
+        started = time.monotonic()
+        clock = metrics.PhaseClock()
+        try:
+            with metrics.measuring(clock):
+                result["targets"] = self._dump_to_paths(db_name, paths)
+        except Exception as exc:
+            _logger.exception("Fallo del volcado de %s", db_name)
+            for path in paths:
+                self._discard_partial(path)
+            result["error"] = str(exc)
+        result["duration"] = round(time.monotonic() - started, 2)
+        result["phases"] = clock.fields()
+        return result
+
+    # ───────────────────────────────────────────────────────────────
+    #  VARIAS BASES: pool de hilos acotado
+    # ───────────────────────────────────────────────────────────────
+    def _run_pool(self, databases: List[str]) -> List[dict]:
+        """
+        Respalda ``databases`` con hasta ``max_workers`` hilos y a lo sumo
+        ``host_concurrency`` volcados simultáneos por servidor PostgreSQL.
+        Los resultados se retornan en el orden de ``databases``.
+        """
+        limit = self.host_concurrency or len(databases)
+        host_slots = defaultdict(lambda: threading.BoundedSemaphore(limit))
+        for name in databases:
+            host_slots[_db_host(name)]      # crear los semáforos antes de lanzar hilos
+
+        workers = min(self.max_workers, len(databases))
+        _logger.info("Backup de %s bases con %s hilos (%s)", len(databases), workers, self.name)
+        with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="backup") as pool:
+            futures = [
+                pool.submit(self._pool_worker, name, host_slots[_db_host(name)])
+                for name in databases
+            ]
+        results = []
+        for name, future in zip(databases, futures):
+            try:
+                results.append(future.result())
             except Exception as exc:
-                rec._create_log("error", _("Excepción: %s") % exc)
+                _logger.exception("Fallo del hilo de backup de %s", name)
+                results.append({
+                    "database": name, "path": None, "error": str(exc),
+                    "targets": [], "duration": 0.0, "phases": {},
+                })
+        return results
+
+    def _pool_worker(self, db_name: str, slot: threading.BoundedSemaphore) -> dict:
+        # cada hilo usa su propio cursor: el del hilo principal no es seguro entre hilos
+        with slot, self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            rec = self.with_env(env)
+            # el hilo se descarta al terminar: la prioridad no se restaura
+            rec._lower_thread_priority()
+            return rec._with_deadline()._backup_database(db_name)
+
+    # ───────────────────────────────────────────────────────────────
+    #  REGISTRO DE RESULTADOS
+    # ───────────────────────────────────────────────────────────────
+    def _record_result(self, res: dict, summary: bool = False) -> None:
+        """
+        Un registro por destino. Los tiempos por fase van sólo en el primero:
+        el volcado se hizo una vez. Con ``summary`` el primero completa el
+        resumen de la ejecución.
+        """
+        log = self._log_run if summary else self._create_log
+        if res["error"]:
+            log(
+                "error", _("Fallo del volcado: %s") % res["error"],
+                database=res["database"], duration=res["duration"], **res["phases"],
+            )
+            return
+        phases = {**res["phases"], "source_bytes": res.get("source_bytes", 0)}
+        for target in res["targets"]:
+            common = {
+                "database": res["database"],
+                "destination": os.path.dirname(target["path"]),
+                "duration": res["duration"],
+                **phases,
+            }
+            if target["error"]:
+                log(
+                    "error", _("Fallo de la copia en %(path)s: %(error)s") % target,
+                    target["path"], **common,
+                )
+            else:
+                written = target["written"]
+                log(
+                    "success", _("Backup OK"), target["path"],
+                    throughput_mbps=_throughput(written, res["duration"]),
+                    dump_jobs=self.dump_jobs if self.backup_format in ("directory", "snapshot") else 0,
+                    codec=self._effective_codec(),
+                    size_bytes=written,
+                    checksum=target["checksum"],
+                    **common,
+                )
+                self._register_artifact(target["path"], written, target["checksum"])
+            log, phases = self._create_log, {}
+
+    def _create_run_report(self, results: List[dict], elapsed: float, phases: dict) -> None:
+        """Informe agregado de una ejecución sobre varias bases."""
+        failed = [r for r in results if not _written(r)]
+        # bytes generados (una vez por base, no por destino)
+        written = sum(_written(r) for r in results)
+        lines = [
+            _("%(ok)s de %(total)s bases respaldadas en %(secs)s s.") % {
+                "ok": len(results) - len(failed), "total": len(results), "secs": round(elapsed),
+            }
+        ]
+        partial = False
+        for r in results:
+            if r["error"]:
+                lines.append(f"✗ {r['database']}: {r['error']}")
+                continue
+            for target in r["targets"]:
+                if target["error"]:
+                    partial = True
+                    lines.append(f"✗ {r['database']} → {target['path']}: {target['error']}")
+            if _written(r):
+                lines.append(f"✓ {r['database']}: {round(_written(r)/1024**2, 2)} MB, {r['duration']} s")
+        if not failed and not partial:
+            status = "success"
+        elif len(failed) < len(results):
+            status = "warning"
+        else:
+            status = "error"
+        self._log_run(
+            status, "\n".join(lines),
+            size_bytes=written,
+            duration=round(elapsed, 2),
+            throughput_mbps=_throughput(written, elapsed),
+            **phases,
+        )
 
     # ───────────────────────────────────────────────────────────────
-    #  PLANIFICACIÓN (cron_hourly en XML)
+    #  PLANIFICACIÓN: «next_run_at» indexado (cron cada minuto en XML)
     # ───────────────────────────────────────────────────────────────
     def _parse_run_hours(self) -> Set[int]:
         out: Set[int] = set()
@@ -80,28 +248,88 @@ class BackupConfigExecutor(models.Model):
                     out.add(n)
         return out
 
-    def _should_execute_now(self, now: datetime.datetime) -> bool:
+    def _schedule_expression(self) -> schedule.CronExpression:
+        """Expresión cron equivalente al modo de programación (salvo «interval»)."""
+        # 23:59:59 redondea a 24:00 → 00:00 (no «23:00»)
+        hour, minute = divmod(int(round(self.run_time * 60)), 60)
+        hour %= 24
+        if self.schedule_mode == "cron":
+            return schedule.CronExpression(self.cron_expression or "")
         if self.schedule_mode == "hours":
-            hours = self._parse_run_hours()
-            if not hours or now.hour not in hours:
-                return False
-            last = self.last_execution_date
-            return not last or not (last.date() == now.date() and last.hour == now.hour)
-
-        if not self.last_execution_date:
-            return True
-        delta = relativedelta(now, self.last_execution_date)
-        return (
-            (self.schedule_mode == "daily"   and delta.days   >= 1) or
-            (self.schedule_mode == "weekly"  and delta.days   >= 7) or
-            (self.schedule_mode == "monthly" and delta.months >= 1)
-        )
+            hours = ",".join(str(h) for h in sorted(self._parse_run_hours())) or "0"
+            return schedule.CronExpression(f"0 {hours} * * *")
+        if self.schedule_mode == "weekly":
+            # cron: domingo = 0; run_weekday: lunes = 0
+            weekday = (int(self.run_weekday or 0) + 1) % 7
+            return schedule.CronExpression(f"{minute} {hour} * * {weekday}")
+        if self.schedule_mode == "monthly":
+            return schedule.CronExpression(f"{minute} {hour} 1 * *")
+        return schedule.CronExpression(f"{minute} {hour} * * *")
+
+    def _next_run_after(self, moment: datetime.datetime) -> datetime.datetime:
+        """
+        Próxima ejecución posterior a ``moment`` (UTC sin zona, como los
+        Datetime de Odoo), calculada en la zona horaria de la configuración y
+        con la dispersión aleatoria sumada.
+        """
+        tz = pytz.timezone(self.schedule_tz or "UTC")
+        local = pytz.utc.localize(moment).astimezone(tz).replace(tzinfo=None)
+        if self.schedule_mode == "interval":
+            nxt = schedule.next_interval(local, max(self.interval_minutes, 1))
+        else:
+            nxt = self._schedule_expression().next_after(local)
+        nxt = tz.localize(nxt).astimezone(pytz.utc).replace(tzinfo=None)
+        if self.jitter_minutes:
+            nxt += datetime.timedelta(seconds=random.randint(0, self.jitter_minutes * 60))
+        return nxt
+
+    def _reschedule(self, after: datetime.datetime | None = None) -> None:
+        """
+        Recalcula ``next_run_at``. Se parte de la hora actual y no de la última
+        ejecución, de modo que los horarios no se corren con la duración ni
+        con la dispersión.
+        """
+        after = after or fields.Datetime.now()
+        for rec in self:
+            next_run = False
+            if rec.backup_enabled:
+                try:
+                    next_run = rec._next_run_after(after)
+                except ValueError as exc:
+                    _logger.warning("Programación inválida en %s: %s", rec.name, exc)
+            rec.next_run_at = next_run
+
+    def _should_execute_now(self, now: datetime.datetime) -> bool:
+        return bool(self.next_run_at) and self.next_run_at <= now
 
     @api.model
     def cron_execute_backups(self):
+        """
+        Encola las configuraciones vencidas; los backups los ejecuta
+        «cron_run_backup_jobs». Sólo se leen las filas con ``next_run_at``
+        cumplido (consulta por índice).
+        """
         now = fields.Datetime.now()
-        for rec in self.search([("backup_enabled", "=", True)]):
-            if not rec._should_execute_now(now):
-                _logger.info(f"BackupConfigExecutor: No ejecutar aún backup para {rec.name} ({rec.id})")
-                continue
-            rec.execute_backup()
+        # configuraciones anteriores a next_run_at: se programan en la primera pasada
+        self.search([("backup_enabled", "=", True), ("next_run_at", "=", False)])._reschedule(now)
+        due = self.search([
+            ("backup_enabled", "=", True),
+            ("next_run_at", "<=", now),
+        ], order="next_run_at")
+        due._enqueue_backup()
+
+
+def _throughput(written: int, seconds: float) -> float:
+    """MB/s efectivos (incluye pausas por el límite de escritura)."""
+    return round(written / 1024 ** 2 / seconds, 2) if seconds > 0 else 0.0
+
+
+def _written(res: dict) -> int:
+    """Bytes del backup de una base (0 si no quedó en ningún destino)."""
+    return max((t["written"] for t in res.get("targets", ()) if not t["error"]), default=0)
+
+
+def _db_host(db_name: str) -> str:
+    """Servidor PostgreSQL de ``db_name`` (clave de los límites por servidor)."""
+    _db, info = connection_info_for(db_name)
+    return f"{info.get('host') or 'local'}:{info.get('port') or 5432}"
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+history.py –  Historial acotado
+• Un cron diario recalcula las estadísticas diarias de los últimos días
+  (``backup.log.daily``) y depura el historial de cada configuración pasados
+  ``log_keep_days`` días.
+• Antes de borrar, los días afectados se resumen; se depuran días completos
+  y ``logs_pruned_before`` marca el límite para que no vuelvan a
+  recalcularse desde un historial incompleto.
+• Se conserva siempre el último registro de cada base y destino (las
+  métricas «último backup» lo necesitan) y los trabajos en cola o en curso.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+
+from odoo import api, fields, models  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+# días recientes que se recalculan en cada pasada (trabajos que terminan tarde)
+_REFRESH_DAYS = 3
+
+
+class BackupConfigHistory(models.Model):
+    _inherit = "backup.config"
+
+    log_keep_days = fields.Integer(
+        string="Conservar historial (días)", default=365,
+        help="Los registros más antiguos se eliminan; sus totales diarios quedan en "
+             "las estadísticas. 0 = conservar todo.",
+    )
+    logs_pruned_before = fields.Date(
+        string="Historial depurado hasta", readonly=True,
+        help="Los días anteriores sólo están en las estadísticas diarias.",
+    )
+
+    def prune_logs(self):
+        daily = self.env["backup.log.daily"]
+        today = fields.Date.today()
+        for rec in self.filtered(lambda r: r.log_keep_days > 0):
+            cutoff = today - datetime.timedelta(days=rec.log_keep_days)
+            if rec.logs_pruned_before and rec.logs_pruned_before >= cutoff:
+                continue
+            daily._refresh(since=rec.logs_pruned_before, until=cutoff, config_ids=rec.ids)
+            self.env.cr.execute("""
+                DELETE FROM backup_log
+                 WHERE config_id = %(config)s AND create_date < %(cutoff)s
+                   AND state NOT IN ('queued', 'running')
+                   AND id NOT IN (
+                     SELECT DISTINCT ON (database, destination) id
+                       FROM backup_log
+                      WHERE config_id = %(config)s AND operation = 'backup' AND status IS NOT NULL
+                      ORDER BY database, destination, create_date DESC
+                   )
+            """, {"config": rec.id, "cutoff": cutoff})
+            _logger.info("Historial de %s: %s registros anteriores a %s depurados",
+                         rec.name, self.env.cr.rowcount, cutoff)
+            rec.logs_pruned_before = cutoff
+        self.env["backup.log"].invalidate_model()
+
+    @api.model
+    def cron_maintain_history(self):
+        today = fields.Date.today()
+        self.env["backup.log.daily"]._refresh(since=today - datetime.timedelta(days=_REFRESH_DAYS))
+        self.search([("log_keep_days", ">", 0)]).prune_logs()
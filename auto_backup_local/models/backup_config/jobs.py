@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+jobs.py –  Backups en segundo plano: cola de trabajos sobre «backup.log»
+• El cron de programación sólo encola (una fila de historial en estado «queued») y
+  termina enseguida. La verificación de integridad y los simulacros de
+  restauración se encolan igual: releer o restaurar cientos de GB no cabe
+  en una pasada de cron.
+• Un cron aparte toma un trabajo, lo marca en curso y lanza ``job_runner.py``
+  en un proceso propio que lo ejecuta: el cron termina enseguida y el
+  volcado no queda sujeto a ``limit_time_real_cron`` ni al reciclado del
+  worker (``limit_memory_soft``, ``limit_request``).
+• El proceso del trabajo retiene un bloqueo consultivo de sesión mientras
+  vive; si muere, PostgreSQL lo libera y el trabajo se da por fallido.
+• La fila del trabajo (avance, resultado y estado final) se escribe siempre
+  con cursores cortos aparte: la transacción del volcado nunca la modifica,
+  así que no choca con las actualizaciones ya confirmadas.
+• La cancelación se pide desde el historial y se atiende en el siguiente
+  reporte de avance.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import odoo  # type: ignore
+from odoo import api, fields, models, _  # type: ignore
+from odoo.exceptions import UserError  # type: ignore
+from odoo.tools import config  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+# espacio de nombres de los bloqueos consultivos de los trabajos
+_JOB_LOCK = 0x6B42
+# frecuencia máxima con la que se escribe el avance en la base
+_REPORT_EVERY = 5.0
+# margen para que el proceso recién lanzado cargue el registro y tome su bloqueo
+_SPAWN_GRACE = 600
+
+_RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "job_runner.py")
+# conexión a PostgreSQL que hereda el proceso del trabajo (ver job_runner.py)
+_DB_OPTIONS = ("db_host", "db_port", "db_user", "db_password", "db_sslmode")
+_RUNNER_ENV_DB = "AUTO_BACKUP_JOB_DB"
+
+# procesos lanzados desde este worker, para recoger su estado de salida
+_CHILDREN: List[subprocess.Popen] = []
+
+# operación → (interruptor de la configuración, método que la ejecuta)
+_JOB_OPERATIONS = {
+    "backup": ("backup_enabled", "execute_backup"),
+    "verify": ("verify_enabled", "verify_backups"),
+    "drill": ("drill_enabled", "run_restore_drill"),
+}
+
+# reporteros de los trabajos en curso en este proceso (por id de backup.log)
+_REPORTERS: Dict[int, "JobReporter"] = {}
+
+
+class JobReporter:
+    """
+    Avance de un trabajo, compartido por los hilos que respaldan sus bases.
+    Escribe en su propio cursor (y confirma) para que el avance se vea desde
+    otras sesiones mientras la transacción del volcado sigue abierta.
+    """
+
+    def __init__(self, registry, job_id: int):
+        self.registry = registry
+        self.job_id = job_id
+        self.cancelled = False
+        self._streams: Dict[str, int] = {}
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, phase: str, total: int, force: bool = False) -> None:
+        with self._lock:
+            self._streams[phase] = total
+            now = time.monotonic()
+            due = force or now - self._last >= _REPORT_EVERY
+            if due:
+                self._last = now
+                done = sum(self._streams.values())
+        if due:
+            self._flush(phase, done)
+        if self.cancelled:
+            raise UserError(_("Backup cancelado."))
+
+    def _flush(self, phase: str, done: int) -> None:
+        try:
+            with self.registry.cursor() as cr:
+                cr.execute(
+                    "UPDATE backup_log SET phase = %s, progress_bytes = %s "
+                    "WHERE id = %s RETURNING cancel_requested",
+                    (phase, done, self.job_id),
+                )
+                row = cr.fetchone()
+        except Exception:
+            # el avance es informativo: no interrumpir el volcado por él
+            _logger.warning("No se pudo publicar el avance del backup %s", self.job_id, exc_info=True)
+            return
+        self.cancelled = bool(row and row[0])
+
+
+class BackupConfigJobs(models.Model):
+    _inherit = "backup.config"
+
+    # ───────────────────────────────────────────────────────────────
+    #  ENCOLADO
+    # ───────────────────────────────────────────────────────────────
+    def _enqueue_job(self, operation: str = "backup"):
+        """Encola ``operation`` para cada configuración que no la tenga pendiente."""
+        Log = self.env["backup.log"].sudo()
+        jobs = Log
+        for rec in self:
+            if Log.search_count([
+                ("config_id", "=", rec.id),
+                ("operation", "=", operation),
+                ("state", "in", ("queued", "running")),
+            ]):
+                _logger.info("%s de %s ya en cola o en curso", operation, rec.name)
+                continue
+            jobs |= Log.create({
+                "config_id": rec.id,
+                "operation": operation,
+                "state": "queued",
+                "message": _("En cola"),
+            })
+        if jobs:
+            self.env.ref("auto_backup_local.ir_cron_run_backup_jobs")._trigger()
+        return jobs
+
+    def _enqueue_backup(self):
+        """Encola un backup de cada configuración que no tenga uno pendiente."""
+        for rec in self:
+            rec._reschedule()
+        jobs = self._enqueue_job("backup")
+        jobs.config_id.write({"last_execution_date": fields.Datetime.now()})
+        return jobs
+
+    def action_enqueue_backup(self):
+        """Botón «Ejecutar ahora»."""
+        jobs = self.filtered("backup_enabled")._enqueue_backup()
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("Backups en cola"),
+            "res_model": "backup.log",
+            "view_mode": "tree,form",
+            "domain": [("id", "in", jobs.ids)],
+        }
+
+    # ───────────────────────────────────────────────────────────────
+    #  EJECUCIÓN (cron «Ejecutar backups en cola»)
+    # ───────────────────────────────────────────────────────────────
+    @api.model
+    def cron_run_backup_jobs(self):
+        """Toma los trabajos más antiguos de la cola y los lanza en procesos aparte."""
+        _CHILDREN[:] = [proc for proc in _CHILDREN if proc.poll() is None]
+        self._fail_orphan_jobs()
+        while True:
+            job_id = self._claim_job()
+            if not job_id:
+                return
+            try:
+                self._spawn_job(job_id)
+            except OSError as exc:
+                _logger.exception("No se pudo lanzar el trabajo de backup %s", job_id)
+                self._write_job(job_id, {
+                    "state": "failed", "status": "error", "phase": False,
+                    "message": _("No se pudo lanzar el proceso del backup: %s") % exc,
+                })
+
+    def _spawn_job(self, job_id: int) -> None:
+        """Lanza ``job_runner.py`` con la configuración de este servidor."""
+        cmd = [sys.executable, _RUNNER, "--job", str(job_id), "-d", self.env.cr.dbname,
+               "--addons-path", config["addons_path"]]
+        if config.rcfile and os.path.exists(config.rcfile):
+            cmd += ["-c", config.rcfile]
+        for option, flag in (("data_dir", "--data-dir"), ("logfile", "--logfile")):
+            if config[option]:
+                cmd += [flag, config[option]]
+        env = dict(os.environ)
+        # odoo importable aunque el servidor corra desde un checkout (odoo-bin)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [
+            os.path.dirname(os.path.dirname(odoo.__file__)), env.get("PYTHONPATH"),
+        ]))
+        env[_RUNNER_ENV_DB] = json.dumps({opt: config[opt] for opt in _DB_OPTIONS if config.get(opt)})
+        # sesión propia: las señales al grupo del worker no alcanzan al trabajo
+        _CHILDREN.append(subprocess.Popen(
+            cmd, env=env, stdin=subprocess.DEVNULL, close_fds=True, start_new_session=True,
+        ))
+        _logger.info("Trabajo de backup %s lanzado en un proceso aparte", job_id)
+
+    def _run_job_process(self, job_id: int) -> None:
+        """Punto de entrada de ``job_runner.py``, ya en el proceso del trabajo."""
+        cr = self.env.cr
+        # bloqueo de sesión: sobrevive a los commits del volcado y se libera si el proceso muere
+        cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (_JOB_LOCK, job_id))
+        if not cr.fetchone()[0]:
+            _logger.warning("Trabajo de backup %s ya tomado por otro proceso", job_id)
+            return
+        try:
+            self._run_job(job_id)
+        finally:
+            cr.execute("SELECT pg_advisory_unlock(%s, %s)", (_JOB_LOCK, job_id))
+
+    def _run_job(self, job_id: int) -> None:
+        job = self.env["backup.log"].sudo().browse(job_id)
+        rec = job.config_id
+        flag, method = _JOB_OPERATIONS[job.operation]
+        enabled = rec.backup_enabled and rec[flag]
+        reporter = JobReporter(self.pool, job_id)
+        _REPORTERS[job_id] = reporter
+        try:
+            if enabled:
+                getattr(rec.with_context(backup_job_id=job_id), method)()
+            # historial, catálogo y fechas quedan confirmados antes del estado final
+            self.env.cr.commit()
+        except Exception as exc:
+            _logger.exception("Fallo del trabajo de backup %s", job_id)
+            self.env.cr.rollback()
+            self._write_job(job_id, {"status": "error", "message": str(exc)})
+        finally:
+            _REPORTERS.pop(job_id, None)
+
+        with self.pool.cursor() as cr:
+            cr.execute("SELECT status, cancel_requested FROM backup_log WHERE id = %s", (job_id,))
+            status, cancel_requested = cr.fetchone()
+        if cancel_requested or not enabled:
+            state = "cancelled"
+        elif status == "error":
+            state = "failed"
+        else:
+            state = "done"
+        vals = {"state": state, "phase": False}
+        if state == "done" and not status:
+            # p. ej. una verificación sin backups pendientes
+            vals.update(status="success", message=_("Nada pendiente."))
+        self._write_job(job_id, vals)
+
+        # un trabajo por pasada: el siguiente lo toma una nueva pasada del cron
+        if self.env["backup.log"].sudo().search_count([("state", "=", "queued")]):
+            self.env.ref("auto_backup_local.ir_cron_run_backup_jobs")._trigger()
+
+    def _claim_job(self):
+        """
+        Id del trabajo marcado como en curso, o None. Los trabajos compiten
+        por disco y E/S: no se toma uno mientras haya otro de la misma
+        operación en curso (un backup no espera a una verificación).
+        """
+        with self.pool.cursor() as cr:
+            cr.execute("""
+                SELECT id FROM backup_log q
+                 WHERE state = 'queued'
+                   AND NOT EXISTS (SELECT 1 FROM backup_log r
+                                    WHERE r.state = 'running' AND r.operation = q.operation)
+                 ORDER BY id
+            """)
+            for (job_id,) in cr.fetchall():
+                # otra pasada pudo tomarlo entre medio
+                cr.execute(
+                    "UPDATE backup_log SET state = 'running', started_at = now() at time zone 'UTC' "
+                    "WHERE id = %s AND state = 'queued'",
+                    (job_id,),
+                )
+                if cr.rowcount:
+                    return job_id
+        return None
+
+    def _fail_orphan_jobs(self) -> None:
+        """
+        Trabajos «running» cuyo proceso ya no existe: nadie retiene su
+        bloqueo y pasó el margen para que el proceso lanzado lo tome.
+        """
+        with self.pool.cursor() as cr:
+            Log = self.env(cr=cr)["backup.log"].sudo()
+            grace = fields.Datetime.subtract(fields.Datetime.now(), seconds=_SPAWN_GRACE)
+            for job in Log.search([("state", "=", "running"), ("started_at", "<", grace)]):
+                cr.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", (_JOB_LOCK, job.id))
+                if cr.fetchone()[0]:
+                    _logger.warning("Trabajo de backup %s interrumpido", job.id)
+                    job.write({
+                        "state": "failed",
+                        "status": "error",
+                        "phase": False,
+                        "message": _("El proceso que ejecutaba el backup se interrumpió."),
+                    })
+
+    def _write_job(self, job_id: int, vals: dict) -> None:
+        """Escribe la fila del trabajo en una transacción corta y confirmada."""
+        with self.pool.cursor() as cr:
+            self.env(cr=cr)["backup.log"].sudo().browse(job_id).write(vals)
+        self.env["backup.log"].browse(job_id).invalidate_recordset()
+
+    # ───────────────────────────────────────────────────────────────
+    #  AVANCE Y REGISTRO
+    # ───────────────────────────────────────────────────────────────
+    def _report_job(self, phase: str, total: int, force: bool = False) -> None:
+        """Publica el avance del trabajo en curso y corta si se canceló."""
+        reporter = _REPORTERS.get(self.env.context.get("backup_job_id"))
+        if reporter:
+            reporter.update(phase, total, force)
+
+    def _log_run(self, status: str, message: str, path: str | None = None, **extra):
+        """
+        Registro que resume una ejecución: en segundo plano se completa la fila
+        del trabajo; en una ejecución directa se crea una nueva.
+        """
+        job_id = self.env.context.get("backup_job_id")
+        if not job_id:
+            return self._create_log(status, message, path, **extra)
+        self._write_job(job_id, self._log_vals(status, message, path, **extra))
+        return self.env["backup.log"].sudo().browse(job_id)
@@ -7,88 +7,129 @@ from __future__ import annotations
 
 import datetime
 import logging
+import math
 import os
-import re
-import shutil
+import time
 from collections import defaultdict
 
 from odoo import api, models, _  # type: ignore
 
-_logger = logging.getLogger(__name__)
+from ...tools import metrics
+from .catalog import remove_backup_files
 
-_DATE_RGX = re.compile(r"db_backup_.*?_(\d{4})_(\d{2})_(\d{2})_\d{6}\.zip$")
+_logger = logging.getLogger(__name__)
 
 
 class BackupConfigRetention(models.Model):
     _inherit = "backup.config"
 
+    # ───────────────────────────────────────────────────────────────
+    #  PLANIFICACIÓN (sobre el catálogo backup.artifact)
+    # ───────────────────────────────────────────────────────────────
+    def _retention_plan(self, today: datetime.date | None = None):
+        """Backups catalogados de esta configuración que la política G-F-S descarta."""
+        self.ensure_one()
+        Artifact = self.env["backup.artifact"].sudo()
+        today = today or datetime.date.today()
+        artifacts = Artifact.search([("config_id", "=", self.id)], order="backup_date")
+
+        daily_n   = max(self.daily_keep_for_days, 0)
+        weekly_n  = max(self.weekly_keep_for_weeks, 0)
+        monthly_n = max(self.monthly_keep_for_months, 0)
+
+        keep_daily   = defaultdict(list)
+        keep_weekly  = defaultdict(list)
+        keep_monthly = defaultdict(list)
+        doomed = set()
+
+        # el orden por backup_date deja el último de cada período al final;
+        # con varias bases o destinos, cada par conserva su propio backup por período
+        for art in artifacts:
+            f_date = art.backup_date.date()
+            age_days = (today - f_date).days
+            db_key = (os.path.dirname(art.path), art.database or "")
+            if daily_n and age_days < daily_n:
+                keep_daily[(*db_key, f_date)].append(art.id);  continue
+            if weekly_n and age_days < weekly_n * 7:
+                keep_weekly[(*db_key, *f_date.isocalendar()[:2])].append(art.id);  continue
+            if monthly_n and age_days < monthly_n * 30:
+                keep_monthly[(*db_key, f_date.year, f_date.month)].append(art.id);  continue
+            doomed.add(art.id)
+
+        for bucket in (keep_daily, keep_weekly, keep_monthly):
+            for ids in bucket.values():
+                doomed.update(ids[:-1])
+
+        # incrementales y diferenciales: conservar de lo que depende cada backup que queda
+        pending = [a for a in artifacts if a.id not in doomed]
+        while pending:
+            art = pending.pop()
+            for dep in art.parent_id | art.base_id:
+                if dep.id in doomed:
+                    doomed.discard(dep.id)
+                    pending.append(dep)
+
+        return Artifact.browse([a.id for a in artifacts if a.id in doomed])
+
+    def action_preview_cleanup(self):
+        """Vista previa (sin borrar nada) de lo que eliminaría la limpieza."""
+        self.ensure_one()
+        plan = self._retention_plan() if self.cleanup_enabled else self.env["backup.artifact"]
+        return {
+            "type": "ir.actions.act_window",
+            "name": _("Backups que se eliminarían"),
+            "res_model": "backup.artifact",
+            "view_mode": "tree,form",
+            "domain": [("id", "in", plan.ids)],
+            "context": {"create": False},
+        }
+
     # ───────────────────────────────────────────────────────────────
     #  LIMPIEZA
     # ───────────────────────────────────────────────────────────────
     def cleanup_backups(self):
         for rec in self:
-                
+
             if not rec.cleanup_enabled:
-                return
-
-            base_dir = rec.backup_path
-            today = datetime.date.today()
-            _logger.info("Limpieza de backups en %s (%s)", base_dir, rec.name)
-
-            # 1) recolectar ZIPs con fecha -------------------------------
-            dated_files = []
-            for root, _, files in os.walk(base_dir):
-                for fname in files:
-                    m = _DATE_RGX.match(fname)
-                    if m:
-                        y, mth, d = map(int, m.groups())
-                        try:
-                            f_date = datetime.date(y, mth, d)
-                        except ValueError:
-                            continue
-                        dated_files.append((f_date, os.path.join(root, fname)))
-
-            if not dated_files:
-                _logger.info("No hay backups para limpiar.")
-                return
-
-            # 2) buckets G-F-S ------------------------------------------
-            daily_n   = max(rec.daily_keep_for_days, 0)
-            weekly_n  = max(rec.weekly_keep_for_weeks, 0)
-            monthly_n = max(rec.monthly_keep_for_months, 0)
-
-            keep_daily   = defaultdict(list)
-            keep_weekly  = defaultdict(list)
-            keep_monthly = defaultdict(list)
-            delete_list  = []
-
-            for f_date, f_path in dated_files:
-                age_days = (today - f_date).days
-                if daily_n and age_days < daily_n:
-                    keep_daily[f_date].append((f_date, f_path));  continue
-                if weekly_n and age_days < weekly_n * 7:
-                    keep_weekly[f_date.isocalendar()[:2]].append((f_date, f_path));  continue
-                if monthly_n and age_days < monthly_n * 30:
-                    keep_monthly[(f_date.year, f_date.month)].append((f_date, f_path));  continue
-                delete_list.append(f_path)
-
-            def _others(bucket):
-                for _, lst in bucket.items():
-                    lst.sort()
-                    yield from (p for _, p in lst[:-1])
-
-            delete_list.extend(_others(keep_daily))
-            delete_list.extend(_others(keep_weekly))
-            delete_list.extend(_others(keep_monthly))
-
-            _logger.info("Archivos a eliminar: %s", len(delete_list))
-
-            # 3) eliminar -----------------------------------------------
-            for fp in delete_list:
-                try:
-                    os.remove(fp)
-                except Exception as exc:
-                    _logger.warning(f"Error al eliminar {fp}: {exc}")
+                continue
+
+            _logger.info("Limpieza de backups en %s (%s)", ", ".join(rec._backup_roots()), rec.name)
+
+            started = time.monotonic()
+            clock = metrics.PhaseClock()
+            with clock.phase("retention"):
+                delete_list = rec._retention_plan()
+                if not delete_list:
+                    _logger.info("No hay backups para limpiar.")
+                    continue
+
+                _logger.info("Archivos a eliminar: %s", len(delete_list))
+
+                removed = self.env["backup.artifact"]
+                for art in delete_list:
+                    try:
+                        remove_backup_files(art.path)
+                        removed |= art
+                    except Exception as exc:
+                        _logger.warning(f"Error al eliminar {art.path}: {exc}")
+                clock.count("retention", int(sum(removed.mapped("size_bytes"))))
+                count = len(removed)
+                removed.unlink()
+
+                # bloques sin referencia (cada destino tiene su repositorio)
+                if rec.storage_mode == "chunks" and removed:
+                    for base_dir in rec._backup_roots():
+                        rec._gc_chunk_store(base_dir)
+
+            rec._create_log(
+                "success" if count == len(delete_list) else "warning",
+                _("Limpieza: %(done)s de %(total)s backups eliminados.") % {
+                    "done": count, "total": len(delete_list),
+                },
+                operation="cleanup",
+                duration=round(time.monotonic() - started, 2),
+                **clock.fields(),
+            )
 
 
     # cron diario (XML → modelo.cron_clean_backups())
@@ -96,4 +137,28 @@ class BackupConfigRetention(models.Model):
     def cron_clean_backups(self):
         for rec in self.search([("backup_enabled", "=", True)]):
             _logger.info("LIMPIEZA de backups para %s", rec.name)
+            if not rec.last_reconcile_date:
+                # primera limpieza: catalogar lo que ya había en disco
+                rec.reconcile_artifacts()
             rec.cleanup_backups()
+
+
+def retained_count(daily_n: int, weekly_n: int, monthly_n: int, runs_per_day: float) -> int:
+    """
+    Backups que conserva ``_retention_plan`` por base y destino en régimen,
+    con ``runs_per_day`` ejecuciones diarias en promedio. Cada ventana
+    (diaria, semanal, mensual) guarda uno por período, si hubo alguno.
+    """
+    daily_n, weekly_n, monthly_n = max(daily_n, 0), max(weekly_n, 0), max(monthly_n, 0)
+    windows = []
+    start = 0
+    for end, period in ((daily_n, 1), (weekly_n * 7, 7), (monthly_n * 30, 30)):
+        if end > start:
+            windows.append((end - start, period))
+            start = end
+    total = 0
+    for days, period in windows:
+        # un período más: los límites no coinciden con semanas ni meses calendario
+        periods = math.ceil(days / period) + (period > 1)
+        total += min(periods, math.ceil(days * runs_per_day))
+    return total
@@ -17,15 +17,49 @@ from typing import List
 
 from cryptography.fernet import Fernet  # type: ignore
 from odoo import _, api, fields, models  # type: ignore
+from odoo.addons.base.models.res_partner import _tz_get  # type: ignore
 from odoo.exceptions import ValidationError  # type: ignore
 from odoo.service import db  # type: ignore
 
+from ...tools import compression, schedule
+
 _logger = logging.getLogger(__name__)
 
 _HOUR_RGX = re.compile(r"^(\d|1\d|2[0-3])(,\s*(\d|1\d|2[0-3]))*$")
 _MAX_DAY   = 365     # 1 año
 _MAX_WEEK  = 104     # 2 años
 _MAX_MONTH = 60      # 5 años
+_MAX_JOBS  = 64      # procesos pg_dump en paralelo
+_MAX_WORKERS = 32    # bases respaldadas en simultáneo
+_MAX_LEVEL = {"gzip": 9, "zstd": 22, "lz4": 16}
+_MAX_NICE  = 19
+_MAX_JITTER = 720    # minutos
+# campos que cambian la próxima ejecución
+_SCHEDULE_FIELDS = {
+    "backup_enabled", "schedule_mode", "run_hours", "run_time", "run_weekday",
+    "interval_minutes", "cron_expression", "schedule_tz", "jitter_minutes",
+}
+
+
+def check_backup_dir(path: str) -> None:
+    """Valida una ruta de destino (la principal o una adicional)."""
+    # 1) absoluta
+    if not path or not path.startswith("/"):
+        raise ValidationError(_("La ruta debe ser absoluta (ej.: /mnt/backups)."))
+
+    # 2) existe
+    if not os.path.isdir(path):
+        raise ValidationError(_(
+            "La ruta '%s' no existe. Cree el directorio manualmente y "
+            "asegúrese de montarlo como volumen si usa Docker."
+        ) % path)
+
+    # 3) permisos de escritura
+    if not os.access(path, os.W_OK):
+        raise ValidationError(_(
+            "Odoo no tiene permisos de escritura en '%s'. "
+            "Cambie la ruta o ajuste los permisos (chown / chmod)."
+        ) % path)
 
 
 class BackupConfig(models.Model):
@@ -47,22 +81,244 @@ class BackupConfig(models.Model):
             ("weekly", "Semanal"),
             ("monthly", "Mensual"),
             ("hours", "Varias horas fijas"),
+            ("interval", "Cada N minutos"),
+            ("cron", "Expresión cron"),
         ],
         default="daily",
         required=True,
     )
+    run_time = fields.Float(
+        string="Hora de ejecución", default=2.0,
+        help="Hora del día (modos diario, semanal y mensual). El mensual corre el día 1.",
+    )
+    run_weekday = fields.Selection(
+        [
+            ("0", "Lunes"),
+            ("1", "Martes"),
+            ("2", "Miércoles"),
+            ("3", "Jueves"),
+            ("4", "Viernes"),
+            ("5", "Sábado"),
+            ("6", "Domingo"),
+        ],
+        string="Día de la semana",
+        default="0",
+    )
+    interval_minutes = fields.Integer(
+        string="Cada (minutos)", default=60,
+        help="Las ejecuciones caen en múltiplos fijos del intervalo (p. ej. cada 30 "
+             "minutos: hh:00 y hh:30), sin correrse por la duración del backup.",
+    )
+    cron_expression = fields.Char(
+        string="Expresión cron",
+        help="5 campos: minuto hora día-del-mes mes día-de-la-semana.\n"
+             "Ej.: «30 2 * * 1-5» = 02:30 de lunes a viernes; «*/15 8-18 * * *».",
+    )
+    schedule_tz = fields.Selection(
+        _tz_get, string="Zona horaria",
+        default=lambda self: self.env.user.tz or "UTC",
+        required=True,
+    )
+    jitter_minutes = fields.Integer(
+        string="Dispersión (minutos)", default=0,
+        help="Demora aleatoria entre 0 y este valor que se suma a cada ejecución, para "
+             "que varias configuraciones con el mismo horario no arranquen a la vez.",
+    )
+    next_run_at = fields.Datetime(
+        string="Próxima ejecución", readonly=True, copy=False, index=True,
+        help="Se recalcula al guardar y después de cada ejecución; el cron sólo "
+             "consulta las configuraciones vencidas.",
+    )
     run_hours = fields.Char(
         string="Horas (HH,HH,HH)",
         help=(
             "Lista de horas en formato 0-23 separadas por comas.\n"
             "Ej.: 0,5,8,17,21\n"
             "Esto quiere decir que se ejecutará a las 0,5,8,17,21 hs\n"
-            "Considera que la hora depende de la zona horaria configurada en Odoo."
+            "Las horas se interpretan en la zona horaria de la configuración."
         )
     )
 
     last_execution_date = fields.Datetime(string="Última ejecución", readonly=True)
 
+    # Formato del volcado
+    backup_format = fields.Selection(
+        [
+            ("zip", "ZIP (pg_dump + filestore)"),
+            ("directory", "Directorio paralelo (pg_dump -Fd)"),
+            ("snapshot", "Instantánea (pg_dump -Fd + filestore con enlaces duros)"),
+        ],
+        string="Formato",
+        default="zip",
+        required=True,
+        help="ZIP: un único archivo, compatible con el gestor de bases de Odoo.\n"
+             "Directorio paralelo: pg_dump en formato directorio con N procesos y el "
+             "filestore en un .tar aparte; se restaura también en paralelo.\n"
+             "Instantánea: como el directorio paralelo, pero el filestore queda como un "
+             "árbol navegable en el que los archivos sin cambios son enlaces duros a la "
+             "instantánea anterior; cada una es un punto de restauración completo y sólo "
+             "ocupa lo que cambió. Los destinos deben admitir enlaces duros.",
+    )
+    dump_jobs = fields.Integer(
+        string="Procesos paralelos", default=4,
+        help="Cantidad de procesos de pg_dump / pg_restore (--jobs). "
+             "Sólo aplica a los formatos directorio e instantánea.",
+    )
+    compression_codec = fields.Selection(
+        [
+            ("deflate", "ZIP deflate (estándar de Odoo)"),
+            ("none", "Sin compresión"),
+            ("gzip", "gzip"),
+            ("zstd", "zstd multihilo"),
+            ("lz4", "lz4"),
+        ],
+        string="Compresión",
+        default="deflate",
+        required=True,
+        help="Códec aplicado al flujo mientras se genera el backup. Con gzip, zstd o lz4 "
+             "el ZIP se escribe sin comprimir y el códec lo envuelve por completo; la "
+             "extensión del archivo lo indica (p. ej. .zip.zst).\n"
+             "En formato directorio se aplica a filestore.tar (pg_dump comprime sus "
+             "tablas por su cuenta).\n"
+             "zstd requiere el paquete Python «zstandard» y lz4 el paquete «lz4».",
+    )
+    compression_level = fields.Integer(
+        string="Nivel de compresión", default=0,
+        help="0 = nivel por defecto del códec (gzip 6, zstd 3, lz4 0).",
+    )
+    compression_threads = fields.Integer(
+        string="Hilos de compresión", default=0,
+        help="Sólo zstd. 0 = un hilo por CPU.",
+    )
+    storage_mode = fields.Selection(
+        [
+            ("files", "Archivos independientes"),
+            ("chunks", "Repositorio deduplicado"),
+        ],
+        string="Almacenamiento",
+        default="files",
+        required=True,
+        help="Repositorio deduplicado: cada backup se corta en bloques definidos por su "
+             "contenido y cada bloque único se guarda una sola vez en «.chunks/» dentro "
+             "de la ruta de destino. El backup queda como un índice .idx pequeño y la "
+             "limpieza elimina los bloques que ya no usa ningún índice.",
+    )
+    volume_size_mb = fields.Integer(
+        string="Volúmenes de (MB)", default=0,
+        help="0 = un único archivo. Con un valor, el ZIP se corta en volúmenes de ese "
+             "tamaño dentro de un directorio .vol, cada uno con su SHA-256. Cada volumen "
+             "se arma en el directorio temporal del servidor y recién completo se copia a "
+             "los destinos: un error de escritura reintenta sólo ese volumen.",
+    )
+    encrypt_backups = fields.Boolean(
+        string="Cifrar backups", default=False,
+        help="Cifra el ZIP mientras se escribe (AES-256-GCM por bloques, en paralelo con "
+             "la compresión); la extensión termina en .enc. La clave de cada backup se "
+             "deriva de la clave del módulo (parámetro «auto_backup_local.fernet_key»): "
+             "guarde una copia fuera de esta base, sin ella los backups no se pueden "
+             "restaurar en otro servidor.",
+    )
+    parallel_filestore = fields.Boolean(
+        string="Volcado y filestore en paralelo", default=True,
+        help="pg_dump y el archivado del filestore corren a la vez, ambos sobre el mismo "
+             "instante (snapshot exportado de PostgreSQL y los adjuntos que referencia). "
+             "En formato ZIP el SQL se vuelca primero a un archivo temporal en la ruta "
+             "de destino.",
+    )
+    filestore_mode = fields.Selection(
+        [
+            ("full", "Completo en cada backup"),
+            ("incremental", "Incremental (sólo cambios)"),
+        ],
+        string="Filestore",
+        default="full",
+        required=True,
+        help="Incremental: se mantiene un índice del filestore junto a los backups y "
+             "cada ejecución archiva sólo los adjuntos nuevos o modificados, además de "
+             "registrar los eliminados. Para restaurar se aplica el último completo y "
+             "la cadena de incrementales.",
+    )
+    filestore_full_every = fields.Integer(
+        string="Completo cada (backups)", default=24,
+        help="Cantidad de incrementales tras la cual se vuelve a archivar el "
+             "filestore completo, acotando la longitud de la cadena.",
+    )
+    db_dump_mode = fields.Selection(
+        [
+            ("full", "Completo en cada backup"),
+            ("differential", "Diferencial por tabla"),
+        ],
+        string="Volcado de la base",
+        default="full",
+        required=True,
+        help="Diferencial (formatos directorio e instantánea): según las estadísticas de "
+             "PostgreSQL sólo se vuelcan los datos de las tablas que cambiaron desde el "
+             "último completo. Para restaurar se aplica el completo y el diferencial. "
+             "Un cambio de esquema fuerza un completo.",
+    )
+    db_full_every = fields.Integer(
+        string="Volcado completo cada (backups)", default=24,
+        help="Cantidad de diferenciales tras la cual se vuelve a volcar la base completa.",
+    )
+
+    # Bases de datos a respaldar
+    database_scope = fields.Selection(
+        [
+            ("current", "Sólo la base actual"),
+            ("all", "Todas las bases del servidor"),
+            ("list", "Bases que coinciden con un filtro"),
+        ],
+        string="Bases de datos",
+        default="current",
+        required=True,
+        help="Con varias bases, cada una se respalda en su propio archivo "
+             "(db_backup_<base>_<fecha>) y la ejecución deja además un informe "
+             "agregado en el historial.",
+    )
+    database_filter = fields.Char(
+        string="Filtro de bases",
+        help="Patrones separados por comas, con comodines * y ?.\n"
+             "Ej.: cliente_*, demo",
+    )
+    max_workers = fields.Integer(
+        string="Bases en paralelo", default=4,
+        help="Cantidad máxima de bases que se respaldan al mismo tiempo.",
+    )
+    host_concurrency = fields.Integer(
+        string="Máx. por servidor PostgreSQL", default=0,
+        help="Volcados simultáneos contra un mismo servidor PostgreSQL. 0 = sin límite "
+             "adicional al de «Bases en paralelo».",
+    )
+    db_timeout_minutes = fields.Integer(
+        string="Tiempo límite por base (min)", default=0,
+        help="Un volcado que lo supera se cancela y se registra como error; el resto "
+             "de las bases continúa. 0 = sin límite.",
+    )
+
+    # Consumo de recursos
+    throttle_mbps = fields.Float(
+        string="Límite de escritura (MB/s)", default=0.0,
+        help="Caudal máximo con el que se escribe el backup en la ruta de destino, sumando "
+             "todas las bases que se respaldan en paralelo. 0 = sin límite.\n"
+             "En formato directorio no aplica a pg_dump, que escribe por su cuenta.",
+    )
+    cpu_nice = fields.Integer(
+        string="Prioridad de CPU (nice)", default=0,
+        help="0 = normal, 19 = la más baja. Se aplica a pg_dump y a los hilos que "
+             "comprimen y archivan el backup.",
+    )
+    io_priority = fields.Selection(
+        [
+            ("normal", "Normal"),
+            ("low", "Baja (best-effort 7)"),
+            ("idle", "Sólo con disco ocioso"),
+        ],
+        string="Prioridad de E/S",
+        default="normal",
+        required=True,
+        help="Clase de ionice para pg_dump (Linux, requiere la utilidad «ionice»).",
+    )
+
     # Retención parametrizable
     cleanup_enabled = fields.Boolean(string="Limpiar backups", default=True)
 
@@ -92,8 +348,8 @@ class BackupConfig(models.Model):
     # ───────────────────────────────────────────────────────────────
     #  Utilidades de cifrado
     # ───────────────────────────────────────────────────────────────
-    def _get_fernet(self) -> Fernet:
-        """Obtiene (o crea) la clave Fernet y retorna un objeto Fernet."""
+    def _fernet_key(self) -> str:
+        """Obtiene (o crea) la clave Fernet global, codificada en base64."""
         Param = self.env["ir.config_parameter"].sudo()
         key_b64 = Param.get_param(self._KEY_PARAM)
         if not key_b64:
@@ -101,7 +357,19 @@ class BackupConfig(models.Model):
             key_b64 = base64.urlsafe_b64encode(random_bytes).decode()
             Param.set_param(self._KEY_PARAM, key_b64)
             _logger.info("Se generó nueva FERNET_KEY y se guardó en ir.config_parameter.")
-        return Fernet(key_b64.encode())
+        return key_b64
+
+    def _get_fernet(self) -> Fernet:
+        """Retorna un objeto Fernet con la clave global."""
+        return Fernet(self._fernet_key().encode())
+
+    def _archive_secret(self, key_b64: str | None = None) -> bytes:
+        """
+        Secreto del que se derivan las claves de los backups cifrados: la
+        clave Fernet global, u otra (``key_b64``) para restaurar en un
+        servidor distinto.
+        """
+        return base64.urlsafe_b64decode((key_b64 or self._fernet_key()).encode())
 
     @staticmethod
     def _validate_master(pwd: str) -> None:
@@ -128,25 +396,7 @@ class BackupConfig(models.Model):
         • Debe ser escribible por el proceso de Odoo.
         """
         for rec in self:
-            path = rec.backup_path
-
-            # 1) absoluta
-            if not path or not path.startswith("/"):
-                raise ValidationError(_("La ruta debe ser absoluta (ej.: /mnt/backups)."))
-
-            # 2) existe
-            if not os.path.isdir(path):
-                raise ValidationError(_(
-                    "La ruta '%s' no existe. Cree el directorio manualmente y "
-                    "asegúrese de montarlo como volumen si usa Docker."
-                ) % path)
-
-            # 3) permisos de escritura
-            if not os.access(path, os.W_OK):
-                raise ValidationError(_(
-                    "Odoo no tiene permisos de escritura en '%s'. "
-                    "Cambie la ruta o ajuste los permisos (chown / chmod)."
-                ) % path)
+            check_backup_dir(rec.backup_path)
 
     @api.constrains("run_hours", "schedule_mode")
     def _check_run_hours(self):
@@ -173,6 +423,129 @@ class BackupConfig(models.Model):
             if len(set(hours)) != len(hours):
                 raise ValidationError(_("Las horas no deben repetirse."))
 
+    @api.constrains(
+        "schedule_mode", "run_time", "interval_minutes", "cron_expression", "jitter_minutes",
+    )
+    def _check_schedule(self):
+        for rec in self:
+            if not 0 <= rec.run_time < 24:
+                raise ValidationError(_("La hora de ejecución debe estar entre 00:00 y 23:59."))
+            if rec.schedule_mode == "interval" and rec.interval_minutes < 1:
+                raise ValidationError(_("El intervalo debe ser de al menos 1 minuto."))
+            if rec.schedule_mode == "cron":
+                try:
+                    # p. ej. «0 0 30 2 *»: sintaxis válida pero nunca se cumple
+                    schedule.CronExpression(rec.cron_expression or "").next_after(fields.Datetime.now())
+                except ValueError as exc:
+                    raise ValidationError(str(exc))
+            if not 0 <= rec.jitter_minutes <= _MAX_JITTER:
+                raise ValidationError(_(
+                    "La dispersión debe estar entre 0 y %s minutos."
+                ) % _MAX_JITTER)
+
+    @api.constrains("dump_jobs", "backup_format")
+    def _check_dump_jobs(self):
+        for rec in self:
+            if rec.backup_format not in ("directory", "snapshot"):
+                continue
+            if not 1 <= rec.dump_jobs <= _MAX_JOBS:
+                raise ValidationError(_(
+                    "Los procesos paralelos deben estar entre 1 y %s."
+                ) % _MAX_JOBS)
+
+    @api.constrains("compression_codec", "compression_level", "compression_threads")
+    def _check_compression(self):
+        for rec in self:
+            codec = rec.compression_codec
+            if codec != "deflate" and not compression.available(codec):
+                raise ValidationError(_(
+                    "El códec %(codec)s requiere el paquete Python «%(pkg)s» en el servidor."
+                ) % {"codec": codec, "pkg": compression.PYTHON_MODULES.get(codec, codec)})
+            max_level = _MAX_LEVEL.get(codec, 0)
+            if not 0 <= rec.compression_level <= max_level:
+                raise ValidationError(_(
+                    "El nivel de compresión para %(codec)s debe estar entre 0 y %(max)s."
+                ) % {"codec": codec, "max": max_level})
+            if rec.compression_threads < 0:
+                raise ValidationError(_("Los hilos de compresión no pueden ser negativos."))
+
+    @api.constrains("storage_mode", "backup_format")
+    def _check_storage_mode(self):
+        for rec in self:
+            if rec.storage_mode == "chunks" and rec.backup_format != "zip":
+                raise ValidationError(_(
+                    "El repositorio deduplicado sólo admite el formato ZIP."
+                ))
+
+    @api.constrains("volume_size_mb", "storage_mode", "backup_format")
+    def _check_volume_size(self):
+        for rec in self:
+            if not rec.volume_size_mb:
+                continue
+            if rec.volume_size_mb < 0:
+                raise ValidationError(_("El tamaño de volumen no puede ser negativo."))
+            if rec.backup_format != "zip" or rec.storage_mode != "files":
+                raise ValidationError(_(
+                    "Los volúmenes sólo se aplican al formato ZIP en archivos independientes."
+                ))
+
+    @api.constrains("encrypt_backups", "storage_mode", "backup_format")
+    def _check_encrypt_backups(self):
+        for rec in self:
+            if rec.encrypt_backups and (rec.backup_format != "zip" or rec.storage_mode != "files"):
+                raise ValidationError(_(
+                    "El cifrado sólo se aplica al formato ZIP en archivos independientes."
+                ))
+
+    @api.constrains("filestore_full_every", "filestore_mode")
+    def _check_filestore_full_every(self):
+        for rec in self:
+            if rec.filestore_mode == "incremental" and rec.filestore_full_every < 1:
+                raise ValidationError(_(
+                    "«Completo cada» debe ser al menos 1."
+                ))
+
+    @api.constrains("db_dump_mode", "db_full_every", "backup_format")
+    def _check_db_dump_mode(self):
+        for rec in self:
+            if rec.db_dump_mode != "differential":
+                continue
+            if rec.backup_format not in ("directory", "snapshot"):
+                raise ValidationError(_(
+                    "El volcado diferencial requiere el formato directorio o instantánea."
+                ))
+            if rec.db_full_every < 1:
+                raise ValidationError(_(
+                    "«Volcado completo cada» debe ser al menos 1."
+                ))
+
+    @api.constrains(
+        "database_scope", "database_filter", "max_workers",
+        "host_concurrency", "db_timeout_minutes",
+    )
+    def _check_database_scope(self):
+        for rec in self:
+            if rec.database_scope == "list" and not (rec.database_filter or "").strip(" ,"):
+                raise ValidationError(_("Indique al menos un patrón en «Filtro de bases»."))
+            if not 1 <= rec.max_workers <= _MAX_WORKERS:
+                raise ValidationError(_(
+                    "Las bases en paralelo deben estar entre 1 y %s."
+                ) % _MAX_WORKERS)
+            if rec.host_concurrency < 0 or rec.db_timeout_minutes < 0:
+                raise ValidationError(_(
+                    "El límite por servidor y el tiempo límite no pueden ser negativos."
+                ))
+
+    @api.constrains("throttle_mbps", "cpu_nice")
+    def _check_resources(self):
+        for rec in self:
+            if rec.throttle_mbps < 0:
+                raise ValidationError(_("El límite de escritura no puede ser negativo."))
+            if not 0 <= rec.cpu_nice <= _MAX_NICE:
+                raise ValidationError(_(
+                    "La prioridad de CPU debe estar entre 0 y %s."
+                ) % _MAX_NICE)
+
     @api.constrains(
         "daily_keep_for_days",
         "weekly_keep_for_weeks",
@@ -233,23 +606,31 @@ class BackupConfig(models.Model):
             if pwd:
                 self._validate_master(pwd)
                 vals["master_password_token"] = self._encrypt_pwd(pwd)
-        return super().create(vals_list)
+        records = super().create(vals_list)
+        records._reschedule()
+        return records
 
     def write(self, vals):
         pwd = vals.pop("master_password_input", False)
         if pwd:
             self._validate_master(pwd)
             vals["master_password_token"] = self._encrypt_pwd(pwd)
-        return super().write(vals)
+        res = super().write(vals)
+        if _SCHEDULE_FIELDS.intersection(vals) and "next_run_at" not in vals:
+            self._reschedule()
+        return res
 
     # ───────────────────────────────────────────────────────────────
     #  Registro de resultados
     # ───────────────────────────────────────────────────────────────
-    def _create_log(self, status: str, message: str, path: str | None = None, size: str | None = None):
-        self.env["backup.log"].sudo().create({
+    def _log_vals(self, status: str, message: str, path: str | None = None, **extra) -> dict:
+        return {
             "config_id": self.id,
             "status": status,
             "message": message,
             "file_path": path,
-            "file_size": size,
-        })
+            **extra,
+        }
+
+    def _create_log(self, status: str, message: str, path: str | None = None, **extra):
+        return self.env["backup.log"].sudo().create(self._log_vals(status, message, path, **extra))
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+verification.py –  Verificación periódica de integridad y simulacros de restauración
+• La verificación relee los backups catalogados y los compara con el SHA-256
+  registrado al escribirlos. Es incremental: sólo los nuevos o los que no se
+  verifican hace ``verify_every_days``, hasta ``verify_budget_gb`` por
+  ejecución.
+• El simulacro restaura el backup íntegro más reciente en una base de
+  prueba, mide el tiempo (RTO) y la elimina.
+• Los crons diarios sólo encolan: ambos corren como trabajos en segundo
+  plano (``jobs``), fuera de los límites de tiempo del cron.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+
+from odoo import api, fields, models, _  # type: ignore
+from odoo.exceptions import UserError  # type: ignore
+from odoo.modules.neutralize import neutralize_database  # type: ignore
+from odoo.service import db  # type: ignore
+from odoo.sql_db import db_connect  # type: ignore
+
+from ...tools import compression, encryption, integrity
+from .engine import _CHECKSUM_SIDECAR, _decode_backup, _join_volumes
+
+_logger = logging.getLogger(__name__)
+
+_GB = 1024 ** 3
+
+
+class BackupConfigVerification(models.Model):
+    _inherit = "backup.config"
+
+    verify_enabled = fields.Boolean(string="Verificar backups guardados", default=True)
+    verify_every_days = fields.Integer(
+        string="Volver a verificar cada (días)", default=30,
+        help="Un backup ya verificado vuelve a leerse pasado este plazo.",
+    )
+    verify_budget_gb = fields.Integer(
+        string="Lectura máxima por ejecución (GB)", default=100,
+        help="La verificación diaria se detiene al superar este volumen; lo pendiente "
+             "sigue al día siguiente, empezando por lo nunca verificado.",
+    )
+    drill_enabled = fields.Boolean(
+        string="Simulacros de restauración", default=False,
+        help="Restaura periódicamente el backup más reciente en una base de prueba, "
+             "registra el tiempo de restauración y elimina la base.",
+    )
+    drill_every_days = fields.Integer(string="Simulacro cada (días)", default=7)
+    last_drill_date = fields.Datetime(string="Último simulacro", readonly=True)
+
+    # ───────────────────────────────────────────────────────────────
+    #  VERIFICACIÓN DE INTEGRIDAD
+    # ───────────────────────────────────────────────────────────────
+    def _artifacts_to_verify(self):
+        """Nunca verificados primero (los más nuevos antes), luego los más antiguos."""
+        limit = fields.Datetime.now() - datetime.timedelta(days=max(self.verify_every_days, 1))
+        return self.env["backup.artifact"].sudo().search([
+            ("config_id", "=", self.id),
+            "|", ("verified_at", "=", False), ("verified_at", "<", limit),
+        ], order="verified_at asc nulls first, backup_date desc")
+
+    def verify_backups(self):
+        for rec in self:
+            started = time.monotonic()
+            budget = integrity.Budget(max(rec.verify_budget_gb, 0) * _GB)
+            checked, corrupt = 0, []
+            for art in rec._artifacts_to_verify():
+                # un backup no se verifica a medias: se empieza sólo si cabe
+                # (o si es el primero, para que uno grande no quede siempre afuera)
+                if checked and art.size_bytes > budget.remaining:
+                    break
+                rec._report_job(_("Verificación"), budget.used)
+                problems = rec._verify_artifact(art, budget)
+                checked += 1
+                if problems:
+                    corrupt.append(f"✗ {art.path}: {'; '.join(problems[:5])}")
+            if not checked:
+                continue
+            elapsed = time.monotonic() - started
+            lines = [
+                _("%(n)s backups verificados, %(gb)s GB leídos en %(secs)s s.") % {
+                    "n": checked, "gb": round(budget.used / _GB, 2), "secs": round(elapsed),
+                }
+            ] + corrupt
+            rec._log_run(
+                "error" if corrupt else "success", "\n".join(lines),
+                operation="verify",
+                size_bytes=budget.used,
+                duration=round(elapsed, 2),
+                throughput_mbps=round(budget.used / 1024 ** 2 / elapsed, 2) if elapsed > 0 else 0.0,
+            )
+
+    def _verify_artifact(self, art, budget: integrity.Budget) -> list:
+        """Verifica ``art`` y deja el resultado en el catálogo. Retorna los problemas."""
+        expected = art.checksum or _sidecar_checksum(art.path)
+        store = self._chunk_store(os.path.dirname(art.path)) if art.kind == "chunks" else None
+        try:
+            problems, digest = integrity.verify(art.path, art.kind, expected, budget, store=store)
+        except (OSError, ValueError) as exc:
+            problems, digest = [str(exc)], expected
+        if problems:
+            _logger.error("Backup dañado %s: %s", art.path, "; ".join(problems))
+        vals = {
+            "verified_at": fields.Datetime.now(),
+            "verify_state": "ok" if not problems else ("missing" if not os.path.exists(art.path) else "corrupt"),
+            "verify_message": "; ".join(problems)[:500] or False,
+        }
+        if not art.checksum and digest:
+            # catalogado por reconciliación: queda como referencia para la próxima vez
+            vals["checksum"] = digest
+        art.write(vals)
+        return problems
+
+    @api.model
+    def cron_verify_backups(self):
+        self.search([("backup_enabled", "=", True), ("verify_enabled", "=", True)])._enqueue_job("verify")
+
+    # ───────────────────────────────────────────────────────────────
+    #  SIMULACRO DE RESTAURACIÓN
+    # ───────────────────────────────────────────────────────────────
+    def _drill_database(self) -> str:
+        return f"{self.env.cr.dbname}_restore_drill_{self.id}"
+
+    def run_restore_drill(self):
+        for rec in self:
+            prefix = rec.backup_path.rstrip(os.sep) + os.sep
+            art = self.env["backup.artifact"].sudo().search([
+                ("config_id", "=", rec.id),
+                ("path", "=like", prefix + "%"),
+                ("verify_state", "!=", "corrupt"),
+            ], order="backup_date desc").filtered(lambda a: a.path.startswith(prefix))[:1]
+            if not art:
+                rec._log_run("warning", _("Simulacro: no hay backups catalogados."), operation="drill")
+                rec.last_drill_date = fields.Datetime.now()
+                continue
+            scratch = rec._drill_database()
+            if db.exp_db_exist(scratch):
+                db.exp_drop(scratch)     # restos de un simulacro interrumpido
+
+            rec._report_job(_("Simulacro %s") % art.name, 0, force=True)
+            started = time.monotonic()
+            try:
+                rec._restore_artifact(art, scratch)
+                restore_seconds = time.monotonic() - started
+                modules = _installed_modules(scratch)
+            except Exception as exc:
+                _logger.exception("Fallo del simulacro de restauración de %s", art.path)
+                rec._log_run(
+                    "error", _("Simulacro: fallo al restaurar %(path)s: %(error)s") % {
+                        "path": art.path, "error": exc,
+                    },
+                    art.path, operation="drill", database=art.database,
+                    duration=round(time.monotonic() - started, 2),
+                )
+                # registrado: un fallo de restauración también cuenta como simulacro hecho
+                rec.last_drill_date = fields.Datetime.now()
+                continue
+            finally:
+                if db.exp_db_exist(scratch):
+                    db.exp_drop(scratch)
+            rec._log_run(
+                "success", _(
+                    "Simulacro: %(name)s restaurado en %(secs)s s (%(modules)s módulos instalados)."
+                ) % {"name": art.name, "secs": round(restore_seconds), "modules": modules},
+                art.path, operation="drill", database=art.database,
+                size_bytes=art.size_bytes,
+                restore_seconds=round(restore_seconds, 2),
+                duration=round(time.monotonic() - started, 2),
+                throughput_mbps=round(art.size_bytes / 1024 ** 2 / restore_seconds, 2) if restore_seconds > 0 else 0.0,
+            )
+            # recién ahora: un simulacro que se cae a mitad de camino se reintenta
+            rec.last_drill_date = fields.Datetime.now()
+
+    def _restore_artifact(self, art, db_name: str) -> None:
+        """Restaura ``art`` en la base nueva ``db_name`` (neutralizada: sin correos ni crons)."""
+        if art.kind in ("directory", "snapshot"):
+            self.restore_directory_backup(art.path, db_name, jobs=self.dump_jobs)
+            with db_connect(db_name).cursor() as cr:
+                neutralize_database(cr)
+            return
+        if art.kind == "zip" and compression.codec_from_path(art.path) == "none" \
+                and not encryption.is_encrypted(art.path):
+            db.restore_db(db_name, art.path, copy=True, neutralize_database=True)
+        else:
+            with tempfile.NamedTemporaryFile(dir=self.backup_path, suffix=".zip") as tmp:
+                if art.kind == "chunks":
+                    self._materialize_chunks(art.path, tmp)
+                elif art.kind == "volumes":
+                    _join_volumes(art.path, tmp, self._archive_secret())
+                else:
+                    _decode_backup(art.path, tmp, self._archive_secret())
+                tmp.flush()
+                db.restore_db(db_name, tmp.name, copy=True, neutralize_database=True)
+        meta = self._read_increment_meta(art.path)
+        if meta and not meta.get("full"):
+            # el ZIP sólo trae los adjuntos del incremental
+            self.restore_filestore(art.path, db_name)
+
+    @api.model
+    def cron_restore_drills(self):
+        now = fields.Datetime.now()
+        due = self.search([("backup_enabled", "=", True), ("drill_enabled", "=", True)]).filtered(
+            lambda rec: not rec.last_drill_date
+            or rec.last_drill_date + datetime.timedelta(days=max(rec.drill_every_days, 1)) <= now
+        )
+        due._enqueue_job("drill")
+
+
+def _sidecar_checksum(path: str):
+    try:
+        with open(path + _CHECKSUM_SIDECAR) as fh:
+            return json.load(fh).get("digest")
+    except (OSError, ValueError):
+        return None
+
+
+def _installed_modules(db_name: str) -> int:
+    """Consulta mínima sobre la base restaurada: que responda y tenga módulos instalados."""
+    with db_connect(db_name).cursor() as cr:
+        cr.execute("SELECT count(*) FROM ir_module_module WHERE state = 'installed'")
+        count = cr.fetchone()[0]
+    if not count:
+        raise UserError(_("La base restaurada no tiene módulos instalados."))
+    return count
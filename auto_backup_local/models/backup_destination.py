@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+backup_destination.py
+=====================
+
+Destinos adicionales de una configuración. El volcado se hace una sola vez y
+se deja una copia en cada destino, con su propio registro en el historial y
+su propio SHA-256.
+"""
+
+import os
+
+from odoo import _, api, fields, models  # type: ignore
+from odoo.exceptions import ValidationError  # type: ignore
+
+from .backup_config.settings import check_backup_dir
+
+
+class BackupDestination(models.Model):
+    _name = "backup.destination"
+    _description = "Destino adicional de backups"
+    _order = "sequence, id"
+    _rec_name = "path"
+
+    config_id = fields.Many2one(
+        "backup.config",
+        string="Configuración",
+        ondelete="cascade",
+        required=True,
+        index=True,
+    )
+    sequence = fields.Integer(string="Secuencia", default=10)
+    path = fields.Char(string="Ruta", required=True)
+    enabled = fields.Boolean(string="Activo", default=True)
+
+    _sql_constraints = [
+        ("config_path_uniq", "unique(config_id, path)", "El destino ya está en la lista."),
+    ]
+
+    @api.constrains("path", "config_id")
+    def _check_path(self):
+        for rec in self:
+            check_backup_dir(rec.path)
+            main = (rec.config_id.backup_path or "").rstrip(os.sep)
+            if os.path.realpath(rec.path) == os.path.realpath(main or os.sep):
+                raise ValidationError(_(
+                    "El destino '%s' es la misma ruta principal de la configuración."
+                ) % rec.path)
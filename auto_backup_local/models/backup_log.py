@@ -4,9 +4,32 @@ backup_log.py
 =============
 
 Modelo de historial para los backups automáticos.
+
+El tamaño y la duración son numéricos; la lista se filtra y ordena con el
+índice (configuración, estado, fecha). Los días anteriores a la depuración
+de cada configuración sólo quedan en ``backup.log.daily``.
 """
 
-from odoo import api, fields, models  # type: ignore
+import calendar
+
+from odoo import api, fields, models, tools, _  # type: ignore
+from odoo.exceptions import UserError  # type: ignore
+
+from ..tools.metrics import PHASES
+
+_MB = 1024 ** 2
+
+STATUSES = [
+    ("success", "Éxito"),
+    ("warning", "Warning"),
+    ("error", "Error"),
+]
+OPERATIONS = [
+    ("backup", "Backup"),
+    ("cleanup", "Limpieza"),
+    ("verify", "Verificación"),
+    ("drill", "Simulacro de restauración"),
+]
 
 
 class BackupLog(models.Model):
@@ -34,16 +57,238 @@ class BackupLog(models.Model):
     #  Datos del evento
     # ---------------------------------------------------------------
     status = fields.Selection(
-        [
-            ("success", "Éxito"),
-            ("warning", "Warning"),
-            ("error", "Error"),
-        ],
+        STATUSES,
         string="Estado",
+        index=True,
+        help="Resultado del backup. Vacío mientras el trabajo está en cola o en curso.",
+    )
+    operation = fields.Selection(
+        OPERATIONS,
+        string="Operación",
+        default="backup",
         required=True,
         index=True,
     )
     message = fields.Text(string="Mensaje")
+    database = fields.Char(string="Base de datos", index=True)
+    destination = fields.Char(string="Destino", help="Directorio en el que quedó esta copia del backup.")
     file_path = fields.Char(string="Archivo")
-    file_size = fields.Char(string="Tamaño")
+    file_size = fields.Char(string="Tamaño", compute="_compute_file_size")
+    size_bytes = fields.Float(string="Bytes escritos", digits=(20, 0))
+    source_bytes = fields.Float(
+        string="Origen (bytes)", digits=(20, 0),
+        help="Tamaño de la base en PostgreSQL más el de su filestore al empezar. "
+             "Con los bytes escritos da la relación que usa la verificación de espacio.",
+    )
+    checksum = fields.Char(string="SHA-256")
+    duration = fields.Float(string="Duración (s)", digits=(16, 2))
+    throughput_mbps = fields.Float(string="Caudal (MB/s)", digits=(16, 2))
+    restore_seconds = fields.Float(
+        string="Restauración (s)", digits=(16, 2),
+        help="Simulacros: tiempo hasta tener la base restaurada (RTO medido).",
+    )
+    dump_jobs = fields.Integer(string="Procesos paralelos")
+    codec = fields.Char(string="Compresión")
     create_date = fields.Datetime(string="Fecha", readonly=True)
+
+    # ---------------------------------------------------------------
+    #  Tiempos y volúmenes por fase (tiempos exclusivos: no se solapan)
+    # ---------------------------------------------------------------
+    password_seconds = fields.Float(string="Contraseña (s)", digits=(16, 3))
+    password_bytes = fields.Float(string="Contraseña (bytes)", digits=(20, 0))
+    dump_seconds = fields.Float(string="pg_dump (s)", digits=(16, 3))
+    dump_bytes = fields.Float(string="pg_dump (bytes)", digits=(20, 0))
+    filestore_seconds = fields.Float(string="Filestore (s)", digits=(16, 3))
+    filestore_bytes = fields.Float(string="Filestore (bytes)", digits=(20, 0))
+    compress_seconds = fields.Float(string="Compresión (s)", digits=(16, 3))
+    compress_bytes = fields.Float(string="Compresión (bytes de entrada)", digits=(20, 0))
+    encrypt_seconds = fields.Float(string="Cifrado (s)", digits=(16, 3))
+    encrypt_bytes = fields.Float(string="Cifrado (bytes de entrada)", digits=(20, 0))
+    write_seconds = fields.Float(string="Escritura y fsync (s)", digits=(16, 3))
+    write_bytes = fields.Float(string="Escritura (bytes)", digits=(20, 0))
+    retention_seconds = fields.Float(string="Retención (s)", digits=(16, 3))
+    retention_bytes = fields.Float(string="Retención (bytes liberados)", digits=(20, 0))
+
+    # ---------------------------------------------------------------
+    #  Ejecución en segundo plano
+    # ---------------------------------------------------------------
+    state = fields.Selection(
+        [
+            ("queued", "En cola"),
+            ("running", "En curso"),
+            ("done", "Terminado"),
+            ("failed", "Fallido"),
+            ("cancelled", "Cancelado"),
+        ],
+        string="Trabajo",
+        default="done",
+        required=True,
+        index=True,
+    )
+    phase = fields.Char(string="Fase")
+    progress_bytes = fields.Float(string="Bytes procesados", digits=(20, 0))
+    started_at = fields.Datetime(string="Inicio")
+    cancel_requested = fields.Boolean(string="Cancelación pedida")
+
+    @api.depends("size_bytes")
+    def _compute_file_size(self):
+        for rec in self:
+            rec.file_size = f"{round(rec.size_bytes / _MB, 2)} MB" if rec.size_bytes else False
+
+    def init(self):
+        cr = self._cr
+        # la lista, los filtros por configuración y estado y la estimación de
+        # espacio consultan por estos campos ordenando por fecha
+        tools.create_index(
+            cr, "backup_log_config_status_date_idx",
+            self._table, ["config_id", "status", "create_date"],
+        )
+        tools.create_index(cr, "backup_log_create_date_idx", self._table, ["create_date"])
+        # versiones anteriores guardaban el tamaño como texto («12.5 MB»)
+        if tools.column_exists(cr, self._table, "file_size"):
+            cr.execute(r"""
+                UPDATE backup_log
+                   SET size_bytes = substring(file_size FROM '^([0-9.]+) MB$')::numeric * 1048576
+                 WHERE COALESCE(size_bytes, 0) = 0 AND file_size ~ '^[0-9]+(\.[0-9]+)? MB$'
+            """)
+            cr.execute("ALTER TABLE backup_log DROP COLUMN file_size")
+
+    # ---------------------------------------------------------------
+    #  Métricas (endpoint /auto_backup_local/metrics)
+    # ---------------------------------------------------------------
+    @api.model
+    def _metric_families(self):
+        """Series en el formato de ``tools.metrics.render``."""
+        self.flush_model()
+        cr = self.env.cr
+        phase_cols = ", ".join(f"l.{p}_seconds, l.{p}_bytes" for p in PHASES)
+        # último resultado por configuración, base y destino (base vacía = informe agregado)
+        cr.execute(f"""
+            SELECT DISTINCT ON (l.config_id, l.database, l.destination)
+                   l.config_id, c.name, COALESCE(l.database, ''), COALESCE(l.destination, ''),
+                   l.status, l.create_date,
+                   l.duration, l.size_bytes, l.throughput_mbps, {phase_cols}
+              FROM backup_log l
+              JOIN backup_config c ON c.id = l.config_id
+             WHERE l.operation = 'backup' AND l.status IS NOT NULL
+             ORDER BY l.config_id, l.database, l.destination, l.create_date DESC
+        """)
+        last = {name: [] for name in (
+            "timestamp", "success", "duration", "size", "throughput", "phase_s", "phase_b",
+        )}
+        for row in cr.fetchall():
+            config_id, name, database, destination, status, date, duration, size, mbps = row[:9]
+            labels = {
+                "config": name, "config_id": str(config_id),
+                "database": database, "destination": destination,
+            }
+            last["timestamp"].append((labels, calendar.timegm(date.utctimetuple())))
+            last["success"].append((labels, 1 if status == "success" else 0))
+            last["duration"].append((labels, duration or 0))
+            last["size"].append((labels, size or 0))
+            last["throughput"].append((labels, (mbps or 0) * _MB))
+            for i, phase in enumerate(PHASES):
+                seconds, nbytes = row[9 + 2 * i], row[10 + 2 * i]
+                if seconds:
+                    last["phase_s"].append(({**labels, "phase": phase}, seconds))
+                if nbytes:
+                    last["phase_b"].append(({**labels, "phase": phase}, nbytes))
+
+        # acumulados por configuración: los días ya depurados salen del
+        # resumen diario y el resto del historial, así los contadores no bajan
+        self.env["backup.log.daily"].flush_model()
+        cols = [f"{p}_{unit}" for p in PHASES for unit in ("seconds", "bytes")]
+        sums = ", ".join(f"SUM({col})" for col in cols)
+        cr.execute(f"""
+            SELECT t.config_id, c.name, t.operation, t.status, SUM(t.runs), SUM(t.duration), {sums}
+              FROM (
+                SELECT l.config_id, l.operation, l.status, COUNT(*) AS runs, SUM(l.duration) AS duration,
+                       {", ".join(f"SUM(l.{col}) AS {col}" for col in cols)}
+                  FROM backup_log l
+                  JOIN backup_config c ON c.id = l.config_id
+                 WHERE l.status IS NOT NULL
+                   AND (c.logs_pruned_before IS NULL OR l.create_date >= c.logs_pruned_before)
+                 GROUP BY l.config_id, l.operation, l.status
+                UNION ALL
+                SELECT d.config_id, d.operation, d.status, SUM(d.runs), SUM(d.duration),
+                       {", ".join(f"SUM(d.{col})" for col in cols)}
+                  FROM backup_log_daily d
+                  JOIN backup_config c ON c.id = d.config_id
+                 WHERE d.day < c.logs_pruned_before
+                 GROUP BY d.config_id, d.operation, d.status
+              ) t
+              JOIN backup_config c ON c.id = t.config_id
+             GROUP BY t.config_id, c.name, t.operation, t.status
+        """)
+        runs, durations, phase_s, phase_b = [], [], {}, {}
+        for row in cr.fetchall():
+            config_id, name, operation, status, count, duration = row[:6]
+            labels = {"config": name, "config_id": str(config_id)}
+            runs.append(({**labels, "operation": operation, "status": status}, count))
+            durations.append(({**labels, "operation": operation, "status": status}, duration or 0))
+            for i, phase in enumerate(PHASES):
+                key = (config_id, name, phase)
+                phase_s[key] = phase_s.get(key, 0) + (row[6 + 2 * i] or 0)
+                phase_b[key] = phase_b.get(key, 0) + (row[7 + 2 * i] or 0)
+
+        def _by_phase(values):
+            return [
+                ({"config": name, "config_id": str(config_id), "phase": phase}, value)
+                for (config_id, name, phase), value in sorted(values.items()) if value
+            ]
+
+        cr.execute("SELECT state, COUNT(*) FROM backup_log WHERE state IN ('queued', 'running') GROUP BY state")
+        jobs = dict(cr.fetchall())
+
+        # último simulacro de restauración OK por configuración (RTO medido)
+        cr.execute("""
+            SELECT DISTINCT ON (l.config_id) l.config_id, c.name, l.restore_seconds
+              FROM backup_log l
+              JOIN backup_config c ON c.id = l.config_id
+             WHERE l.operation = 'drill' AND l.status = 'success'
+             ORDER BY l.config_id, l.create_date DESC
+        """)
+        rto = [
+            ({"config": name, "config_id": str(config_id)}, seconds or 0)
+            for config_id, name, seconds in cr.fetchall()
+        ]
+
+        return [
+            ("auto_backup_last_timestamp_seconds", "gauge",
+             "Fecha (epoch) del último backup terminado.", last["timestamp"]),
+            ("auto_backup_last_success", "gauge",
+             "1 si el último backup terminó sin errores ni advertencias.", last["success"]),
+            ("auto_backup_last_duration_seconds", "gauge",
+             "Duración del último backup.", last["duration"]),
+            ("auto_backup_last_size_bytes", "gauge",
+             "Bytes escritos por el último backup.", last["size"]),
+            ("auto_backup_last_throughput_bytes_per_second", "gauge",
+             "Caudal efectivo del último backup.", last["throughput"]),
+            ("auto_backup_last_phase_seconds", "gauge",
+             "Tiempo exclusivo de cada fase en el último backup.", last["phase_s"]),
+            ("auto_backup_last_phase_bytes", "gauge",
+             "Bytes procesados por cada fase en el último backup.", last["phase_b"]),
+            ("auto_backup_runs_total", "counter",
+             "Ejecuciones registradas en el historial.", runs),
+            ("auto_backup_duration_seconds_total", "counter",
+             "Suma de las duraciones registradas.", durations),
+            ("auto_backup_phase_seconds_total", "counter",
+             "Suma de los tiempos de cada fase.", _by_phase(phase_s)),
+            ("auto_backup_phase_bytes_total", "counter",
+             "Suma de los bytes de cada fase.", _by_phase(phase_b)),
+            ("auto_backup_last_restore_seconds", "gauge",
+             "Duración de la restauración en el último simulacro (RTO).", rto),
+            ("auto_backup_jobs", "gauge",
+             "Trabajos de backup en cola o en curso.",
+             [({"state": state}, jobs.get(state, 0)) for state in ("queued", "running")]),
+        ]
+
+    def action_cancel(self):
+        """Cancela trabajos en cola; los que están en curso se detienen en su próximo avance."""
+        if self.filtered(lambda j: j.state not in ("queued", "running")):
+            raise UserError(_("Sólo se pueden cancelar trabajos en cola o en curso."))
+        self.filtered(lambda j: j.state == "queued").sudo().write({
+            "state": "cancelled",
+            "message": _("Cancelado antes de iniciar."),
+        })
+        self.filtered(lambda j: j.state == "running").sudo().write({"cancel_requested": True})
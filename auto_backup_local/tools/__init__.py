@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from . import streams             # escritores encadenables para el volcado
+from . import compression         # códecs de compresión en flujo
+from . import encryption          # cifrado en flujo de los backups
+from . import chunk_store         # repositorio de bloques deduplicados
+from . import filestore_index     # índice del filestore (incrementales)
+from . import metrics             # medición por fase y formato Prometheus
+from . import snapshot            # árboles con enlaces duros (instantáneas)
+from . import table_diff          # volcados diferenciales por tabla
+from . import volumes             # backups cortados en volúmenes
+from . import integrity           # verificación de backups guardados
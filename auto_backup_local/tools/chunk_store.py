@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+chunk_store.py –  Repositorio de bloques deduplicados (direccionado por contenido)
+• El volcado se corta en bloques definidos por su contenido, de modo que un
+  cambio sólo altera los bloques cercanos y el resto se reutiliza.
+• Cada bloque único se guarda una sola vez: ``<repo>/<sha[:2]>/<sha256>``
+  comprimido con zlib.
+• Cada backup queda reducido a un índice JSON con la lista de bloques.
+• ``<repo>/.lock`` (flock) ordena la reutilización de bloques frente al GC:
+  comprobar y tocar un bloque toma el bloqueo compartido y el GC el
+  exclusivo, así un bloque recién reutilizado nunca se elimina.
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import BinaryIO, Callable, Iterable, List, Optional, Set
+
+from .streams import fsync_dir
+
+INDEX_VERSION = 1
+
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 8 * 1024 ** 2
+# Se corta tras un salto de línea cuyo CRC cumpla la máscara: con líneas de
+# ~100 B (pg_dump en texto) da bloques de ~1 MB; en datos binarios los
+# saltos de línea caen cada ~256 B y se obtienen bloques de ~2 MB.
+BOUNDARY_MASK = 0x1FFF
+
+
+class ChunkStore:
+    """Repositorio de bloques ubicado en ``root``."""
+
+    def __init__(self, root: str, level: int = 3, throttle: Optional[Callable[[int], None]] = None):
+        self.root = root
+        self.level = level
+        self.throttle = throttle
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    @contextlib.contextmanager
+    def _locked(self, mode: int):
+        # un descriptor por llamada: flock es por descripción de archivo y los
+        # hilos de un mismo volcado no deben liberar el bloqueo de los demás
+        os.makedirs(self.root, exist_ok=True)
+        fd = os.open(os.path.join(self.root, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, mode)
+            yield
+        finally:
+            os.close(fd)
+
+    def _touch(self, path: str) -> bool:
+        """Refresca el mtime de un bloque existente (el GC respeta los recientes)."""
+        with self._locked(fcntl.LOCK_SH):
+            try:
+                os.utime(path)
+                return True
+            except FileNotFoundError:
+                return False
+
+    def put(self, data: bytes) -> tuple:
+        """Guarda el bloque si no existe. Retorna ``(sha256, bytes_nuevos)``."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if self._touch(path):
+            return digest, 0
+        packed = zlib.compress(data, self.level)
+        self._write_packed(path, packed)
+        return digest, len(packed)
+
+    def _write_packed(self, path: str, packed: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.throttle:
+            self.throttle(len(packed))
+        # varios hilos pueden guardar el mismo bloque a la vez
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as fh:
+            fh.write(packed)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    def get(self, digest: str) -> bytes:
+        with open(self._path(digest), "rb") as fh:
+            data = zlib.decompress(fh.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Bloque corrupto: {digest}")
+        return data
+
+    def writer(self) -> "ChunkingWriter":
+        return ChunkingWriter(self)
+
+    def materialize(self, index: dict, out: BinaryIO) -> int:
+        """Reconstruye el flujo original de un índice en ``out``."""
+        total = 0
+        for digest, _size in index["chunks"]:
+            data = self.get(digest)
+            out.write(data)
+            total += len(data)
+        return total
+
+    def replicate(self, index: dict, target: "ChunkStore") -> int:
+        """
+        Copia a ``target`` los bloques de ``index`` que le faltan, tal como
+        están guardados (sin recomprimir). Retorna los bytes copiados.
+        """
+        copied = 0
+        for digest in {digest for digest, _size in index["chunks"]}:
+            dest = target._path(digest)
+            if target._touch(dest):
+                continue
+            with open(self._path(digest), "rb") as fh:
+                packed = fh.read()
+            target._write_packed(dest, packed)
+            copied += len(packed)
+        return copied
+
+    def gc(self, referenced: Set[str], grace_seconds: int = 86400) -> tuple:
+        """
+        Elimina los bloques no referenciados por ningún índice. Los tocados en
+        las últimas ``grace_seconds`` se respetan: pueden pertenecer a un
+        backup en curso cuyo índice todavía no se escribió. Mientras barre
+        retiene el bloqueo exclusivo: ningún bloque se reutiliza entre su
+        ``stat`` y su eliminación.
+        Retorna ``(bloques_eliminados, bytes_liberados)``.
+        """
+        limit = time.time() - grace_seconds
+        removed = freed = 0
+        if not os.path.isdir(self.root):
+            return removed, freed
+        with self._locked(fcntl.LOCK_EX):
+            return self._sweep(referenced, limit)
+
+    def _sweep(self, referenced: Set[str], limit: float) -> tuple:
+        removed = freed = 0
+        for prefix in os.listdir(self.root):
+            sub = os.path.join(self.root, prefix)
+            if not os.path.isdir(sub):
+                continue
+            with os.scandir(sub) as it:
+                for entry in it:
+                    if entry.name in referenced:
+                        continue
+                    st = entry.stat()
+                    if st.st_mtime > limit:
+                        continue
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+                    removed += 1
+                    freed += st.st_size
+        return removed, freed
+
+
+class ChunkingWriter:
+    """
+    Objeto tipo archivo (sólo escritura, sin ``seek``) que corta lo escrito
+    en bloques definidos por el contenido y los guarda en un ``ChunkStore``.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+        self.chunks: List[list] = []
+        self.bytes_written = 0
+        self.bytes_stored = 0
+        self.closed = False
+        self._buf = bytearray()
+        self._scan = 0          # posición hasta donde ya se buscaron cortes
+        self._digest = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        size = len(data)
+        self._buf += data
+        self._digest.update(data)
+        self.bytes_written += size
+        if len(self._buf) >= 2 * MAX_CHUNK:
+            self._cut()
+        return size
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._cut()
+        if self._buf:
+            self._emit(len(self._buf))
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+
+    def index(self, **extra) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "size": self.bytes_written,
+            "sha256": self._digest.hexdigest(),
+            "chunks": self.chunks,
+            **extra,
+        }
+
+    # ---- interno -------------------------------------------------------
+    def _cut(self) -> None:
+        buf = self._buf
+        view = memoryview(buf)
+        start = 0
+        pos = self._scan
+        while True:
+            nl = buf.find(b"\n", pos)
+            if nl < 0 or nl + 1 - start > MAX_CHUNK:
+                # sin salto de línea cercano: corte fijo en MAX_CHUNK
+                if len(buf) - start >= MAX_CHUNK:
+                    start = self._emit_range(view, start, start + MAX_CHUNK)
+                    pos = start
+                    continue
+                break
+            crc = zlib.crc32(view[pos:nl + 1])
+            pos = nl + 1
+            if pos - start >= MIN_CHUNK and not crc & BOUNDARY_MASK:
+                start = self._emit_range(view, start, pos)
+        view.release()
+        del buf[:start]
+        self._scan = pos - start
+
+    def _emit_range(self, view: memoryview, start: int, end: int) -> int:
+        self._store(bytes(view[start:end]))
+        return end
+
+    def _emit(self, end: int) -> None:
+        self._store(bytes(self._buf[:end]))
+        del self._buf[:end]
+        self._scan = 0
+
+    def _store(self, data: bytes) -> None:
+        digest, stored = self.store.put(data)
+        self.chunks.append([digest, len(data)])
+        self.bytes_stored += stored
+
+
+# ───────────────────────────────────────────────────────────────
+#  Índices
+# ───────────────────────────────────────────────────────────────
+def save_index(path: str, index: dict) -> None:
+    tmp = f"{path}.part"
+    with open(tmp, "w") as fh:
+        json.dump(index, fh, separators=(",", ":"))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+def load_index(path: str) -> Optional[dict]:
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return data if data.get("version") == INDEX_VERSION else None
+
+
+def referenced_chunks(index_paths: Iterable[str]) -> Set[str]:
+    out: Set[str] = set()
+    for path in index_paths:
+        index = load_index(path)
+        if index is None:
+            # índice ilegible: no arriesgar bloques, abortar el GC
+            raise ValueError(f"Índice ilegible: {path}")
+        out.update(digest for digest, _size in index["chunks"])
+    return out
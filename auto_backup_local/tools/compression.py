@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+compression.py –  Códecs de compresión en flujo para el volcado
+• none · gzip · zstd (multihilo) · lz4
+• El códec se deduce de la extensión del archivo al restaurar.
+• zstandard y lz4 son opcionales: sólo se exigen si se eligen.
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+from typing import BinaryIO
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame  # type: ignore
+except ImportError:  # pragma: no cover - dependencia opcional
+    lz4_frame = None
+
+COPY_BUFSIZE = 1024 ** 2
+
+SUFFIXES = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+    "lz4": ".lz4",
+}
+DEFAULT_LEVELS = {
+    "gzip": 6,
+    "zstd": 3,
+    "lz4": 0,
+}
+PYTHON_MODULES = {
+    "zstd": "zstandard",
+    "lz4": "lz4",
+}
+
+
+def available(codec: str) -> bool:
+    if codec == "zstd":
+        return zstandard is not None
+    if codec == "lz4":
+        return lz4_frame is not None
+    return codec in SUFFIXES
+
+
+def codec_from_path(path: str) -> str:
+    for codec, suffix in SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return codec
+    return "none"
+
+
+def strip_suffix(path: str) -> str:
+    suffix = SUFFIXES[codec_from_path(path)]
+    return path[:-len(suffix)] if suffix else path
+
+
+def open_writer(codec: str, raw: BinaryIO, level: int = 0, threads: int = 0) -> BinaryIO:
+    """
+    Envuelve ``raw`` con el compresor del códec. Al cerrar el objeto
+    devuelto se completa la trama comprimida pero ``raw`` queda abierto.
+
+    ``threads`` sólo aplica a zstd: 0 = un hilo por CPU.
+    """
+    level = level or DEFAULT_LEVELS.get(codec, 0)
+    if codec == "none":
+        return _NonClosing(raw)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level, mtime=0)
+    if codec == "zstd":
+        _require(codec)
+        threads = threads or os.cpu_count() or 1
+        cctx = zstandard.ZstdCompressor(level=level, threads=threads)
+        return cctx.stream_writer(raw, closefd=False)
+    if codec == "lz4":
+        _require(codec)
+        return lz4_frame.LZ4FrameFile(raw, mode="wb", compression_level=level)
+    raise ValueError(f"Códec desconocido: {codec}")
+
+
+def open_reader(codec: str, raw: BinaryIO) -> BinaryIO:
+    """Flujo de lectura descomprimido sobre ``raw``."""
+    if codec == "none":
+        return raw
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if codec == "zstd":
+        _require(codec)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+    if codec == "lz4":
+        _require(codec)
+        return lz4_frame.LZ4FrameFile(raw, mode="rb")
+    raise ValueError(f"Códec desconocido: {codec}")
+
+
+def decompress_file(src_path: str, out: BinaryIO) -> None:
+    """Descomprime ``src_path`` (códec según extensión) en ``out``."""
+    with open(src_path, "rb") as raw:
+        reader = open_reader(codec_from_path(src_path), raw)
+        shutil.copyfileobj(reader, out, COPY_BUFSIZE)
+
+
+def _require(codec: str) -> None:
+    if not available(codec):
+        raise RuntimeError(
+            f"El códec {codec} requiere el paquete Python «{PYTHON_MODULES[codec]}»."
+        )
+
+
+class _NonClosing:
+    """Pasa las escrituras a ``raw`` sin cerrarlo (códec «none»)."""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+
+    def write(self, data) -> int:
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def close(self) -> None:
+        self.raw.flush()
+
+    def tell(self) -> int:
+        return self.raw.tell()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
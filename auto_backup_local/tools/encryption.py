@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+encryption.py –  Cifrado en flujo de los backups (AES-256-GCM por bloques)
+• Cada backup lleva una cabecera con una sal y un prefijo de nonce aleatorios;
+  la clave del archivo se deriva con HKDF-SHA256 del secreto de la
+  configuración (la clave Fernet del módulo).
+• El flujo se corta en bloques de ``CHUNK_SIZE`` cifrados y autenticados por
+  separado. El nonce lleva el número de bloque y una marca de último bloque,
+  de modo que reordenar, truncar o agregar bloques se detecta al descifrar.
+• Los bloques se cifran en un pool de hilos mientras el compresor produce los
+  siguientes; se escriben en orden desde el hilo que escribe el backup.
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import collections
+import hashlib
+import hmac
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from cryptography.exceptions import InvalidTag  # type: ignore
+from cryptography.hazmat.primitives import hashes  # type: ignore
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # type: ignore
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF  # type: ignore
+
+SUFFIX = ".enc"
+MAGIC = b"ABLENC01"
+CHUNK_SIZE = 1024 ** 2
+# cifrar ya supera el caudal de escritura de un disco: con dos hilos un bloque
+# se cifra mientras se escribe el anterior y el compresor sigue produciendo
+WORKERS = 2
+
+_TAG_SIZE = 16
+# magia · tamaño de bloque · sal de HKDF · id de la clave · prefijo del nonce
+_HEADER = struct.Struct(">8sI16s8s7s")
+_KEY_INFO = b"auto_backup_local archive key"
+_KEY_ID_INFO = b"auto_backup_local archive key id"
+_MAX_CHUNKS = 2 ** 32
+
+
+def is_encrypted(path: str) -> bool:
+    return path.endswith(SUFFIX)
+
+
+def strip_suffix(path: str) -> str:
+    return path[:-len(SUFFIX)] if is_encrypted(path) else path
+
+
+def key_id(secret: bytes) -> bytes:
+    """Huella de la clave: distingue «otra clave» de «archivo dañado»."""
+    return hmac.new(secret, _KEY_ID_INFO, hashlib.sha256).digest()[:8]
+
+
+def _file_cipher(secret: bytes, salt: bytes) -> AESGCM:
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=_KEY_INFO).derive(secret)
+    return AESGCM(key)
+
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    if counter >= _MAX_CHUNKS:
+        raise ValueError("Backup demasiado grande para un único flujo cifrado.")
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+
+class EncryptingWriter:
+    """
+    Etapa que cifra lo que recibe y lo escribe en ``raw``. Mantiene hasta
+    ``2 × workers`` bloques en vuelo: mientras se cifran, quien escribe sigue
+    produciendo. ``close`` emite el último bloque (marcado como tal) pero
+    deja ``raw`` abierto; ``abort`` descarta lo pendiente.
+    """
+
+    def __init__(self, raw: BinaryIO, secret: bytes, chunk_size: int = CHUNK_SIZE,
+                 workers: int = WORKERS):
+        self.raw = raw
+        self.chunk_size = max(int(chunk_size), 1)
+        salt, self._prefix = os.urandom(16), os.urandom(7)
+        self._header = _HEADER.pack(MAGIC, self.chunk_size, salt, key_id(secret), self._prefix)
+        self._cipher = _file_cipher(secret, salt)
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="backup-encrypt")
+        self._pending: collections.deque = collections.deque()
+        self._max_pending = 2 * max(workers, 1)
+        self._counter = 0
+        self._buf = bytearray()
+        self.closed = False
+        raw.write(self._header)
+        self.bytes_written = len(self._header)
+
+    # ---- interfaz de archivo -------------------------------------------
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed EncryptingWriter")
+        view = memoryview(data).cast("B")
+        size = len(view)
+        while view:
+            room = self.chunk_size - len(self._buf)
+            self._buf += view[:room]
+            view = view[room:]
+            if len(self._buf) >= self.chunk_size:
+                self._submit(bytes(self._buf), last=False)
+                self._buf.clear()
+        return size
+
+    def flush(self) -> None:
+        # un bloque incompleto no se emite: sólo el último puede ser corto
+        flush = getattr(self.raw, "flush", None)
+        if flush:
+            flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._submit(bytes(self._buf), last=True)
+        self._buf.clear()
+        while self._pending:
+            self._write_next()
+        self._pool.shutdown()
+        self.closed = True
+
+    def abort(self) -> None:
+        self.closed = True
+        self._pool.shutdown(cancel_futures=True)
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # ---- interno -------------------------------------------------------
+    def _submit(self, chunk: bytes, last: bool) -> None:
+        nonce = _nonce(self._prefix, self._counter, last)
+        self._counter += 1
+        self._pending.append(self._pool.submit(self._cipher.encrypt, nonce, chunk, self._header))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self) -> None:
+        block = self._pending.popleft().result()
+        self.raw.write(block)
+        self.bytes_written += len(block)
+
+
+class DecryptingReader:
+    """
+    Flujo de lectura descifrado sobre ``raw``. Verifica cada bloque al leerlo:
+    un archivo alterado, truncado o cifrado con otra clave produce
+    ``ValueError`` antes de entregar datos no autenticados.
+    """
+
+    def __init__(self, raw: BinaryIO, secret: bytes):
+        self.raw = raw
+        header = _read_exact(raw, _HEADER.size)
+        if len(header) < _HEADER.size or not header.startswith(MAGIC):
+            raise ValueError("No es un backup cifrado por este módulo.")
+        _magic, chunk_size, salt, file_key_id, self._prefix = _HEADER.unpack(header)
+        if not hmac.compare_digest(file_key_id, key_id(secret)):
+            raise ValueError("El backup se cifró con otra clave.")
+        self._header = header
+        self._cipher = _file_cipher(secret, salt)
+        self._block_size = chunk_size + _TAG_SIZE
+        self._next = _read_exact(raw, self._block_size)
+        self._counter = 0
+        self._buf = bytearray()
+        self._done = False
+        self.closed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._done and (size is None or size < 0 or len(self._buf) < size):
+            self._buf += self._decrypt_next()
+        if size is None or size < 0:
+            size = len(self._buf)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def close(self) -> None:
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _decrypt_next(self) -> bytes:
+        block = self._next
+        # sólo un bloque completo puede tener otro detrás
+        self._next = _read_exact(self.raw, self._block_size) if len(block) == self._block_size else b""
+        last = not self._next
+        if len(block) < _TAG_SIZE:
+            raise ValueError("Backup cifrado truncado.")
+        try:
+            data = self._cipher.decrypt(_nonce(self._prefix, self._counter, last), block, self._header)
+        except InvalidTag:
+            raise ValueError(f"Bloque cifrado {self._counter} alterado o truncado.") from None
+        self._counter += 1
+        self._done = last
+        return data
+
+
+def _read_exact(raw: BinaryIO, size: int) -> bytes:
+    """Lee hasta ``size`` bytes aunque el flujo entregue lecturas cortas."""
+    parts, missing = [], size
+    while missing:
+        data = raw.read(missing)
+        if not data:
+            break
+        parts.append(data)
+        missing -= len(data)
+    return b"".join(parts)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+filestore_index.py –  Índice persistente del filestore para backups incrementales
+• Cada entrada: ruta relativa → [tamaño, mtime_ns, sha1]
+• El índice se guarda junto a los backups y sólo se actualiza tras un backup OK.
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import compression
+
+INDEX_VERSION = 1
+INCREMENT_FILE = "filestore.increment.json"
+COPY_BUFSIZE = 1024 ** 2
+
+Entry = list  # [tamaño, mtime_ns, sha1]
+
+
+@dataclass
+class Plan:
+    """Qué archivar en esta ejecución y a qué backups hace referencia."""
+    full: bool
+    changed: List[str]
+    deleted: List[str]
+    base: Optional[str] = None          # stem del último completo
+    parent: Optional[str] = None        # stem del backup anterior de la cadena
+    previous: Dict[str, Entry] = field(default_factory=dict)
+    increments: int = 0
+
+    def meta(self, stem: str) -> dict:
+        """Metadatos que acompañan al archivo del filestore."""
+        return {
+            "version": INDEX_VERSION,
+            "stem": stem,
+            "full": self.full,
+            "base": stem if self.full else self.base,
+            "parent": None if self.full else self.parent,
+            "deleted": self.deleted,
+        }
+
+
+# ───────────────────────────────────────────────────────────────
+#  Índice
+# ───────────────────────────────────────────────────────────────
+def scan(root: str) -> Dict[str, Tuple[int, int]]:
+    """Recorre ``root`` y devuelve ``{ruta_relativa: (tamaño, mtime_ns)}``."""
+    out: Dict[str, Tuple[int, int]] = {}
+    if not os.path.isdir(root):
+        return out
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                    out[rel] = (st.st_size, st.st_mtime_ns)
+    return out
+
+
+def load_index(path: str) -> Optional[dict]:
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != INDEX_VERSION:
+        return None
+    return data
+
+
+def save_index(path: str, index: dict) -> None:
+    """Escritura atómica: un índice truncado forzaría un backup completo."""
+    tmp = f"{path}.part"
+    with open(tmp, "w") as fh:
+        json.dump(index, fh, separators=(",", ":"))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def make_plan(index: Optional[dict], current: Dict[str, Tuple[int, int]], full_every: int) -> Plan:
+    """Compara el índice anterior con el estado actual del filestore."""
+    if not index or index.get("increments", 0) >= max(full_every, 1):
+        return Plan(full=True, changed=sorted(current), deleted=[])
+
+    previous: Dict[str, Entry] = index.get("entries", {})
+    changed = [
+        rel for rel, (size, mtime) in current.items()
+        if rel not in previous or previous[rel][0] != size or previous[rel][1] != mtime
+    ]
+    deleted = [rel for rel in previous if rel not in current]
+    return Plan(
+        full=False,
+        changed=sorted(changed),
+        deleted=sorted(deleted),
+        base=index.get("base"),
+        parent=index.get("last"),
+        previous=previous,
+        increments=index.get("increments", 0),
+    )
+
+
+def next_index(plan: Plan, stem: str, archived: Dict[str, Entry]) -> dict:
+    """Índice resultante tras archivar ``archived`` según ``plan``."""
+    if plan.full:
+        entries = dict(archived)
+    else:
+        entries = {k: v for k, v in plan.previous.items() if k not in plan.deleted}
+        entries.update(archived)
+    return {
+        "version": INDEX_VERSION,
+        "base": stem if plan.full else plan.base,
+        "last": stem,
+        "increments": 0 if plan.full else plan.increments + 1,
+        "entries": entries,
+    }
+
+
+# ───────────────────────────────────────────────────────────────
+#  Archivado con hash en la misma pasada
+# ───────────────────────────────────────────────────────────────
+def _copy_hashed(src, dst) -> str:
+    digest = hashlib.sha1()
+    while True:
+        buf = src.read(COPY_BUFSIZE)
+        if not buf:
+            break
+        digest.update(buf)
+        dst.write(buf)
+    return digest.hexdigest()
+
+
+class _HashingReader:
+    def __init__(self, fh):
+        self.fh = fh
+        self.digest = hashlib.sha1()
+
+    def read(self, size=-1):
+        buf = self.fh.read(size)
+        self.digest.update(buf)
+        return buf
+
+
+def archive_files(archive, root: str, rels: List[str], prefix: str = "filestore/",
+                  check: Optional[Callable[[], None]] = None) -> Dict[str, Entry]:
+    """
+    Agrega ``rels`` (relativos a ``root``) a un ``TarFile`` o ``ZipFile`` y
+    retorna sus entradas de índice. Los archivos que desaparecen entre el
+    escaneo y el archivado se omiten. ``check`` se invoca antes de cada
+    archivo y puede abortar el archivado lanzando una excepción.
+    """
+    archived: Dict[str, Entry] = {}
+    for rel in rels:
+        if check:
+            check()
+        path = os.path.join(root, rel)
+        try:
+            st = os.stat(path)
+            fh = open(path, "rb")
+        except FileNotFoundError:
+            continue
+        with fh:
+            if isinstance(archive, zipfile.ZipFile):
+                with archive.open(prefix + rel, "w", force_zip64=True) as dst:
+                    sha = _copy_hashed(fh, dst)
+            else:
+                info = archive.gettarinfo(arcname=prefix + rel, fileobj=fh)
+                reader = _HashingReader(fh)
+                archive.addfile(info, reader)
+                sha = reader.digest.hexdigest()
+        archived[rel] = [st.st_size, st.st_mtime_ns, sha]
+    return archived
+
+
+# ───────────────────────────────────────────────────────────────
+#  Restauración
+# ───────────────────────────────────────────────────────────────
+def apply_archive(archive_path: str, meta: dict, dest: str, prefix: str = "filestore/") -> None:
+    """
+    Aplica un archivo del filestore (completo o incremental) sobre ``dest``:
+    primero borra lo indicado en ``meta['deleted']`` y luego extrae lo nuevo.
+    Admite ZIP (sin comprimir por fuera) o tar con cualquier códec.
+    """
+    if meta.get("full") and os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.makedirs(dest, exist_ok=True)
+    real_dest = os.path.realpath(dest)
+
+    def _target(name: str) -> Optional[str]:
+        if not name.startswith(prefix) or name.endswith("/"):
+            return None
+        target = os.path.realpath(os.path.join(dest, name[len(prefix):]))
+        if not target.startswith(real_dest + os.sep):
+            raise ValueError(f"Entrada no permitida en el archivo: {name}")
+        return target
+
+    for rel in meta.get("deleted", []):
+        target = _target(prefix + rel)
+        if target and os.path.isfile(target):
+            os.remove(target)
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                target = _target(info.filename)
+                if target:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zf.open(info) as src, open(target, "wb") as dst:
+                        shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+        return
+
+    codec = compression.codec_from_path(archive_path)
+    with open(archive_path, "rb") as raw, \
+            tarfile.open(fileobj=compression.open_reader(codec, raw), mode="r|") as tar:
+        for member in tar:
+            target = _target(member.name) if member.isfile() else None
+            if target:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as dst:
+                    shutil.copyfileobj(tar.extractfile(member), dst, COPY_BUFSIZE)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py –  Medición por fase de un backup y exportación en formato Prometheus
+• ``PhaseClock`` reparte el tiempo entre fases anidadas: cada instante se
+  asigna sólo a la fase más interna activa (tiempos exclusivos).
+• El reloj activo es propio de cada hilo, de modo que varias bases pueden
+  medirse a la vez sin pasar el reloj por todas las firmas.
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PHASES = ("password", "dump", "filestore", "compress", "encrypt", "write", "retention")
+
+_local = threading.local()
+
+
+class PhaseClock:
+    """Segundos y bytes acumulados por fase."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self._stack: List[str] = []
+        self._mark = 0.0
+
+    def enter(self, name: str) -> None:
+        self._charge()
+        self._stack.append(name)
+
+    def leave(self) -> None:
+        self._charge()
+        self._stack.pop()
+
+    def count(self, name: str, size: int) -> None:
+        self.bytes[name] += size
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def _charge(self) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    def fields(self) -> dict:
+        """Valores para los campos ``<fase>_seconds`` / ``<fase>_bytes`` del historial."""
+        out = {}
+        for name in PHASES:
+            if name in self.seconds:
+                out[f"{name}_seconds"] = round(self.seconds[name], 3)
+            if name in self.bytes:
+                out[f"{name}_bytes"] = self.bytes[name]
+        return out
+
+
+class _NullClock(PhaseClock):
+    """Reloj inactivo: se usa cuando nadie está midiendo."""
+
+    def enter(self, name: str) -> None:
+        pass
+
+    def leave(self) -> None:
+        pass
+
+    def count(self, name: str, size: int) -> None:
+        pass
+
+
+_NULL = _NullClock()
+
+
+def current() -> PhaseClock:
+    """Reloj activo en este hilo (uno inerte si no hay medición en curso)."""
+    return getattr(_local, "clock", None) or _NULL
+
+
+@contextlib.contextmanager
+def measuring(clock: PhaseClock) -> Iterator[PhaseClock]:
+    previous = getattr(_local, "clock", None)
+    _local.clock = clock
+    try:
+        yield clock
+    finally:
+        _local.clock = previous
+
+
+class TimedWriter:
+    """
+    Etapa transparente que asigna a ``phase`` el tiempo que tarda la etapa
+    siguiente en cada ``write`` y cuenta los bytes que la atraviesan.
+    """
+
+    def __init__(self, inner, phase: str, clock: Optional[PhaseClock] = None):
+        self.inner = inner
+        self.phase = phase
+        self.clock = clock or current()
+
+    def write(self, data) -> int:
+        self.clock.enter(self.phase)
+        try:
+            written = self.inner.write(data)
+        finally:
+            self.clock.leave()
+        self.clock.count(self.phase, len(data))
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+# ───────────────────────────────────────────────────────────────
+#  Formato de exposición de Prometheus (text/plain; version=0.0.4)
+# ───────────────────────────────────────────────────────────────
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    return repr(float(value))
+
+
+def render(families: Iterable[Tuple[str, str, str, Iterable[Sample]]]) -> str:
+    """``families``: ``(nombre, tipo, ayuda, [(etiquetas, valor), ...])``."""
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_str}}} {_number(value)}" if label_str else f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+schedule.py –  Expresiones cron y cálculo de la próxima ejecución
+• Formato clásico de 5 campos: minuto hora día-del-mes mes día-de-la-semana.
+• Admite ``*``, listas (``1,15``), rangos (``1-5``) y pasos (``*/10``,
+  ``8-18/2``). Día de la semana 0-7 (0 y 7 = domingo).
+• Si se restringen día del mes y día de la semana, basta con que coincida
+  uno de los dos (como en cron de Vixie).
+• Sin dependencias de Odoo; trabaja con fechas sin zona (hora local).
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import FrozenSet, Tuple
+
+_FIELDS: Tuple[Tuple[str, int, int], ...] = (
+    ("minuto", 0, 59),
+    ("hora", 0, 23),
+    ("día del mes", 1, 31),
+    ("mes", 1, 12),
+    ("día de la semana", 0, 7),
+)
+# no hay fechas que cumplan una expresión en este plazo: p. ej. «0 0 31 2 *»
+_SEARCH_DAYS = 366 * 5
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(","):
+        body, _sep, step_text = part.partition("/")
+        try:
+            step = int(step_text) if step_text else 1
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                start_text, end_text = body.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(body)
+                end = high if step_text else start
+        except ValueError:
+            raise ValueError(f"Valor inválido en {name}: {part}") from None
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Valor fuera de rango en {name}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """Expresión cron ya validada."""
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError("La expresión cron debe tener 5 campos: minuto hora día mes día-semana")
+        fields = [
+            _parse_field(text, name, low, high)
+            for text, (name, low, high) in zip(parts, _FIELDS)
+        ]
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # cron: 0 y 7 = domingo → weekday() de Python: lunes = 0
+        self.weekdays = frozenset((d - 1) % 7 for d in weekdays)
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    def _day_matches(self, day: datetime.date) -> bool:
+        in_month = day.day in self.days
+        in_week = day.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def runs_on(self, day: datetime.date) -> int:
+        """Ejecuciones que caen en ``day``."""
+        if day.month not in self.months or not self._day_matches(day):
+            return 0
+        return len(self.hours) * len(self.minutes)
+
+    def next_after(self, moment: datetime.datetime) -> datetime.datetime:
+        """Primera fecha (al minuto) estrictamente posterior a ``moment``."""
+        t = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=_SEARCH_DAYS)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + datetime.timedelta(days=32)).replace(day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(t.date()):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            later = [m for m in self.minutes if m >= t.minute]
+            if not later:
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            return t.replace(minute=min(later))
+        raise ValueError(f"La expresión «{self.expr}» no tiene próximas ejecuciones")
+
+
+def next_interval(moment: datetime.datetime, minutes: int) -> datetime.datetime:
+    """
+    Próximo múltiplo de ``minutes`` (contado desde el 1/1/1970) posterior a
+    ``moment``: las ejecuciones quedan en horarios fijos y no se corren.
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    elapsed = int((moment - epoch).total_seconds() // 60)
+    return epoch + datetime.timedelta(minutes=(elapsed // minutes + 1) * minutes)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+snapshot.py –  Copias de árboles con enlaces duros (estilo ``rsync --link-dest``)
+• Un archivo sin cambios respecto de la instantánea anterior (mismo tamaño y
+  mtime) se enlaza; el resto se copia conservando el mtime, de modo que la
+  próxima comparación lo reconozca.
+• Cada instantánea es un árbol completo y navegable, pero sólo ocupa lo que
+  cambió. Los archivos enlazados se comparten: nunca deben modificarse en
+  el lugar (restaurar siempre copia).
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+from typing import Callable, Optional, Set
+
+from . import streams
+
+_logger = logging.getLogger(__name__)
+
+
+def link_tree(
+    source: str,
+    dest: str,
+    previous: Optional[str] = None,
+    throttle: Optional[Callable[[int], None]] = None,
+    check: Optional[Callable[[], None]] = None,
+    only: Optional[Set[str]] = None,
+) -> dict:
+    """
+    Replica ``source`` en ``dest`` enlazando lo que no cambió respecto de
+    ``previous``. Con ``only`` se omiten las rutas relativas que no estén en
+    el conjunto. Retorna ``{linked, linked_bytes, copied, copied_bytes}``.
+    """
+    stats = {"linked": 0, "linked_bytes": 0, "copied": 0, "copied_bytes": 0}
+    if previous and not os.path.isdir(previous):
+        previous = None
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        rel_root = os.path.relpath(root, source)
+        os.makedirs(os.path.join(dest, rel_root), exist_ok=True)
+        for fname in sorted(files):
+            rel = os.path.normpath(os.path.join(rel_root, fname))
+            if only is not None and rel not in only:
+                continue
+            src = os.path.join(root, fname)
+            dst = os.path.join(dest, rel)
+            try:
+                st = os.stat(src)
+                if previous and _link_unchanged(os.path.join(previous, rel), dst, st):
+                    stats["linked"] += 1
+                    stats["linked_bytes"] += st.st_size
+                    continue
+                _copy_file(src, dst, throttle)
+            except FileNotFoundError:
+                continue        # adjunto eliminado durante el recorrido
+            stats["copied"] += 1
+            stats["copied_bytes"] += st.st_size
+            if check:
+                check()
+    return stats
+
+
+def _link_unchanged(prev: str, dst: str, st: os.stat_result) -> bool:
+    try:
+        pst = os.stat(prev)
+    except OSError:
+        return False
+    if pst.st_size != st.st_size or pst.st_mtime_ns != st.st_mtime_ns:
+        return False
+    try:
+        os.link(prev, dst)
+    except OSError as exc:
+        # otro sistema de archivos (EXDEV) o tope de enlaces (EMLINK): se copia
+        _logger.debug("No se pudo enlazar %s: %s", prev, exc)
+        return False
+    return True
+
+
+def _copy_file(src: str, dst: str, throttle: Optional[Callable[[int], None]] = None) -> None:
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        with streams.ChunkedWriter(fout, throttle=throttle) as writer:
+            shutil.copyfileobj(fin, writer, streams.DEFAULT_CHUNK_SIZE)
+    shutil.copystat(src, dst)
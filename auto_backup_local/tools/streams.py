@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+streams.py –  Escritores encadenables para el volcado de backups
+• Sin dependencias de Odoo: se pueden probar de forma aislada.
+• Cada etapa expone write / flush / close / tell y escribe en la siguiente.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import BinaryIO, Callable, ContextManager, Iterator, List, Optional
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 ** 2        # 4 MiB por bloque escrito
+
+
+class ChunkedWriter:
+    """
+    Acumula lo escrito en un búfer fijo y lo vuelca a *raw* en bloques de
+    ``chunk_size`` bytes. La memoria usada no depende del tamaño del backup.
+
+    ``progress(total)`` se invoca tras cada bloque volcado con el total de
+    bytes escritos hasta el momento; ``throttle(n)`` antes de escribirlo.
+
+    No implementa ``seek``: ``zipfile`` lo detecta y escribe descriptores de
+    datos en lugar de volver atrás a reescribir las cabeceras.
+    """
+
+    def __init__(
+        self,
+        raw: BinaryIO,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Optional[Callable[[int], None]] = None,
+        throttle: Optional[Callable[[int], None]] = None,
+    ):
+        self.raw = raw
+        self.chunk_size = max(int(chunk_size), 1)
+        self.progress = progress
+        self.throttle = throttle
+        self.bytes_written = 0
+        self._buf = bytearray()
+        self.closed = False
+
+    # ---- interfaz de archivo -------------------------------------------
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.bytes_written + len(self._buf)
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed ChunkedWriter")
+        view = memoryview(data).cast("B")
+        size = len(view)
+        while view:
+            room = self.chunk_size - len(self._buf)
+            self._buf += view[:room]
+            view = view[room:]
+            if len(self._buf) >= self.chunk_size:
+                self._drain()
+        return size
+
+    def flush(self) -> None:
+        if self._buf:
+            self._drain()
+        flush = getattr(self.raw, "flush", None)
+        if flush:
+            flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- interno -------------------------------------------------------
+    def _drain(self) -> None:
+        data = bytes(self._buf)
+        self._buf.clear()
+        if self.throttle:
+            self.throttle(len(data))
+        self.raw.write(data)
+        self.bytes_written += len(data)
+        if self.progress:
+            self.progress(self.bytes_written)
+
+
+class CountingWriter:
+    """
+    Etapa intermedia que cuenta los bytes que la atraviesan y oculta ``seek``
+    de la etapa siguiente (un compresor), de modo que ``zipfile`` escriba en
+    modo secuencial con offsets del flujo sin comprimir.
+
+    ``close`` cierra también la etapa siguiente.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.bytes_written = 0
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        self.inner.write(data)
+        size = len(data)
+        self.bytes_written += size
+        return size
+
+    def flush(self) -> None:
+        self.inner.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.inner.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HashingWriter:
+    """
+    Última etapa antes del archivo: calcula el SHA-256 de lo que realmente
+    llega al disco mientras se escribe, sin una segunda lectura.
+    """
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.raw.write(data)
+        size = len(data)
+        self.bytes_written += size
+        return size
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
+class Throttle:
+    """
+    Limita el caudal a ``rate`` bytes por segundo (cubeta de fichas con una
+    ráfaga de un segundo). Se puede compartir entre hilos: el límite es el
+    total de todos los escritores que la usan.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = float(rate)
+        self._allowance = self.rate
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, size: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self._allowance + (now - self._stamp) * self.rate, self.rate)
+            self._stamp = now
+            self._allowance -= size
+            wait = -self._allowance / self.rate if self._allowance < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+def fsync_dir(path: str) -> None:
+    """Persiste la entrada de directorio (alta / renombre) en disco."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_output(path: str, guard: Optional[ContextManager] = None) -> Iterator[HashingWriter]:
+    """
+    Escribe en ``<path>.part`` y, sólo si el bloque termina sin error, hace
+    fsync, renombra atómicamente a ``path`` y sincroniza el directorio.
+    Un corte a mitad de camino nunca deja un archivo con el nombre final.
+
+    ``guard`` envuelve el renombrado: si al entrar lanza una excepción el
+    ``.part`` se elimina y el archivo final no aparece.
+    """
+    tmp = path + ".part"
+    raw = open(tmp, "wb")
+    try:
+        out = HashingWriter(raw)
+        yield out
+        raw.flush()
+        os.fsync(raw.fileno())
+    except BaseException:
+        raw.close()
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    raw.close()
+    try:
+        with guard if guard is not None else contextlib.nullcontext():
+            os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+@contextlib.contextmanager
+def atomic_directory(path: str) -> Iterator[str]:
+    """
+    Equivalente a ``atomic_output`` para backups en directorio: se genera en
+    ``<path>.part/``, se sincroniza cada archivo y se renombra al final.
+    """
+    tmp = path + ".part"
+    os.makedirs(tmp)
+    try:
+        yield tmp
+        for root, _dirs, files in os.walk(tmp):
+            for fname in files:
+                fd = os.open(os.path.join(root, fname), os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            fsync_dir(root)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    os.replace(tmp, path)
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+# ───────────────────────────────────────────────────────────────
+#  Reparto de un mismo flujo entre varios destinos
+# ───────────────────────────────────────────────────────────────
+_STOP = object()
+
+
+class _Branch:
+    """
+    Un destino de ``FanOutWriter``: su hilo escribe lo que recibe por la cola.
+    El resultado se decide una sola vez bajo ``_lock``: o el hilo renombra el
+    archivo final, o ``fail`` lo descarta antes; nunca ambas cosas.
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.error: Optional[str] = None
+        self.bytes_written = 0
+        self.digest: Optional[str] = None
+        self._queue: "queue.Queue" = queue.Queue(slots)
+        self._abort = False
+        self._committed = False
+        self._out: Optional[HashingWriter] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f"backup-dest-{os.path.basename(path)}", daemon=True,
+        )
+        self._thread.start()
+
+    def put(self, data: bytes, timeout: float) -> None:
+        try:
+            self._queue.put(data, timeout=timeout)
+        except queue.Full:
+            # el destino no avanza: se descarta para no frenar a los demás
+            self.fail(f"sin avance durante {int(timeout)} s")
+
+    def fail(self, reason: str) -> None:
+        with self._lock:
+            if self._committed:
+                return          # ya tiene el nombre final: terminó bien
+            if self.error is None:
+                self.error = reason
+            self._abort = True
+        with contextlib.suppress(queue.Full):
+            self._queue.put_nowait(_STOP)
+
+    def finish(self, timeout: float) -> None:
+        if self.error is None:
+            self.put(_STOP, timeout)
+
+    def join(self, timeout: float) -> None:
+        # un destino colgado (p. ej. NFS sin respuesta) no retiene al productor
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.fail(f"sin avance durante {int(timeout)} s")
+
+    @contextlib.contextmanager
+    def _commit(self):
+        # se entra recién al renombrar: ``_out`` ya tiene el flujo completo
+        out = self._out
+        with self._lock:
+            if self._abort:
+                raise RuntimeError(self.error or "cancelado")
+            yield
+            self.bytes_written = out.bytes_written
+            self.digest = out.hexdigest()
+            self._committed = True
+
+    def _run(self) -> None:
+        try:
+            with atomic_output(self.path, self._commit()) as out:
+                self._out = out
+                while True:
+                    item = self._queue.get()
+                    if item is _STOP or self._abort:
+                        break
+                    out.write(item)
+                if self._abort:
+                    raise RuntimeError(self.error or "cancelado")
+        except BaseException as exc:
+            with self._lock:
+                if self._committed:
+                    # el archivo ya es definitivo (p. ej. falló el fsync del directorio)
+                    _logger.warning("Destino %s: %s", self.path, exc)
+                    return
+                if self.error is None:
+                    self.error = str(exc) or type(exc).__name__
+            _logger.warning("Destino %s descartado: %s", self.path, self.error)
+            self._abort = True
+            self._drain()
+
+    def _drain(self) -> None:
+        # vaciar la cola hasta que el productor se entere del error
+        while True:
+            try:
+                if self._queue.get(timeout=1.0) is _STOP:
+                    return
+            except queue.Empty:
+                return
+
+
+class FanOutWriter:
+    """
+    Última etapa de un volcado con varios destinos: cada bloque se entrega a
+    un hilo por destino, que lo escribe con ``atomic_output`` (``.part`` +
+    fsync + rename) y calcula su propio SHA-256.
+
+    Cada destino tiene una cola acotada (``max_buffer`` bytes). Si un destino
+    no acepta un bloque en ``stall_seconds`` se lo descarta y el volcado sigue
+    en los demás; sólo falla cuando no queda ninguno. Si el bloque ``with``
+    termina con una excepción, se descartan todos (ningún destino queda con el
+    nombre final).
+    """
+
+    def __init__(self, paths: List[str], max_buffer: int = 16 * DEFAULT_CHUNK_SIZE,
+                 stall_seconds: float = 300.0):
+        slots = max(max_buffer // DEFAULT_CHUNK_SIZE, 1)
+        self.stall_seconds = stall_seconds
+        self.bytes_written = 0
+        self.branches = [_Branch(path, slots) for path in paths]
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        alive = [b for b in self.branches if b.error is None]
+        if not alive:
+            raise OSError("; ".join(f"{b.path}: {b.error}" for b in self.branches))
+        for branch in alive:
+            branch.put(data, self.stall_seconds)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self, abort: bool = False) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for branch in self.branches:
+            if abort:
+                branch.fail("volcado interrumpido")
+            else:
+                branch.finish(self.stall_seconds)
+        for branch in self.branches:
+            branch.join(self.stall_seconds if branch.error is None else 5.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(abort=exc_type is not None)
+
+    def results(self) -> List[dict]:
+        """Resultado por destino: ``{path, written, checksum, error}``."""
+        return [
+            {
+                "path": b.path,
+                "written": b.bytes_written,
+                "checksum": b.digest,
+                "error": b.error,
+            }
+            for b in self.branches
+        ]
+
+
+def file_sha256(path: str, bufsize: int = DEFAULT_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while True:
+            buf = fh.read(bufsize)
+            if not buf:
+                break
+            digest.update(buf)
+    return digest.hexdigest()
+
+
+def progress_logger(label: str, every: int = 256 * 1024 ** 2) -> Callable[[int], None]:
+    """Devuelve un callback que registra el avance cada *every* bytes."""
+    state = {"next": every}
+
+    def _report(total: int) -> None:
+        if total >= state["next"]:
+            _logger.info("%s: %.1f MB escritos", label, total / 1024 ** 2)
+            state["next"] = (total // every + 1) * every
+
+    return _report
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+table_diff.py –  Volcados diferenciales por tabla
+• La firma de cada tabla combina los contadores acumulados de
+  ``pg_stat_user_tables`` (filas insertadas + actualizadas + borradas) con su
+  relfilenode, que cambia con TRUNCATE, VACUUM FULL o CLUSTER.
+• Un diferencial incluye las tablas cuya firma difiere de la del último
+  completo y todas las secuencias; el resto se toma del completo al restaurar.
+• Un cambio de esquema, un reinicio de estadísticas o un diferencial que
+  cubra la mayor parte de la base fuerzan un completo.
+• Sin dependencias de Odoo: recibe cursores DB-API.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+INDEX_VERSION = 1
+DIFF_FILE = "dump.differential.json"
+# con más de esta fracción del tamaño de la base cambiada, un completo cuesta lo mismo
+MAX_DIFF_RATIO = 0.5
+
+_STATS_QUERY = """
+    SELECT s.schemaname || '.' || s.relname,
+           s.n_tup_ins + s.n_tup_upd + s.n_tup_del,
+           pg_relation_filenode(s.relid),
+           pg_relation_size(s.relid)
+      FROM pg_stat_user_tables s
+"""
+_SEQUENCES_QUERY = "SELECT schemaname || '.' || sequencename FROM pg_sequences"
+_STATS_RESET_QUERY = "SELECT stats_reset::text FROM pg_stat_database WHERE datname = current_database()"
+# columnas, índices, restricciones, vistas y funciones: lo que el completo
+# aporta al restaurar un diferencial debe seguir siendo válido
+_SCHEMA_QUERY = r"""
+    SELECT md5(coalesce(string_agg(line, E'\n' ORDER BY line), ''))
+      FROM (
+        SELECT format('col %s.%s %s %s %s %s', n.nspname, c.relname, a.attnum, a.attname,
+                      format_type(a.atttypid, a.atttypmod), a.attnotnull) AS line
+          FROM pg_attribute a
+          JOIN pg_class c ON c.oid = a.attrelid
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE c.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+           AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+           AND n.nspname NOT LIKE 'pg_toast%'
+        UNION ALL
+        SELECT format('idx %s', indexdef)
+          FROM pg_indexes
+         WHERE schemaname NOT IN ('pg_catalog', 'information_schema')
+        UNION ALL
+        SELECT format('con %s %s', conrelid::regclass, pg_get_constraintdef(oid))
+          FROM pg_constraint
+         WHERE connamespace NOT IN ('pg_catalog'::regnamespace, 'information_schema'::regnamespace)
+        UNION ALL
+        SELECT format('view %s %s', c.oid::regclass, md5(pg_get_viewdef(c.oid)))
+          FROM pg_class c
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+         WHERE c.relkind IN ('v', 'm')
+           AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+        UNION ALL
+        SELECT format('func %s %s', p.oid::regprocedure, md5(p.prosrc))
+          FROM pg_proc p
+          JOIN pg_namespace n ON n.oid = p.pronamespace
+         WHERE n.nspname NOT IN ('pg_catalog', 'information_schema')
+      ) t
+"""
+# línea de ``pg_restore --list``: «id; tableoid oid DESCRIPCIÓN esquema nombre dueño»
+_LIST_RGX = re.compile(r"^\d+; \d+ \d+ (TABLE DATA|SEQUENCE SET) (\S+) (\S+) ")
+
+
+@dataclass
+class TableStats:
+    """Estado de la base en el instante del volcado."""
+    signatures: Dict[str, str]
+    sizes: Dict[str, int]
+    sequences: List[str]
+    schema: str
+    stats_reset: Optional[str]
+
+
+@dataclass
+class DiffPlan:
+    full: bool
+    tables: List[str] = field(default_factory=list)
+    sequences: List[str] = field(default_factory=list)
+    base: Optional[str] = None          # stem del completo de referencia
+    differentials: int = 0
+    reason: str = ""
+
+    def meta(self, stem: str) -> dict:
+        """Contenido de ``DIFF_FILE`` dentro de un backup diferencial."""
+        return {
+            "version": INDEX_VERSION,
+            "stem": stem,
+            "base": self.base,
+            "tables": self.tables,
+            "sequences": self.sequences,
+        }
+
+
+def read_stats(cr) -> TableStats:
+    """
+    Firmas por tabla. Las estadísticas se leen de la caché de la transacción:
+    ``pg_stat_clear_snapshot()`` antes de cada lectura para verlas al día.
+    """
+    cr.execute("SELECT pg_stat_clear_snapshot()")
+    cr.execute(_STATS_QUERY)
+    signatures, sizes = {}, {}
+    for name, changes, filenode, size in cr.fetchall():
+        signatures[name] = f"{changes}:{filenode}"
+        sizes[name] = size or 0
+    cr.execute(_SEQUENCES_QUERY)
+    sequences = sorted(row[0] for row in cr.fetchall())
+    cr.execute(_SCHEMA_QUERY)
+    schema = cr.fetchone()[0]
+    cr.execute(_STATS_RESET_QUERY)
+    row = cr.fetchone()
+    return TableStats(signatures, sizes, sequences, schema, row and row[0])
+
+
+def changed_tables(index: dict, stats: TableStats) -> List[str]:
+    base = index.get("signatures", {})
+    return sorted(name for name, sig in stats.signatures.items() if base.get(name) != sig)
+
+
+def make_plan(index: Optional[dict], stats: TableStats, full_every: int) -> DiffPlan:
+    """Decide entre un completo y un diferencial respecto del último completo."""
+    if not index:
+        return DiffPlan(full=True, reason="sin completo previo")
+    if index.get("differentials", 0) >= max(full_every, 1):
+        return DiffPlan(full=True, reason="se alcanzó el máximo de diferenciales")
+    if index.get("schema") != stats.schema:
+        return DiffPlan(full=True, reason="cambió el esquema")
+    if index.get("stats_reset") != stats.stats_reset:
+        return DiffPlan(full=True, reason="se reiniciaron las estadísticas")
+    tables = changed_tables(index, stats)
+    total = sum(stats.sizes.values()) or 1
+    if sum(stats.sizes.get(t, 0) for t in tables) > MAX_DIFF_RATIO * total:
+        return DiffPlan(full=True, reason="cambió la mayor parte de la base")
+    if not tables and not stats.sequences:
+        return DiffPlan(full=True, reason="nada que volcar")
+    return DiffPlan(
+        full=False,
+        tables=tables,
+        sequences=stats.sequences,
+        base=index.get("base"),
+        differentials=index.get("differentials", 0),
+    )
+
+
+def next_index(index: Optional[dict], plan: DiffPlan, stem: str, stats: TableStats) -> dict:
+    """Índice tras un backup OK: un completo fija las firmas de referencia."""
+    if plan.full:
+        return {
+            "version": INDEX_VERSION,
+            "base": stem,
+            "differentials": 0,
+            "schema": stats.schema,
+            "stats_reset": stats.stats_reset,
+            "signatures": stats.signatures,
+        }
+    return {**index, "differentials": plan.differentials + 1}
+
+
+def table_args(names: List[str]) -> List[str]:
+    """Opciones ``--table`` de pg_dump con nombres literales (sin comodines)."""
+    args = []
+    for name in names:
+        schema, _sep, rel = name.partition(".")
+        args.append(f'--table="{schema}"."{rel}"')
+    return args
+
+
+def restore_list(listing: str, tables: List[str], sequences: List[str]) -> str:
+    """
+    Lista de ``pg_restore --list`` del completo sin los datos que aporta el
+    diferencial (tablas cambiadas y valores de secuencias).
+    """
+    skip = set(tables) | set(sequences)
+    out = []
+    for line in listing.splitlines():
+        m = _LIST_RGX.match(line)
+        if m and f"{m.group(2)}.{m.group(3)}" in skip:
+            line = ";" + line
+        out.append(line)
+    return "\n".join(out) + "\n"
+
+
+# ───────────────────────────────────────────────────────────────
+#  Persistencia
+# ───────────────────────────────────────────────────────────────
+def load_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return data if data.get("version") == INDEX_VERSION else None
+
+
+def save_json(path: str, data: dict) -> None:
+    tmp = f"{path}.part"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh, separators=(",", ":"))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+volumes.py –  Backups en volúmenes de tamaño fijo
+• El flujo se corta en volúmenes (``<nombre>.0001``, ``.0002``…) dentro de un
+  directorio; ``VOLUMES.json`` lista cada volumen con su tamaño y SHA-256 y
+  el SHA-256 del flujo completo. Concatenados en orden reconstruyen el
+  archivo original (``cat nombre.* > nombre``).
+• Cada volumen se arma en un archivo temporal local y recién completo se
+  copia a cada destino (``.part`` + fsync + rename). Un error de escritura
+  (p. ej. un montaje de red que se cae un momento) reintenta sólo ese
+  volumen; un destino que agota los reintentos se descarta sin frenar a los
+  demás y conserva sus volúmenes completos, de modo que ``resume`` lo
+  termina desde otra copia a partir del primer volumen que le falte.
+• Sin dependencias de Odoo.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional
+
+from . import streams
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST = "VOLUMES.json"
+VERSION = 1
+_DIGITS = 4
+
+
+def volume_name(name: str, number: int) -> str:
+    return f"{name}.{number:0{_DIGITS}d}"
+
+
+class _Target:
+    """Un destino: directorio ``<path>.part`` que recibe los volúmenes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.work = path + ".part"
+        self.error: Optional[str] = None
+        self.thread: Optional[threading.Thread] = None
+        os.makedirs(self.work, exist_ok=True)
+
+
+class VolumeWriter:
+    """
+    Última etapa de un volcado en volúmenes hacia uno o varios destinos.
+    Mientras se llena un volumen, el anterior se copia a los destinos (dos
+    archivos temporales que se alternan). Un destino que no termina de copiar
+    un volumen en ``stall_seconds`` se descarta.
+
+    Si el bloque ``with`` termina con una excepción, se eliminan todos los
+    directorios parciales. Si termina bien, cada destino sano queda con su
+    nombre final; los descartados conservan ``<path>.part`` para ``resume``.
+    """
+
+    def __init__(self, paths: List[str], name: str, volume_size: int, retries: int = 3,
+                 retry_wait: float = 10.0, stall_seconds: float = 300.0,
+                 spool_dir: Optional[str] = None):
+        self.name = name
+        self.volume_size = max(int(volume_size), streams.DEFAULT_CHUNK_SIZE)
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.stall_seconds = stall_seconds
+        self.bytes_written = 0
+        self.volumes: List[dict] = []
+        self.targets = [_Target(path) for path in paths]
+        self.closed = False
+        self._files: Dict[str, bytes] = {}
+        self._spools = [tempfile.TemporaryFile(dir=spool_dir) for _i in range(2)]
+        self._current = 0
+        self._size = 0
+        self._hash = hashlib.sha256()
+        self._total = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            if not any(t.error is None for t in self.targets):
+                raise OSError("; ".join(f"{t.path}: {t.error}" for t in self.targets))
+            piece = view[:self.volume_size - self._size]
+            self._spools[self._current].write(piece)
+            self._hash.update(piece)
+            self._total.update(piece)
+            self._size += len(piece)
+            self.bytes_written += len(piece)
+            view = view[len(piece):]
+            if self._size == self.volume_size:
+                self._seal()
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def add_file(self, name: str, data: bytes) -> None:
+        """Archivo auxiliar que se agrega a cada destino junto al índice."""
+        self._files[name] = data
+
+    def close(self, abort: bool = False) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if not abort:
+                if self._size or not self.volumes:
+                    self._seal()
+                self._wait()
+                for target in self.targets:
+                    if target.error is None:
+                        self._finish(target)
+        finally:
+            for spool in self._spools:
+                spool.close()
+            for target in self.targets:
+                if abort:
+                    with contextlib.suppress(OSError):
+                        shutil.rmtree(target.work)
+                elif target.error:
+                    _logger.warning("Destino %s descartado: %s", target.path, target.error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(abort=exc_type is not None)
+
+    def results(self) -> List[dict]:
+        """Resultado por destino: ``{path, written, checksum, error}``."""
+        checksum = self._total.hexdigest()
+        return [
+            {
+                "path": t.path,
+                "written": self.bytes_written if t.error is None else 0,
+                "checksum": checksum if t.error is None else None,
+                "error": t.error,
+            }
+            for t in self.targets
+        ]
+
+    def manifest(self) -> dict:
+        return {
+            "version": VERSION,
+            "name": self.name,
+            "volume_size": self.volume_size,
+            "size": self.bytes_written,
+            "sha256": self._total.hexdigest(),
+            "volumes": self.volumes,
+        }
+
+    # ── internos ──────────────────────────────────────────────────
+    def _seal(self) -> None:
+        """Cierra el volumen en curso y lanza su copia a los destinos."""
+        self._wait()
+        spool = self._spools[self._current]
+        spool.flush()
+        volume = {
+            "name": volume_name(self.name, len(self.volumes) + 1),
+            "size": self._size,
+            "sha256": self._hash.hexdigest(),
+        }
+        self.volumes.append(volume)
+        for target in self.targets:
+            if target.error is None:
+                target.thread = threading.Thread(
+                    target=self._copy, args=(target, spool.fileno(), volume),
+                    name=f"backup-vol-{os.path.basename(target.path)}", daemon=True,
+                )
+                target.thread.start()
+        self._current ^= 1
+        self._spools[self._current].seek(0)
+        self._spools[self._current].truncate()
+        self._size = 0
+        self._hash = hashlib.sha256()
+
+    def _wait(self) -> None:
+        """Espera la copia del volumen anterior; los destinos colgados se descartan."""
+        for target in self.targets:
+            if target.thread is None:
+                continue
+            target.thread.join(self.stall_seconds)
+            if target.thread.is_alive() and target.error is None:
+                target.error = f"sin avance durante {int(self.stall_seconds)} s"
+            target.thread = None
+
+    def _copy(self, target: _Target, fd: int, volume: dict) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                _copy_volume(fd, volume, target.work, target)
+                return
+            except OSError as exc:
+                if target.error is not None:
+                    return
+                if attempt == self.retries:
+                    target.error = f"{volume['name']}: {exc}"
+                    return
+                _logger.warning(
+                    "Error al escribir %s en %s (intento %s de %s): %s",
+                    volume["name"], target.path, attempt + 1, self.retries + 1, exc,
+                )
+                time.sleep(self.retry_wait * (attempt + 1))
+
+    def _finish(self, target: _Target) -> None:
+        try:
+            _finish_directory(target.work, target.path, self.manifest(), self._files)
+        except OSError as exc:
+            target.error = str(exc)
+
+
+def _copy_volume(fd: int, volume: dict, work: str, target: Optional[_Target] = None) -> None:
+    """
+    Copia un volumen desde el descriptor ``fd`` (lecturas posicionales, sin
+    compartir el cursor) y lo renombra sólo si lo leído coincide con su
+    SHA-256: un hilo descartado que sigue leyendo un temporal ya reutilizado
+    no deja un volumen con el nombre final.
+    """
+    dest = os.path.join(work, volume["name"])
+    digest = hashlib.sha256()
+    offset = 0
+    with streams.atomic_output(dest) as out:
+        while offset < volume["size"]:
+            chunk = os.pread(fd, min(streams.DEFAULT_CHUNK_SIZE, volume["size"] - offset), offset)
+            if not chunk:
+                raise OSError(f"volumen temporal incompleto: {volume['name']}")
+            out.write(chunk)
+            digest.update(chunk)
+            offset += len(chunk)
+        if digest.hexdigest() != volume["sha256"] or (target and target.error):
+            raise OSError(f"{volume['name']}: copia descartada")
+
+
+def _finish_directory(work: str, path: str, manifest: dict, files: Dict[str, bytes]) -> None:
+    for fname, data in files.items():
+        with open(os.path.join(work, fname), "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+    with open(os.path.join(work, MANIFEST), "w") as fh:
+        json.dump(manifest, fh, indent=1)
+        fh.flush()
+        os.fsync(fh.fileno())
+    streams.fsync_dir(work)
+    os.replace(work, path)
+    streams.fsync_dir(os.path.dirname(path) or ".")
+
+
+# ───────────────────────────────────────────────────────────────
+#  Lectura, verificación y reanudación
+# ───────────────────────────────────────────────────────────────
+def load_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(path, MANIFEST)) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return data if data.get("version") == VERSION else None
+
+
+def _volume_ok(path: str, volume: dict) -> bool:
+    try:
+        if os.path.getsize(path) != volume["size"]:
+            return False
+    except OSError:
+        return False
+    return streams.file_sha256(path) == volume["sha256"]
+
+
+def verify(path: str) -> List[str]:
+    """Volúmenes faltantes o dañados de ``path`` (lista vacía si está íntegro)."""
+    manifest = load_manifest(path)
+    if manifest is None:
+        return [MANIFEST]
+    return [
+        v["name"] for v in manifest["volumes"]
+        if not _volume_ok(os.path.join(path, v["name"]), v)
+    ]
+
+
+def resume(source: str, target: str, throttle=None) -> int:
+    """
+    Completa ``<target>.part`` (o crea ``target``) copiando desde ``source``
+    sólo los volúmenes que falten o no coincidan con su SHA-256. Retorna los
+    bytes copiados.
+    """
+    manifest = load_manifest(source)
+    if manifest is None:
+        raise ValueError(f"Índice de volúmenes ilegible: {source}")
+    work = target + ".part"
+    os.makedirs(work, exist_ok=True)
+    copied = 0
+    for volume in manifest["volumes"]:
+        dest = os.path.join(work, volume["name"])
+        if _volume_ok(dest, volume):
+            continue
+        with open(os.path.join(source, volume["name"]), "rb") as src, \
+                streams.atomic_output(dest) as out:
+            with streams.ChunkedWriter(out, throttle=throttle) as writer:
+                shutil.copyfileobj(src, writer, streams.DEFAULT_CHUNK_SIZE)
+        if out.hexdigest() != volume["sha256"]:
+            os.remove(dest)
+            raise ValueError(f"La copia de {volume['name']} no coincide con {MANIFEST}")
+        copied += volume["size"]
+    # archivos auxiliares (p. ej. los metadatos de la cadena incremental)
+    skip = {MANIFEST} | {v["name"] for v in manifest["volumes"]}
+    files = {}
+    for fname in sorted(set(os.listdir(source)) - skip):
+        if os.path.isfile(os.path.join(source, fname)):
+            with open(os.path.join(source, fname), "rb") as fh:
+                files[fname] = fh.read()
+    _finish_directory(work, target, manifest, files)
+    return copied
+
+
+class VolumeReader:
+    """
+    Lectura secuencial de los volúmenes como un único flujo, verificando el
+    SHA-256 de cada uno al terminar de leerlo.
+    """
+
+    def __init__(self, path: str):
+        manifest = load_manifest(path)
+        if manifest is None:
+            raise ValueError(f"Índice de volúmenes ilegible: {path}")
+        self.path = path
+        self.name = manifest["name"]
+        self._volumes = list(manifest["volumes"])
+        self._fh: Optional[BinaryIO] = None
+        self._hash = None
+        self._expected: Optional[dict] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        out = []
+        while size < 0 or size > 0:
+            if self._fh is None and not self._next():
+                break
+            chunk = self._fh.read(streams.DEFAULT_CHUNK_SIZE if size < 0 else size)
+            if not chunk:
+                self._end_volume()
+                continue
+            self._hash.update(chunk)
+            out.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(out)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next(self) -> bool:
+        if not self._volumes:
+            return False
+        self._expected = self._volumes.pop(0)
+        self._fh = open(os.path.join(self.path, self._expected["name"]), "rb")
+        self._hash = hashlib.sha256()
+        return True
+
+    def _end_volume(self) -> None:
+        self._fh.close()
+        self._fh = None
+        if self._hash.hexdigest() != self._expected["sha256"]:
+            raise ValueError(f"El volumen {self._expected['name']} no coincide con {MANIFEST}")
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+bench_backup.py –  Benchmarks reproducibles de auto_backup_local
+• Corre fuera de línea contra un PostgreSQL local, con la configuración de
+  Odoo indicada (``-c odoo.conf``) y una base que tenga el módulo instalado.
+• Casos:
+    - backup:    ``execute_backup`` de punta a punta sobre una base sintética
+                 (tabla + filestore del tamaño pedido).
+    - cleanup:   ``reconcile_artifacts`` + ``cleanup_backups`` sobre 1k, 10k
+                 y 100k archivos fechados (vacíos) en un directorio temporal.
+    - schedule:  ``_next_run_after`` (cálculo de ``next_run_at``) y
+                 ``_should_execute_now`` sobre miles de configuraciones.
+• El resultado es un JSON (stdout o ``--output``) para comparar versiones:
+  tiempo de pared, caudal y pico de memoria de Python de cada caso.
+
+Ejemplo::
+
+    python benchmarks/bench_backup.py -c /etc/odoo/odoo.conf -d bench_host \\
+        --master-password admin --db-size 256M --filestore-size 512M \\
+        --output bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import odoo  # type: ignore
+from odoo import SUPERUSER_ID, api  # type: ignore
+from odoo.sql_db import db_connect  # type: ignore
+from odoo.tools import config  # type: ignore
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_ROW_BYTES = 128            # 4 × md5 en hexadecimal por fila
+_FILE_BYTES = 64 * 1024     # tamaño de cada adjunto sintético
+_SYNTHETIC_DB = "auto_backup_bench"
+_SPAN_DAYS = 730            # los archivos fechados cubren dos años
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+# ───────────────────────────────────────────────────────────────
+#  Medición
+# ───────────────────────────────────────────────────────────────
+def measure(fn, repeat: int, trace_memory: bool) -> dict:
+    """Ejecuta ``fn`` ``repeat`` veces; ``fn`` retorna los bytes procesados (o 0)."""
+    walls, peaks, processed = [], [], 0
+    for _i in range(repeat):
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        processed = fn() or 0
+        walls.append(time.perf_counter() - started)
+        if trace_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    best = min(walls)
+    out = {
+        "wall_seconds_min": round(best, 4),
+        "wall_seconds_median": round(statistics.median(walls), 4),
+        "runs": repeat,
+        "bytes": processed,
+        "throughput_mb_s": round(processed / 1024 ** 2 / best, 2) if processed and best else None,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if peaks:
+        out["python_peak_bytes"] = max(peaks)
+    return out
+
+
+# ───────────────────────────────────────────────────────────────
+#  Datos sintéticos
+# ───────────────────────────────────────────────────────────────
+def create_synthetic_db(name: str, db_size: int, filestore_size: int) -> None:
+    """Base con una tabla de ``db_size`` bytes aprox. y un filestore de ``filestore_size``."""
+    with db_connect("postgres").cursor() as cr:
+        cr._cnx.autocommit = True
+        cr.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        cr.execute(f'CREATE DATABASE "{name}" ENCODING \'unicode\' TEMPLATE template0')
+    with db_connect(name).cursor() as cr:
+        # lo mínimo que consulta dump_db_manifest
+        cr.execute("CREATE TABLE ir_module_module (name varchar, latest_version varchar, state varchar)")
+        cr.execute("INSERT INTO ir_module_module VALUES ('base', %s, 'installed')", (odoo.release.version,))
+        cr.execute("CREATE TABLE bench_data (id serial PRIMARY KEY, payload text)")
+        cr.execute(
+            "INSERT INTO bench_data (payload) "
+            "SELECT md5(random()::text) || md5(random()::text) || md5(g::text) || md5((g * 7)::text) "
+            "FROM generate_series(1, %s) g",
+            (max(db_size // _ROW_BYTES, 1),),
+        )
+        cr.commit()
+
+    filestore = config.filestore(name)
+    shutil.rmtree(filestore, ignore_errors=True)
+    rng = random.Random(42)
+    written = 0
+    while written < filestore_size:
+        digest = "%040x" % rng.getrandbits(160)
+        path = os.path.join(filestore, digest[:2], digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        half = _FILE_BYTES // 2
+        with open(path, "wb") as fh:
+            # mitad incompresible, mitad compresible: parecido a adjuntos reales
+            fh.write(rng.randbytes(half) + b"x" * half)
+        written += _FILE_BYTES
+
+
+def drop_synthetic_db(name: str) -> None:
+    with db_connect("postgres").cursor() as cr:
+        cr._cnx.autocommit = True
+        cr.execute(f'DROP DATABASE IF EXISTS "{name}"')
+    shutil.rmtree(config.filestore(name), ignore_errors=True)
+
+
+def create_dated_files(directory: str, count: int) -> None:
+    step = datetime.timedelta(days=_SPAN_DAYS) / count
+    now = datetime.datetime.now()
+    for i in range(count):
+        stamp = now - step * i
+        name = f"db_backup_bench_{stamp:%Y_%m_%d_%H%M%S}.zip"
+        open(os.path.join(directory, name), "wb").close()
+
+
+# ───────────────────────────────────────────────────────────────
+#  Casos
+# ───────────────────────────────────────────────────────────────
+def new_config(env, path: str, **vals):
+    Config = env["backup.config"]
+    return Config.create({
+        "name": "benchmark",
+        "backup_path": path,
+        "backup_enabled": True,
+        "cleanup_enabled": True,
+        **vals,
+    })
+
+
+def bench_backup(registry, args) -> dict:
+    db_size, fs_size = parse_size(args.db_size), parse_size(args.filestore_size)
+    create_synthetic_db(_SYNTHETIC_DB, db_size, fs_size)
+    target = tempfile.mkdtemp(prefix="bench_backup_")
+    try:
+        # se confirma la configuración: los hilos del pool usan sus propios cursores
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            rec = new_config(
+                env, target,
+                master_password_input=args.master_password,
+                database_scope="list",
+                database_filter=_SYNTHETIC_DB,
+                backup_format=args.format,
+                compression_codec=args.codec,
+            )
+            config_id = rec.id
+
+        def run():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                rec = env["backup.config"].browse(config_id)
+                rec.execute_backup()
+                log = env["backup.log"].search([
+                    ("config_id", "=", config_id), ("database", "=", _SYNTHETIC_DB),
+                ], limit=1)
+                if log.status != "success":
+                    raise RuntimeError(f"backup fallido: {log.message}")
+                return int(log.size_bytes)
+
+        result = measure(run, args.repeat, args.trace_memory)
+        result["params"] = {
+            "db_size": db_size, "filestore_size": fs_size,
+            "format": args.format, "codec": args.codec,
+        }
+        return result
+    finally:
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            env["backup.log"].search([("config_id.name", "=", "benchmark")]).unlink()
+            env["backup.config"].search([("name", "=", "benchmark")]).unlink()
+        shutil.rmtree(target, ignore_errors=True)
+        if not args.keep:
+            drop_synthetic_db(_SYNTHETIC_DB)
+
+
+def bench_cleanup(registry, args, count: int) -> dict:
+    target = tempfile.mkdtemp(prefix="bench_cleanup_")
+    try:
+        create_dated_files(target, count)
+        with registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            rec = new_config(env, target)
+            reconcile = measure(rec.reconcile_artifacts, 1, args.trace_memory)
+            cleanup = measure(rec.cleanup_backups, 1, args.trace_memory)
+            cleanup["files_left"] = len(os.listdir(target))
+            cr.rollback()
+        return {"params": {"files": count}, "reconcile": reconcile, "cleanup": cleanup}
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+
+
+def bench_schedule(registry, args) -> dict:
+    rng = random.Random(7)
+    now = datetime.datetime.now().replace(microsecond=0)
+    modes = ("daily", "weekly", "monthly", "hours", "interval", "cron")
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        # registros en memoria: se mide la decisión, no la escritura en la base
+        configs = [
+            env["backup.config"].new({
+                "name": f"bench {i}",
+                "backup_path": "/tmp",
+                "schedule_mode": mode,
+                "run_hours": "0,5,8,17,21" if mode == "hours" else False,
+                "interval_minutes": 30,
+                "cron_expression": "*/15 8-18 * * 1-5",
+                "schedule_tz": "America/Argentina/Buenos_Aires",
+                "jitter_minutes": 10,
+                "next_run_at": now + datetime.timedelta(minutes=rng.randrange(-60 * 24, 60 * 24)),
+            })
+            for i, mode in ((i, rng.choice(modes)) for i in range(args.configs))
+        ]
+
+        def decide():
+            for rec in configs:
+                rec._should_execute_now(now)
+
+        def next_run():
+            for rec in configs:
+                rec._next_run_after(now)
+
+        result = {
+            "should_execute_now": measure(decide, args.repeat, args.trace_memory),
+            "next_run_after": measure(next_run, args.repeat, args.trace_memory),
+        }
+        cr.rollback()
+    for case in result.values():
+        case["per_config_us"] = round(case["wall_seconds_min"] / args.configs * 1e6, 3)
+    result["params"] = {"configs": args.configs}
+    return result
+
+
+# ───────────────────────────────────────────────────────────────
+#  Punto de entrada
+# ───────────────────────────────────────────────────────────────
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--odoo-config", help="archivo de configuración de Odoo")
+    parser.add_argument("-d", "--database", required=True, help="base con auto_backup_local instalado")
+    parser.add_argument("--cases", default="backup,cleanup,schedule")
+    parser.add_argument("--master-password", default="admin")
+    parser.add_argument("--db-size", default="64M")
+    parser.add_argument("--filestore-size", default="128M")
+    parser.add_argument("--format", default="zip", choices=("zip", "directory"))
+    parser.add_argument("--codec", default="deflate")
+    parser.add_argument("--files", default="1000,10000,100000", help="tamaños del caso cleanup")
+    parser.add_argument("--configs", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="no medir el pico de memoria (tracemalloc agrega sobrecarga)")
+    parser.add_argument("--keep", action="store_true", help="conservar la base sintética")
+    parser.add_argument("--output", help="archivo JSON de salida (por defecto stdout)")
+    args = parser.parse_args(argv)
+
+    config.parse_config(["-c", args.odoo_config] if args.odoo_config else [])
+    registry = odoo.registry(args.database)
+    cases = {c.strip() for c in args.cases.split(",")}
+
+    with registry.cursor() as cr:
+        cr.execute("SHOW server_version")
+        pg_version = cr.fetchone()[0]
+        cr.execute("SELECT latest_version FROM ir_module_module WHERE name = 'auto_backup_local'")
+        module_version = (cr.fetchone() or [None])[0]
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "module_version": module_version,
+            "odoo_version": odoo.release.version,
+            "postgresql": pg_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {},
+    }
+    results = report["results"]
+    if "backup" in cases:
+        results["backup"] = bench_backup(registry, args)
+    if "cleanup" in cases:
+        results["cleanup"] = [
+            bench_cleanup(registry, args, int(n)) for n in args.files.split(",") if n.strip()
+        ]
+    if "schedule" in cases:
+        results["schedule"] = bench_schedule(registry, args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())